@@ -0,0 +1,66 @@
+"""History bucketing and aggregation over a large event list, pure Python vs NumPy.
+
+"python"/"numpy" time the whole `_HistoryAggregator` from event dicts;
+"kernel" times `reduce_buckets` on columns that are already arrays.
+
+Usage: python bench/bench_aggregate.py [--history-events 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from api import _HistoryAggregator  # noqa: E402
+from aggregate import np, reduce_buckets  # noqa: E402
+
+
+def _events(n: int) -> list[dict]:
+    rng = random.Random(1)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    step = 90 * 86400 / n
+    return [{"time": start + timedelta(seconds=int(i * step)), "value": round(rng.uniform(15, 30), 1)}
+            for i in range(n)]
+
+
+def _run(events: list[dict], granularity: str, aggregate: str, vectorized: bool) -> tuple[float, list[dict]]:
+    started = time.perf_counter()
+    agg = _HistoryAggregator(granularity, aggregate)
+    agg.vectorized = agg.vectorized and vectorized
+    agg.extend(events)
+    result = agg.result()
+    return time.perf_counter() - started, result
+
+
+def _kernel(times, values, granularity: str, aggregate: str) -> float:
+    """Time of the vectorized bucketing and reduction alone, on ready-made columns."""
+    started = time.perf_counter()
+    reduce_buckets(times, values, granularity, aggregate)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--history-events", type=int, default=1_000_000)
+    n = parser.parse_args().history_events
+    if np is None:
+        sys.exit("numpy is not installed")
+    events = _events(n)
+    times = np.array([int(e["time"].timestamp()) * 1_000_000 for e in events], dtype=np.int64)
+    values = np.array([e["value"] for e in events])
+    print(f"{n} events over 90 days")
+    print(f"{'granularity':<10} {'aggregate':<8} {'python ms':>10} {'numpy ms':>10} {'speedup':>8} {'kernel ms':>10}")
+    for granularity, aggregate in [("hourly", "avg"), ("hourly", "max"), ("daily", "median"),
+                                   ("5min", "p95"), ("hourly", "stddev"), ("daily", "last")]:
+        python_s, expected = _run(events, granularity, aggregate, vectorized=False)
+        numpy_s, result = _run(events, granularity, aggregate, vectorized=True)
+        assert result == expected
+        print(f"{granularity:<10} {aggregate:<8} {python_s * 1e3:>10.0f} {numpy_s * 1e3:>10.0f} "
+              f"{python_s / numpy_s:>7.1f}x {_kernel(times, values, granularity, aggregate) * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
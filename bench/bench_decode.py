@@ -0,0 +1,89 @@
+"""Parse throughput of history pages and device lists: pydantic models vs the fast decode path.
+
+Pages are built by repeating the recorded fixtures in test/fixtures.
+
+Usage: python bench/bench_decode.py [--history-pages 200] [--devices 300]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from api import LocationBase  # noqa: E402
+from decode import history_page, loads  # noqa: E402
+from st.device import DeviceResponse  # noqa: E402
+from st.history import EventHistoryResponse  # noqa: E402
+
+
+def _fixture(name: str) -> dict:
+    with open(os.path.join(ROOT, "test", "fixtures", name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _history_body(page_size: int) -> bytes:
+    page = _fixture("history_page.json")
+    items = page["items"]
+    page["items"] = [{**items[i % len(items)], "epoch": 1749940092827 - i * 1000, "hash": i}
+                     for i in range(page_size)]
+    return json.dumps(page).encode()
+
+
+def _devices_body(count: int) -> bytes:
+    data = _fixture("devices.json")
+    items = data["items"]
+    data["items"] = [{**items[i % len(items)], "deviceId": str(uuid.UUID(int=i))} for i in range(count)]
+    return json.dumps(data).encode()
+
+
+def _timed(fn, bodies: list[bytes]) -> float:
+    started = time.perf_counter()
+    for body in bodies:
+        fn(body)
+    return time.perf_counter() - started
+
+
+def _history_models(body: bytes):
+    return [LocationBase._event_dict(i) for i in EventHistoryResponse.model_validate(json.loads(body)).items]
+
+
+def _history_fast(body: bytes):
+    return [LocationBase._event_dict(i) for i in history_page(loads(body)).items]
+
+
+def _devices_models(body: bytes):
+    return LocationBase._short_devices(DeviceResponse.model_validate(json.loads(body)).items)
+
+
+def _devices_fast(body: bytes):
+    return LocationBase._short_devices_raw(loads(body)["items"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--history-pages", type=int, default=200)
+    parser.add_argument("--devices", type=int, default=300)
+    args = parser.parse_args()
+    pages, devices = args.history_pages, args.devices
+    history = [_history_body(500)] * pages
+    device_list = [_devices_body(devices)] * 20
+    assert _history_models(history[0]) == _history_fast(history[0])
+    assert _devices_models(device_list[0]) == _devices_fast(device_list[0])
+
+    print(f"{'payload':<22} {'models, items/s':>16} {'fast, items/s':>16} {'speedup':>8}")
+    for label, units, bodies, slow, fast in [
+        (f"history x{pages}", 500 * pages, history, _history_models, _history_fast),
+        (f"devices({devices}) x20", devices * 20, device_list, _devices_models, _devices_fast),
+    ]:
+        slow_s = _timed(slow, bodies)
+        fast_s = _timed(fast, bodies)
+        print(f"{label:<22} {units / slow_s:>16,.0f} {units / fast_s:>16,.0f} {slow_s / fast_s:>7.1f}x")
+    print(f"JSON parser: {loads.__module__}")
+
+
+if __name__ == "__main__":
+    main()
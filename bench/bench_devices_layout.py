@@ -0,0 +1,60 @@
+"""Serialized size and encode time of get_devices results: nested objects vs the table layout.
+
+Devices come from the mock API's generator, with status, so the mix of
+capabilities matches bench/mock_smartthings.py. "tool" sizes are what
+FastMCP puts on the wire for the result, "json" sizes are the same data as
+compact JSON for reference.
+
+Usage: python bench/bench_devices_layout.py [--devices 300] [--repeats 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mcp.server.fastmcp.utilities.func_metadata import _convert_to_content  # noqa: E402
+
+from api import LocationBase, table_json  # noqa: E402
+from mock_smartthings import MockSmartThings  # noqa: E402
+
+
+def _timed(fn, repeats: int) -> tuple[float, object]:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - started) / repeats, result
+
+
+def _tool_bytes(content) -> int:
+    return sum(len(block.text.encode()) for block in content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", type=int, default=300)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    count, repeats = args.devices, args.repeats
+    items = MockSmartThings(devices=count, history_events=0, device_page_size=count)._devices({"includeStatus": ["true"]})["items"]
+    devices = LocationBase._short_devices_raw(items)
+
+    nested_time, nested = _timed(lambda: _convert_to_content(devices), repeats)
+    table_time, table = _timed(lambda: _convert_to_content(table_json(LocationBase.devices_table(devices))), repeats)
+    nested_json = len(json.dumps(devices, default=str, separators=(",", ":")).encode())
+    table_json_size = len(json.dumps(LocationBase.devices_table(devices), default=str,
+                                     separators=(",", ":")).encode())
+
+    print(f"{count} devices, mean of {repeats} encodes")
+    print(f"{'layout':<8} {'tool bytes':>12} {'json bytes':>12} {'encode ms':>10}")
+    print(f"{'nested':<8} {_tool_bytes(nested):>12} {nested_json:>12} {nested_time * 1e3:>10.2f}")
+    print(f"{'table':<8} {_tool_bytes(table):>12} {table_json_size:>12} {table_time * 1e3:>10.2f}")
+    print(f"table is {_tool_bytes(table) / _tool_bytes(nested):.0%} of the nested tool result")
+
+
+if __name__ == "__main__":
+    main()
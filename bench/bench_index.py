@@ -0,0 +1,74 @@
+"""Filtered device queries answered from the catalog index vs a scan of the device list.
+
+Devices come from the mock API's generator (bench/mock_smartthings.py).
+
+Usage: python bench/bench_index.py [--devices 1000] [--repeats 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog import DeviceIndex  # noqa: E402
+from mock_smartthings import MockSmartThings  # noqa: E402
+from st.device import DeviceResponse  # noqa: E402
+
+
+def _scan(devices, capabilities, any_capability=False, room_id=None, category=None, connection_type=None):
+    matching = []
+    for device in devices:
+        if room_id is not None and device.room_id != room_id:
+            continue
+        if connection_type is not None and device.connection_type != connection_type:
+            continue
+        if category is not None and not any(c.name == category for component in device.components
+                                            for c in component.categories):
+            continue
+        if capabilities:
+            present = {c.id for component in device.components for c in component.capabilities}
+            if not (set(capabilities) & present if any_capability else set(capabilities) <= present):
+                continue
+        matching.append(device)
+    return matching
+
+
+def _timed(fn, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - started) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+    count, repeats = args.devices, args.repeats
+    mock = MockSmartThings(devices=count, history_events=0, device_page_size=count)
+    devices = DeviceResponse.model_validate(mock._devices({})).items
+    room_id = next(iter(mock.rooms))
+
+    started = time.perf_counter()
+    index = DeviceIndex(devices)
+    print(f"{count} devices, index built in {(time.perf_counter() - started) * 1e3:.1f} ms")
+    print(f"{'query':<32} {'matches':>8} {'index us':>10} {'scan us':>10}")
+    queries = {
+        "capability switch": ((["switch"],), {}),
+        "switch or powerMeter": ((["switch", "powerMeter"], True), {}),
+        "room + switch": ((["switch"],), {"room_id": room_id}),
+        "category Thermostat, ZWAVE": (([],), {"category": "Thermostat", "connection_type": "ZWAVE"}),
+    }
+    for name, (args, kwargs) in queries.items():
+        matches = index.select(*args, **kwargs)
+        assert matches == _scan(devices, *args, **kwargs)
+        print(f"{name:<32} {len(matches):>8} {_timed(lambda: index.select(*args, **kwargs), repeats) * 1e6:>10.1f} "
+              f"{_timed(lambda: _scan(devices, *args, **kwargs), repeats) * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
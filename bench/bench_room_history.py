@@ -0,0 +1,102 @@
+"""Room history fan-out against a mocked slow history backend.
+
+Usage: python bench/bench_room_history.py [--devices 15] [--latency-ms 100]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from api import Location  # noqa: E402
+from async_api import AsyncLocation  # noqa: E402
+
+ROOM_ID = uuid.UUID("00000000-0000-0000-0000-000000000001")
+
+
+def _page(device_id) -> dict:
+    return {"items": [{
+        "deviceId": str(device_id), "deviceName": "Sensor", "locationId": str(uuid.UUID(int=2)),
+        "locationName": "Home", "time": f"2025-01-01T12:{i:02d}:00.000+00:00", "text": "",
+        "component": "main", "componentLabel": "main", "capability": "temperatureMeasurement",
+        "attribute": "temperature", "value": 20 + i, "unit": "C", "epoch": 1735732800000 + i * 60000,
+        "hash": i} for i in range(50)]}
+
+
+class SlowSession:
+    base_url = "https://api.smartthings.com/"
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def get_json(self, url):
+        time.sleep(self.latency)
+        return _page(url.rsplit("deviceId=", 1)[1])
+
+
+def _sync_location(devices: list[dict], latency: float) -> Location:
+    loc = object.__new__(Location)
+    loc.location_id = "loc1"
+    loc.rooms = {ROOM_ID: "Room"}
+    loc.session = SlowSession(latency)  # type: ignore
+    loc.get_devices_short = lambda **kwargs: devices  # type: ignore
+    return loc
+
+
+def _async_location(devices: list[dict], latency: float) -> AsyncLocation:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        return httpx.Response(200, json=_page(request.url.params["deviceId"]))
+
+    loc = AsyncLocation("token", location_id="loc1", transport=httpx.MockTransport(handler))  # type: ignore
+    loc.location_id = "loc1"
+    loc._ready = True
+
+    async def devices_short(**kwargs):
+        return devices
+
+    loc.get_devices_short = devices_short  # type: ignore
+    return loc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", type=int, default=15)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    args = parser.parse_args()
+    n_devices, latency = args.devices, args.latency_ms / 1000
+    devices = [{"deviceId": uuid.UUID(int=100 + i)} for i in range(n_devices)]
+    print(f"{n_devices} devices, {latency * 1000:.0f} ms per history request")
+
+    baseline = None
+    for concurrency in (1, 4, 8, 16):
+        loc = _sync_location(devices, latency)
+        start = time.perf_counter()
+        events = loc.room_history(ROOM_ID, concurrency=concurrency)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or events
+        assert events == baseline
+        print(f"sync  concurrency={concurrency:<3} {elapsed * 1000:8.1f} ms  {len(events)} events")
+
+    for concurrency in (1, 4, 8, 16):
+        aloc = _async_location(devices, latency)
+
+        async def run():
+            start = time.perf_counter()
+            events = await aloc.room_history(ROOM_ID, concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+            await aloc.aclose()
+            return events, elapsed
+
+        events, elapsed = asyncio.run(run())
+        assert events == baseline
+        print(f"async concurrency={concurrency:<3} {elapsed * 1000:8.1f} ms  {len(events)} events")
+
+
+if __name__ == "__main__":
+    main()
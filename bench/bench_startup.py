@@ -0,0 +1,54 @@
+"""Time from spawning the stdio server to the first `list_tools` answer.
+
+Each run starts `src/server.py` as an MCP client would, performs the
+initialize handshake and lists the tools. The warm-up of location, rooms and
+devices runs in the background and is not waited for, so no SmartThings
+token is needed; its failure is only logged by the server.
+
+Usage: python bench/bench_startup.py [--runs 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+async def _first_list_tools() -> tuple[float, float, int]:
+    """Seconds to the initialize result and to the first list_tools result, and the tool count."""
+    params = StdioServerParameters(
+        command=sys.executable, args=[os.path.join(ROOT, "src", "server.py")], cwd=os.path.join(ROOT, "src"),
+        env={**os.environ, "TOKEN": os.environ.get("TOKEN", "token"), "HISTORY_DB": "", "WARM_START": "",
+             "MCP_TRANSPORT": "stdio"})
+    started = time.perf_counter()
+    with open(os.devnull, "w") as errlog:
+        async with stdio_client(params, errlog=errlog) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                initialized = time.perf_counter() - started
+                tools = await session.list_tools()
+                listed = time.perf_counter() - started
+    return initialized, listed, len(tools.tools)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    runs = parser.parse_args().runs
+    results = [asyncio.run(_first_list_tools()) for _ in range(runs)]
+    initialized = [r[0] * 1e3 for r in results]
+    listed = [r[1] * 1e3 for r in results]
+    print(f"{runs} runs, {results[0][2]} tools")
+    print(f"{'':<16} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    for label, samples in [("initialize", initialized), ("first list_tools", listed)]:
+        print(f"{label:<16} {statistics.median(samples):>10.0f} {min(samples):>10.0f} {max(samples):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Latency and throughput of the MCP tools and the main Location methods against the mock API.
+
+Starts bench/mock_smartthings.py in-process, then calls every case
+`iterations` times with `concurrency` calls in flight and prints p50/p99
+latency and calls per second. "sync" cases use `api.Location` from a thread
+pool, "async" cases `async_api.AsyncLocation`, and "tool" cases go through
+FastMCP's `call_tool`, so they include argument validation and result
+serialization as a client would see them.
+
+Usage: python bench/bench_suite.py [--devices 500] [--history-events 1000000] [--latency-ms 20]
+                                   [--jitter-ms 10] [--error-rate 0.01] [--only tool]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import uuid
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_smartthings import LOCATION_ID, MockSmartThings  # noqa: E402
+from scheduler import DEFAULT_LIMITS, RequestScheduler  # noqa: E402
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _report(group: str, name: str, latencies: list[float], elapsed: float, errors: int) -> None:
+    ordered = sorted(latencies)
+    print(f"{group:<6} {name:<34} {len(latencies):>6} {_percentile(ordered, 0.5) * 1e3:>9.1f} "
+          f"{_percentile(ordered, 0.99) * 1e3:>9.1f} {len(latencies) / elapsed:>9.1f} {errors:>6}")
+
+
+def _run_sync(group: str, name: str, call: Callable[[int], object], iterations: int, concurrency: int) -> None:
+    errors = 0
+
+    def timed(i: int) -> float:
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            call(i)
+        except Exception:
+            errors += 1
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, range(iterations)))
+    _report(group, name, latencies, time.perf_counter() - started, errors)
+
+
+async def _run_async(group: str, name: str, call: Callable[[int], Awaitable[object]], iterations: int,
+                     concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def timed(i: int) -> float:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await call(i)
+            except Exception:
+                errors += 1
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(i) for i in range(iterations)))
+    _report(group, name, list(latencies), time.perf_counter() - started, errors)
+
+
+def _cases(room_id: str) -> list[tuple[str, str, dict]]:
+    """(name, Location method, arguments) of every case.
+
+    `{sensor}` and `{switch}` are replaced by a temperature sensor and a switch,
+    a different one on each call.
+    """
+    return [
+        ("get_rooms", "get_rooms", {}),
+        ("get_devices", "get_devices_short", {}),
+        ("get_devices room", "get_devices_short", {"room_id": room_id}),
+        ("get_device_status", "device_status", {"device_id": "{sensor}"}),
+        ("get_status_snapshot room", "status_snapshot", {"room_id": room_id}),
+        ("execute_commands", "device_commands", {"device_id": "{switch}", "commands": "switch.on"}),
+        ("event_history page", "event_history", {"device_id": "{sensor}", "limit": 200}),
+        ("history 7d hourly avg", "history", {"device_id": "{sensor}", "attribute": "temperature",
+                                              "delta_start": "P7D", "granularity": "hourly",
+                                              "aggregate": "avg"}),
+        ("history room 1d raw", "history", {"room_id": room_id, "attribute": "temperature",
+                                            "delta_start": "P1D", "max_events": 500}),
+    ]
+
+
+TOOLS = {"get_rooms": "get_rooms", "get_devices_short": "get_devices", "device_status": "get_device_status",
+         "status_snapshot": "get_status_snapshot",
+         "device_commands": "execute_commands", "history": "get_device_history"}
+
+
+def _arguments(args: dict, devices: dict[str, list[str]], i: int, as_tool: bool) -> dict:
+    """Arguments of call `i`: JSON-like for a tool, typed for a Location method."""
+    from api import Command
+
+    resolved = {}
+    for key, value in args.items():
+        if value in ("{sensor}", "{switch}"):
+            candidates = devices[value.strip("{}")]
+            value = candidates[i % len(candidates)]
+        if key == "commands":
+            capability, command = value.split(".")
+            value = [{"component": "main", "capability": capability, "command": command}]
+            if not as_tool:
+                value = [Command.model_validate(c) for c in value]
+        elif key in ("device_id", "room_id") and not as_tool:
+            value = uuid.UUID(value)
+        resolved[key] = value
+    return resolved
+
+
+def _scheduler(unpaced: bool) -> RequestScheduler:
+    """The default client-side rate limits, or limits high enough to never delay a request."""
+    if unpaced:
+        return RequestScheduler(limits={family: (1e6, 1_000_000) for family in DEFAULT_LIMITS})
+    return RequestScheduler()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--history-events", type=int, default=200_000)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", choices=["sync", "async", "tool"], action="append")
+    parser.add_argument("--unpaced", action="store_true",
+                        help="disable the client-side rate limits, to measure the server's own overhead")
+    args = parser.parse_args()
+    groups = args.only or ["sync", "async", "tool"]
+
+    with MockSmartThings(devices=args.devices, rooms=args.rooms, history_events=args.history_events,
+                         latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate) as mock:
+        devices = {"sensor": [d["deviceId"] for d in mock.devices if d["name"] == "Thermostat"],
+                   "switch": [d["deviceId"] for d in mock.devices if d["name"] == "Light"]}
+        room_id = str(next(iter(mock.rooms)))
+        cases = _cases(room_id)
+        print(f"mock API: {args.devices} devices, {args.history_events} history events, "
+              f"{args.latency_ms:.0f}+{args.jitter_ms:.0f} ms latency, {args.error_rate:.1%} errors; "
+              f"{args.iterations} calls x {args.concurrency} in flight")
+        print(f"{'group':<6} {'case':<34} {'calls':>6} {'p50 ms':>9} {'p99 ms':>9} {'calls/s':>9} {'errors':>6}")
+
+        if "sync" in groups:
+            from api import Location
+
+            loc = Location("token", location_id=LOCATION_ID, base_url=mock.url)
+            loc.session.scheduler = _scheduler(args.unpaced)
+            loc.ready()
+            for name, method, case_args in cases:
+                if method == "get_rooms":  # a catalog-backed attribute on the sync client
+                    _run_sync("sync", name, lambda i: loc.rooms, args.iterations, args.concurrency)
+                    continue
+                _run_sync("sync", name, lambda i: getattr(loc, method)(**_arguments(case_args, devices, i, False)),
+                          args.iterations, args.concurrency)
+
+        async def run_async():
+            from async_api import AsyncLocation
+
+            loc = AsyncLocation("token", location_id=LOCATION_ID, base_url=mock.url,
+                                scheduler=_scheduler(args.unpaced))
+            await loc.ready()
+            for name, method, case_args in cases:
+                await _run_async("async", name, lambda i: getattr(loc, method)(
+                    **_arguments(case_args, devices, i, False)), args.iterations, args.concurrency)
+            await loc.aclose()
+
+        async def run_tools():
+            os.environ.update({"TOKEN": "token", "SMARTTHINGS_API_URL": mock.url, "HISTORY_DB": "",
+                               "WARM_START": ""})
+            import server
+
+            logging.getLogger().setLevel(logging.WARNING)  # server.py logs every request at INFO
+            server.location.session.scheduler = _scheduler(args.unpaced)
+
+            for name, method, case_args in cases:
+                if method not in TOOLS:
+                    continue
+                await _run_async("tool", name, lambda i: server.mcp.call_tool(
+                    TOOLS[method], _arguments(case_args, devices, i, True)), args.iterations, args.concurrency)
+            await server.location.aclose()
+
+        if "async" in groups:
+            asyncio.run(run_async())
+        if "tool" in groups:
+            asyncio.run(run_tools())
+        print(f"mock API served {mock.requests} requests, {mock.errors} injected errors")
+
+
+if __name__ == "__main__":
+    main()
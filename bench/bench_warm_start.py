@@ -0,0 +1,63 @@
+"""First `get_rooms` and `get_devices` answers of a fresh AsyncLocation, with and without a warm-start file.
+
+Every run builds a new `AsyncLocation`, as a restarted server would, against
+the mock API and times its first calls. "cold" runs have no snapshot file;
+"warm" runs load the one the first run saved.
+
+Usage: python bench/bench_warm_start.py [--devices 300] [--latency-ms 80] [--runs 5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from async_api import AsyncLocation  # noqa: E402
+from mock_smartthings import MockSmartThings  # noqa: E402
+from warm_start import WarmStartCache  # noqa: E402
+
+
+async def _first_answers(url: str, warm_start: WarmStartCache | None) -> tuple[float, float, int]:
+    """Milliseconds to the first get_rooms and get_devices(include_status=False) results, and the device count."""
+    loc = AsyncLocation("token", base_url=url, warm_start=warm_start)
+    started = time.perf_counter()
+    await loc.get_rooms()
+    rooms = time.perf_counter() - started
+    devices = await loc.get_devices(include_status=False)
+    listed = time.perf_counter() - started
+    if loc._verify_task is not None:
+        await loc._verify_task
+    await loc.aclose()
+    return rooms * 1e3, listed * 1e3, len(devices)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with MockSmartThings(devices=args.devices, history_events=0, latency_ms=args.latency_ms) as mock, \
+            tempfile.TemporaryDirectory() as tmp:
+        cache = WarmStartCache(os.path.join(tmp, "warm_start.json"), key="bench")
+        print(f"mock API: {args.devices} devices, {args.latency_ms:.0f} ms latency, {args.runs} runs")
+        print(f"{'':<6} {'get_rooms ms':>13} {'get_devices ms':>15}")
+        for label, warm_start in [("cold", None), ("warm", cache)]:
+            results = [asyncio.run(_first_answers(mock.url, warm_start)) for _ in range(args.runs)]
+            if label == "cold":
+                asyncio.run(_first_answers(mock.url, cache))  # writes the snapshot the warm runs load
+            print(f"{label:<6} {statistics.median(r[0] for r in results):>13.1f} "
+                  f"{statistics.median(r[1] for r in results):>15.1f}")
+        print(f"snapshot: {os.path.getsize(cache.path) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""Local mock of the SmartThings REST API for benchmarks.
+
+Serves locations, rooms, paged devices (with status), device status, commands
+and paged device history over HTTP/1.1 keep-alive. Every response can be delayed
+by a fixed latency plus random jitter, and a share of them can fail with a
+configurable status code.
+
+History is generated on demand, nothing is stored: the location has one
+stream of `history_events` events, one every `history_days / history_events`,
+ending when the server starts, dealt to the devices in turn. So a million
+events cost nothing until a page of them is requested.
+
+Run standalone and point the MCP server at it with SMARTTHINGS_API_URL:
+
+    python bench/mock_smartthings.py --devices 500 --history-events 1000000 --latency-ms 50
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+LOCATION_ID = uuid.UUID(int=1)
+STATUS_TIMESTAMP = "2025-01-01T00:00:00.000Z"
+
+# Device kinds dealt in turn: capabilities with their status, and the attribute their history reports.
+KINDS = [
+    {"name": "Light", "type": "ZIGBEE", "history": ("switch", "switch", None),
+     "capabilities": {"switch": {"switch": ("off", None)}, "switchLevel": {"level": (80, "%")},
+                      "refresh": {}, "healthCheck": {"DeviceWatch-DeviceStatus": ("online", None)}}},
+    {"name": "Thermostat", "type": "ZWAVE", "history": ("temperatureMeasurement", "temperature", "C"),
+     "capabilities": {"temperatureMeasurement": {"temperature": (21.5, "C")},
+                      "relativeHumidityMeasurement": {"humidity": (45, "%")}, "battery": {"battery": (90, "%")}}},
+    {"name": "SmartPlug", "type": "LAN", "history": ("powerMeter", "power", "W"),
+     "capabilities": {"switch": {"switch": ("on", None)}, "powerMeter": {"power": (120.0, "W")},
+                      "energyMeter": {"energy": (1523.4, "kWh")}}},
+]
+
+
+class MockSmartThings:
+    """The mock API, served from a background thread while used as a context manager."""
+
+    def __init__(self, devices: int = 50, rooms: int = 10, history_events: int = 100_000,
+                 history_days: float = 30.0, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503, host: str = "127.0.0.1", port: int = 0,
+                 seed: int = 1, device_page_size: int = 200):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.device_page_size = device_page_size
+        self.host, self.port = host, port
+        self.requests = 0
+        self.errors = 0
+        # Connections accepted, and the most that were open at once.
+        self.connections = 0
+        self.peak_connections = 0
+        # Requests served per "METHOD /path".
+        self.endpoints: Counter[str] = Counter()
+        self._random = random.Random(seed)
+        self.rooms = {uuid.UUID(int=0x100 + i): f"Room {i + 1}" for i in range(rooms)}
+        room_ids = list(self.rooms)
+        self.devices = [self._device(i, room_ids[i % len(room_ids)]) for i in range(devices)]
+        self._index = {d["deviceId"]: i for i, d in enumerate(self.devices)}
+        self.history_events = history_events
+        self.step_ms = max(1, int(history_days * 86_400_000 / max(history_events, 1)))
+        self.now_ms = int(time.time() * 1000)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/"
+
+    @staticmethod
+    def _device(i: int, room_id: uuid.UUID) -> dict:
+        kind = KINDS[i % len(KINDS)]
+        return {
+            "deviceId": str(uuid.UUID(int=0x10000 + i)),
+            "name": kind["name"],
+            "label": f"{kind['name']} {i + 1}",
+            "manufacturerName": "SmartThings",
+            "presentationId": "mock",
+            "roomId": str(room_id),
+            "locationId": str(LOCATION_ID),
+            "components": [{
+                "id": "main", "label": "main",
+                "capabilities": [{"id": capability, "version": 1} for capability in kind["capabilities"]],
+                "categories": [{"name": kind["name"], "categoryType": "manufacturer"}],
+            }],
+            "createTime": "2025-01-01T00:00:00.000Z",
+            "profile": {"id": str(uuid.UUID(int=0x200 + i % len(KINDS)))},
+            "type": kind["type"],
+            "restrictionTier": 0,
+            "allowed": [],
+            "executionContext": "LOCAL",
+            "relationships": [],
+            "_state": {capability: {attribute: {"value": value, "unit": unit, "timestamp": STATUS_TIMESTAMP}
+                                    for attribute, (value, unit) in attributes.items()}
+                       for capability, attributes in kind["capabilities"].items()},
+        }
+
+    # -- API ----------------------------------------------------------------
+
+    def _devices(self, query: dict) -> dict:
+        wanted = set(query.get("capability", []))
+        match = any if query.get("capabilitiesMode") == ["or"] else all
+        include_status = query.get("includeStatus") == ["true"]
+        items = []
+        for device in self.devices:
+            state = device["_state"]
+            if wanted and not match(c in state for c in wanted):
+                continue
+            if "roomId" in query and query["roomId"] != [device["roomId"]]:
+                continue
+            if "type" in query and query["type"] != [device["type"]]:
+                continue
+            if "category" in query and query["category"] != [device["components"][0]["categories"][0]["name"]]:
+                continue
+            item = {k: v for k, v in device.items() if k != "_state"}
+            if include_status:
+                component = dict(item["components"][0])
+                component["capabilities"] = [{**c, "status": state[c["id"]]} for c in component["capabilities"]]
+                item["components"] = [component]
+            items.append(item)
+        start = int(query.get("page", ["0"])[0]) * self.device_page_size
+        links = {}
+        if start + self.device_page_size < len(items):
+            next_query = {**query, "page": [str(start // self.device_page_size + 1)]}
+            links["next"] = {"href": f"{self.url}devices?{urlencode(next_query, doseq=True)}"}
+        return {"items": items[start:start + self.device_page_size], "_links": links}
+
+    def _status(self, device: dict) -> dict:
+        return {"components": {"main": device["_state"]}}
+
+    def _commands(self, device: dict, body: dict) -> dict:
+        results = []
+        for command in body.get("commands", []):
+            if command.get("capability") == "switch" and "switch" in device["_state"] \
+                    and command.get("command") in ("on", "off"):
+                device["_state"]["switch"]["switch"]["value"] = command["command"]
+            results.append({"id": str(uuid.uuid4()), "status": "ACCEPTED"})
+        return {"results": results}
+
+    def _event(self, g: int) -> dict:
+        """Event `g` of the location stream, 0 being the newest."""
+        device = self.devices[g % len(self.devices)]
+        capability, attribute, unit = KINDS[(g % len(self.devices)) % len(KINDS)]["history"]
+        if attribute == "switch":
+            value = "on" if (g // len(self.devices)) % 2 else "off"
+        elif attribute == "temperature":
+            value = round(21 + 3 * math.sin(g / 5000) + (g * 7919 % 100) / 100, 1)
+        else:
+            value = round(100 + 80 * math.sin(g / 3000) + (g * 104729 % 1000) / 100, 2)
+        epoch = self.now_ms - g * self.step_ms
+        return {
+            "deviceId": device["deviceId"], "deviceName": device["name"], "locationId": str(LOCATION_ID),
+            "locationName": "Home",
+            "time": datetime.fromtimestamp(epoch / 1000, timezone.utc).isoformat(timespec="milliseconds"),
+            "text": "", "component": "main", "componentLabel": "main", "capability": capability,
+            "attribute": attribute, "value": value, "unit": unit, "data": {},
+            "translatedAttributeName": attribute, "translatedAttributeValue": str(value),
+            "epoch": epoch, "hash": g,
+        }
+
+    def _history(self, path: str, query: dict) -> dict:
+        """A page of history, newest first unless `oldestFirst`, bounded by the paging epochs."""
+        limit = int(query.get("limit", ["500"])[0])
+        before = int(query["pagingBeforeEpoch"][0]) if "pagingBeforeEpoch" in query else None
+        after = int(query["pagingAfterEpoch"][0]) if "pagingAfterEpoch" in query else None
+        oldest_first = query.get("oldestFirst") == ["true"]
+        stride, offset = 1, 0
+        if "deviceId" in query:
+            stride, offset = len(self.devices), self._index[query["deviceId"][0]]
+        # events of this stream are g = offset + k * stride, k = 0, 1, ...; epoch falls with k
+        count = max(0, (self.history_events - offset + stride - 1) // stride)
+        span = self.step_ms * stride
+        first = 0 if before is None else max(0, (self.now_ms - offset * self.step_ms - before) // span + 1)
+        end = count if after is None else min(count, -(-(self.now_ms - offset * self.step_ms - after) // span))
+        end = max(first, end)
+        if oldest_first:
+            ks = range(end - 1, max(first, end - limit) - 1, -1)
+            more = end - limit > first
+        else:
+            ks = range(first, min(end, first + limit))
+            more = first + limit < end
+        items = [self._event(offset + k * stride) for k in ks]
+        links = {}
+        if more and items:
+            next_query = {k: v[0] for k, v in query.items()}
+            next_query["pagingAfterEpoch" if oldest_first else "pagingBeforeEpoch"] = str(items[-1]["epoch"])
+            next_query["pagingAfterHash" if oldest_first else "pagingBeforeHash"] = str(items[-1]["hash"])
+            links["next"] = {"href": f"{self.url}{path.lstrip('/')}?" + "&".join(f"{k}={v}" for k, v in next_query.items())}
+        return {"items": items, "_links": links}
+
+    def route(self, method: str, target: str, body: bytes) -> tuple[int, dict]:
+        url = urlsplit(target)
+        path, query = url.path, parse_qs(url.query)
+        location = f"/v1/locations/{LOCATION_ID}"
+        if method == "GET" and path == "/v1/locations":
+            return 200, {"items": [{"locationId": str(LOCATION_ID), "name": "Home"}]}
+        if method == "GET" and path == location:
+            return 200, {"locationId": str(LOCATION_ID), "name": "Home", "timeZoneId": "UTC"}
+        if method == "GET" and path == f"{location}/rooms":
+            return 200, {"items": [{"roomId": str(r), "name": n, "locationId": str(LOCATION_ID)}
+                                   for r, n in self.rooms.items()]}
+        if method == "GET" and path == "/devices":
+            return 200, self._devices(query)
+        if method == "GET" and path == "/v1/history/devices":
+            return 200, self._history(path, query)
+        parts = path.strip("/").split("/")
+        if len(parts) == 4 and parts[:2] == ["v1", "devices"] and parts[2] in self._index:
+            device = self.devices[self._index[parts[2]]]
+            if method == "GET" and parts[3] == "status":
+                return 200, self._status(device)
+            if method == "POST" and parts[3] == "commands":
+                return 200, self._commands(device, json.loads(body or b"{}"))
+        return 404, {"error": {"code": "NotFound", "message": f"{method} {path}"}}
+
+    # -- HTTP ---------------------------------------------------------------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        self.connections += 1
+        self.peak_connections = max(self.peak_connections, len(self._writers))
+        try:
+            while request_line := await reader.readline():
+                method, target, _ = request_line.decode().split(" ", 2)
+                length, close = 0, False
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    name = name.strip().lower()
+                    if name == "content-length":
+                        length = int(value)
+                    elif name == "connection" and value.strip().lower() == "close":
+                        close = True
+                body = await reader.readexactly(length) if length else b""
+
+                self.requests += 1
+                self.endpoints[f"{method} {urlsplit(target).path}"] += 1
+                delay = self.latency + self._random.uniform(0, self.jitter)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self.error_rate and self._random.random() < self.error_rate:
+                    self.errors += 1
+                    status, payload = self.error_status, {"error": {"code": "MockError", "message": "injected"}}
+                else:
+                    status, payload = self.route(method, target, body)
+                data = json.dumps(payload).encode()
+                headers = f"HTTP/1.1 {status} MOCK\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                if status == 429:
+                    headers += "Retry-After: 0\r\n"
+                writer.write(headers.encode() + b"\r\n" + data)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def serve(self, started: threading.Event | None = None) -> None:
+        """Serve until :meth:`__exit__` (or, standalone, until interrupted)."""
+        self._stop = asyncio.Event()
+        server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        self.port = server.sockets[0].getsockname()[1]
+        if started is not None:
+            started.set()
+        await self._stop.wait()
+        server.close()
+        for writer in self._writers:
+            writer.close()
+        await server.wait_closed()
+
+    def __enter__(self) -> "MockSmartThings":
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self.serve(started),),
+                                        name="mock-smartthings", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def __exit__(self, *exc):
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join()
+        self._loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--history-events", type=int, default=100_000)
+    parser.add_argument("--history-days", type=float, default=30.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--device-page-size", type=int, default=200)
+    args = parser.parse_args()
+    mock = MockSmartThings(args.devices, args.rooms, args.history_events, args.history_days, args.latency_ms,
+                           args.jitter_ms, args.error_rate, args.error_status, port=args.port,
+                           device_page_size=args.device_page_size)
+    print(f"Mock SmartThings API on {mock.url} ({args.devices} devices, {args.history_events} history events)")
+    try:
+        asyncio.run(mock.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
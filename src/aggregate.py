@@ -0,0 +1,185 @@
+import importlib
+import math
+from datetime import datetime, timedelta
+from importlib.util import find_spec
+from itertools import accumulate
+from typing import Any, List, Sequence, Tuple
+
+from st.literals import Aggregate, Granularity
+
+
+class _DeferredModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Any = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        value = getattr(self._module, attr)
+        setattr(self, attr, value)  # later lookups skip __getattr__
+        return value
+
+
+# Optional: history falls back to the pure-Python reducers without NumPy. Its
+# import is deferred to the first aggregation, it costs ~80 ms at server start.
+np: _DeferredModule | None = _DeferredModule("numpy") if find_spec("numpy") is not None else None
+
+# Event times are reduced as naive wall-clock microseconds since this epoch.
+LOCAL_EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# Bucket width of each granularity in microseconds; "realtime" buckets by exact time.
+BUCKET_US = {
+    "realtime": None,
+    "5min": 5 * 60 * 1_000_000,
+    "hourly": 60 * 60 * 1_000_000,
+    "daily": 24 * 60 * 60 * 1_000_000,
+}
+
+PERCENTILES = {"median": 0.5, "p95": 0.95}
+
+
+def percentile(ordered: Sequence[float], q: float) -> float:
+    """Linearly interpolated percentile of already sorted values (NumPy's default method)."""
+    h = (len(ordered) - 1) * q
+    lo = int(h)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (h - lo) * (ordered[hi] - ordered[lo])
+
+
+def stddev(values: Sequence[float]) -> float:
+    """Population standard deviation; both sums are exactly rounded by :func:`math.fsum`."""
+    mean = math.fsum(values) / len(values)
+    return math.sqrt(math.fsum([(v - mean) * (v - mean) for v in values]) / len(values))
+
+
+def reduce_buckets(times_us: Sequence[int], values: Sequence[float], granularity: Granularity,
+                   aggregate: Aggregate) -> Tuple[List[int], List[float]]:
+    """Bucket and reduce columns of event times and values with NumPy.
+
+    `times_us` are wall-clock microseconds since the epoch, so a bucket is a
+    plain integer floor. Returns the sorted bucket keys and one value per key;
+    for ``raw`` a key is repeated for every value, in input order. The
+    arithmetic follows the pure-Python reducers step for step, so both paths
+    return identical floats.
+    """
+    if np is None:
+        raise RuntimeError("reduce_buckets needs NumPy")
+    times = np.asarray(times_us, dtype=np.int64)
+    vals = np.asarray(values, dtype=np.float64)
+    if times.size == 0:
+        return [], []
+
+    width = BUCKET_US[granularity]
+    buckets = times if width is None else times - times % width
+    keys, inverse = np.unique(buckets, return_inverse=True)
+
+    if aggregate == "raw":
+        order = np.argsort(inverse, kind="stable")
+        return buckets[order].tolist(), vals[order].tolist()
+
+    counts = np.bincount(inverse, minlength=keys.size)
+    if aggregate == "count":
+        out = counts.astype(np.float64)
+    else:
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        if aggregate in ("sum", "avg", "stddev"):
+            # math.fsum per bucket, as in the pure-Python reducers; bincount's running sums lose digits
+            buckets_of_values = np.split(vals[np.argsort(inverse, kind="stable")], starts[1:])
+            if aggregate == "stddev":
+                out = np.array([stddev(bucket.tolist()) for bucket in buckets_of_values])
+            else:
+                out = np.array([math.fsum(bucket.tolist()) for bucket in buckets_of_values])
+                if aggregate == "avg":
+                    out = out / counts
+        elif aggregate in ("min", "max"):
+            grouped = vals[np.argsort(inverse, kind="stable")]
+            out = (np.minimum if aggregate == "min" else np.maximum).reduceat(grouped, starts)
+        elif aggregate in ("first", "last"):
+            grouped = vals[np.lexsort((times, inverse))]
+            out = grouped[starts if aggregate == "first" else starts + counts - 1]
+        elif aggregate in PERCENTILES:
+            grouped = vals[np.lexsort((vals, inverse))]
+            h = (counts - 1) * PERCENTILES[aggregate]
+            lo = h.astype(np.int64)
+            hi = np.minimum(lo + 1, counts - 1)
+            out = grouped[starts + lo] + (h - lo) * (grouped[starts + hi] - grouped[starts + lo])
+        else:
+            raise ValueError(f"Unknown aggregation: {aggregate}")
+
+    return keys.tolist(), out.tolist()
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], max_points: int) -> List[int]:
+    """Indices of at most `max_points` points picked by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The points between are split
+    into ``max_points - 2`` buckets. From each bucket the point kept is the one
+    forming the largest triangle with the previously kept point and the next
+    bucket's average. Spikes survive because they span the largest triangles.
+    `xs` must be sorted. Runs in one pass over the points.
+    """
+    size = len(xs)
+    if size <= max_points:
+        return list(range(size))
+    if max_points <= 2:
+        return [0, size - 1][:max(max_points, 0)]
+
+    buckets = max_points - 2
+    every = (size - 2) / buckets
+    if np is not None:
+        return _lttb_numpy(np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64), buckets, every)
+
+    # Bucket i is [bounds[i], bounds[i + 1]); the last point forms a bucket of its own.
+    bounds = [int(k * every) + 1 for k in range(buckets + 1)]
+    bounds[-1] = size - 1
+    bounds.append(size)
+    x0 = xs[0]
+    cx = [0.0, *accumulate(float(x) - x0 for x in xs)]
+    cy = [0.0, *accumulate(float(y) for y in ys)]
+
+    kept = [0]
+    a = 0
+    for i in range(buckets):
+        next_start, next_end = bounds[i + 1], bounds[i + 2]
+        avg_x = (cx[next_end] - cx[next_start]) / (next_end - next_start)
+        avg_y = (cy[next_end] - cy[next_start]) / (next_end - next_start)
+        ax, ay = xs[a] - x0, ys[a]
+        best, best_area = bounds[i], -1.0
+        for j in range(bounds[i], bounds[i + 1]):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - (xs[j] - x0)) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(size - 1)
+    return kept
+
+
+def _lttb_numpy(xs, ys, buckets: int, every: float) -> List[int]:
+    if np is None:
+        raise RuntimeError("_lttb_numpy needs NumPy")
+    size = len(xs)
+    bounds = (np.arange(buckets + 1) * every).astype(np.int64) + 1
+    bounds[-1] = size - 1
+    bounds = np.append(bounds, size)
+    xs = xs - xs[0]
+    cx = np.concatenate(([0.0], np.cumsum(xs)))
+    cy = np.concatenate(([0.0], np.cumsum(ys)))
+    next_start, next_end = bounds[1:-1], bounds[2:]
+    avg_x = (cx[next_end] - cx[next_start]) / (next_end - next_start)
+    avg_y = (cy[next_end] - cy[next_start]) / (next_end - next_start)
+
+    kept = [0]
+    a = 0
+    for i in range(buckets):
+        start, end = bounds[i], bounds[i + 1]
+        ax, ay = xs[a], ys[a]
+        area = np.abs((ax - avg_x[i]) * (ys[start:end] - ay) - (ax - xs[start:end]) * (avg_y[i] - ay))
+        a = int(start + np.argmax(area))
+        kept.append(a)
+    kept.append(size - 1)
+    return kept
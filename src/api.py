@@ -1,13 +1,19 @@
 import logging
-from functools import cached_property
-from typing import Any, List, Protocol, Dict, Union, Set
+import math
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import (TYPE_CHECKING, AbstractSet, Any, Callable, Generic, Iterable, Iterator, List, Protocol, Dict, Self,
+                    Sequence, TypeVar, Union, Set, overload)
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timedelta
 
+import pydantic_core
 
 from st.device import DeviceItem, DeviceResponse, DeviceStatusResponse, StatusModel
 from st.history import EventHistoryResponse
-from st.command import Command
+from st.command import Command, DeviceCommands
 from st.literals import (
     Aggregate,
     Attribute,
@@ -17,16 +23,48 @@ from st.literals import (
     ConnectionType,
     Granularity,
 )
-from custom_session import CustomSession
+from aggregate import LOCAL_EPOCH, MICROSECOND, PERCENTILES, lttb, np, percentile, reduce_buckets, stddev
+from cache import TTLCache
+from catalog import AsyncDeviceCatalog, CatalogData, CatalogField, CatalogSnapshot, DeviceCatalog, DeviceIndex
+from decode import HistoryItem, HistoryPage, history_page, next_href, uuid
+from frame import HistoryFrame
+from merge import merge_events, read_ahead
+from store import EventStore
+
+if TYPE_CHECKING:
+    from custom_session import CustomSession
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+V = TypeVar("V")
+CatalogT = TypeVar("CatalogT", DeviceCatalog, AsyncDeviceCatalog)
+
 
 IGNORE_CAPABILITIES = {'mediaPresets', 'firmwareUpdate', 'healthCheck', 'threeAxis', 'momentary', 'refresh',
                        'windowShadePreset', 'configuration', 'bridge', 'alarm', 'statelessPowerToggleButton'}
 
+DEVICES_TABLE_COLUMNS = ('deviceId', 'label', 'manufacturerName', 'roomId', 'connection_type', 'parentDeviceId',
+                         'categories', 'capabilities', 'status', 'components')
+
+
+def _flat_state(state: dict) -> Any:
+    """A ``{'value', 'unit'}`` status as its bare value, or ``[value, unit]`` when it has a unit."""
+    return [state['value'], state['unit']] if 'unit' in state else state['value']
+
 
-class ILocation(Protocol): 
+def table_json(table: dict) -> str:
+    """A ``columns``/``rows`` table as compact JSON, one line per row.
+
+    Tool results that are not strings get serialized with every cell on its
+    own indented line, which for a table costs more than the layout saves.
+    """
+    rows = ",\n".join(pydantic_core.to_json(row, fallback=str).decode() for row in table["rows"])
+    columns = pydantic_core.to_json(table["columns"]).decode()
+    return f'{{"columns": {columns},\n"rows": [\n{rows}\n]}}'
+
+
+class ILocation(Protocol):
     def device_status(self, device_id: UUID) -> dict[str, dict[Union[Capability, str], dict[Union[Attribute, str], StatusModel]]]:
         ...
 
@@ -38,7 +76,7 @@ class ILocation(Protocol):
                       paging_before_epoch: int | None = None, paging_before_hash: int | None = None) -> List[dict]:
         ...
 
-    @cached_property
+    @property
     def rooms(self) -> dict[UUID, str]:
         """Get room UUID and names."""
         ...
@@ -60,47 +98,102 @@ class ILocation(Protocol):
                           connection_type: ConnectionType | None = None) -> List[dict]:
         ...
 
-    
-
-class Location(ILocation):
-    session : CustomSession
-    
-    def __init__(self, auth: str, location_id: UUID | None = None):
-        self.session = CustomSession(auth=auth)
-        self.session.headers = {
-            'Accept': 'application/vnd.smartthings+json;v=20170916',
-            'Authorization': "Bearer " + auth,
-            # 'cache-control': "no-cache",
-        }
+    def status_snapshot(self, room_id: UUID | None = None, capability: Set[Capability] | None = None,
+                        device_ids: Iterable[UUID] | None = None,
+                        attributes: Set[Attribute] | None = None) -> List[dict]:
+        ...
 
-        locations = self.session.get_json("v1/locations")
-    
-        self.location_id = location_id or locations['items'][0]['locationId']
-        self.location = self._location()
 
-        import pytz
 
-        self.timezone = pytz.timezone(self.location['timeZoneId'])
-        #self.timeZoneOffset = datetime.datetime.now(self.timezone).strftime('%z')
+class _ReadyField(Generic[V]):
+    """Attribute set by ``ready()``.
 
-    def _location(self):
-        return self.session.get_json(f"v1/locations/{self.location_id}")
+    Reading it before then calls ``_not_ready()``: :class:`Location` fetches
+    the location there, ``AsyncLocation`` (whose ``ready()`` has to be
+    awaited) raises AttributeError.
+    """
 
-    def _device_status(self, device_id: UUID) -> DeviceStatusResponse:
-        return DeviceStatusResponse.model_validate(self.session.get_json(f"v1/devices/{device_id}/status"))
+    def __set_name__(self, owner, name: str):
+        self.name = name
 
-    def device_status(self, device_id: UUID) -> dict[str, dict[Union[Capability, str], dict[Union[Attribute, str], StatusModel]]]:
-        device_id = self.validate_device_id(device_id)
-        status = self._device_status(device_id)
-        return status.components
+    @overload
+    def __get__(self, obj: None, objtype: Any = None) -> Self: ...
 
-    def event_history(self, device_id: UUID | None = None, limit: int = 500,
-                      capability: Set[Capability] | None = None,
-                      capability_mode: CapabilitiesMode | None = "or",
-                      attribute: Attribute | None = None,
-                      oldest_first: bool = False, paging_after_epoch: int | None = None, paging_after_hash: int | None = None,
-                      paging_before_epoch: int | None = None, paging_before_hash: int | None = None) -> List[dict]:
+    @overload
+    def __get__(self, obj: "LocationBase", objtype: Any = None) -> V: ...
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        try:
+            return obj.__dict__[self.name]
+        except KeyError:
+            obj._not_ready(self.name)
+            return obj.__dict__[self.name]
+
+    def __set__(self, obj: "LocationBase", value: V) -> None:
+        obj.__dict__[self.name] = value
+
+
+class LocationBase(Generic[CatalogT]):
+    """I/O-free helpers shared by :class:`Location` and ``AsyncLocation``.
+
+    Everything here builds URLs, validates arguments or reshapes already
+    fetched payloads, so the sync and async clients only differ in how they
+    talk to the network.
+    """
+    location_id = _ReadyField[UUID | str]()
+    location = _ReadyField[dict]()
+    timezone = _ReadyField[Any]()
+    # Maximum number of per-device history requests in flight for a room query.
+    history_concurrency: int = 8
+    # Local copy of event history; when set, history queries only fetch what it lacks.
+    store: EventStore | None = None
+    # Maximum number of device command requests in flight for a batch.
+    command_concurrency: int = 8
+    # Recently fetched device status, dropped when a command on the device is accepted.
+    status_cache: TTLCache[UUID, DeviceStatusResponse] | None = None
+    # Decode history and device-list responses straight from the JSON, skipping
+    # pydantic validation. Only for responses trusted to match the API schema.
+    fast_decode: bool = False
+    # Rooms and devices of the location; fresh snapshots answer device queries without a request.
+    catalog: CatalogT | None = None
+
+    def _not_ready(self, name: str) -> None:
+        raise AttributeError(f"'{name}' is set by ready(), which has not completed yet")
+
+    @staticmethod
+    def _check_device_id(device_id: UUID, known: AbstractSet[UUID]) -> UUID:
+        if not isinstance(device_id, UUID):
+            raise ValueError(f"'{device_id}' is not a valid UUID") from None
+
+        if device_id not in known:
+            raise ValueError(
+                f"deviceId '{device_id}' is unknown, use get_devices to list valid ids"
+            )
+
+        return device_id
 
+    @staticmethod
+    def _parse_rooms(data: dict) -> dict[UUID, str]:
+        res = {}
+        for r in data['items']:
+            res[UUID(r['roomId'])] = r['name']
+
+        return res
+
+    @staticmethod
+    def _check_room_id(room_id: UUID | str, rooms: dict[UUID, str]) -> UUID:
+        if not isinstance(room_id, UUID):
+            room_id = UUID(room_id)
+        if room_id not in rooms:
+            raise ValueError(f"roomId '{room_id}' is unknown, must be one of {rooms.keys()}")
+        return room_id
+
+    def _event_history_url(self, device_id: UUID | None = None, limit: int | None = 500,
+                           oldest_first: bool = False,
+                           paging_after_epoch: int | None = None, paging_after_hash: int | None = None,
+                           paging_before_epoch: int | None = None, paging_before_hash: int | None = None) -> str:
         if limit is None:
             limit = 500
 
@@ -118,102 +211,124 @@ class Location(ILocation):
             url += "&oldestFirst=true"
         if device_id is not None:
             url += f"&deviceId={device_id}"
+        return url
 
-        events_data = {}
+    def _parse_event_history(self, events_data: dict) -> EventHistoryResponse | HistoryPage:
         try:
-            events_data = self.session.get_json(url)
-            events = EventHistoryResponse.model_validate(events_data)
+            if self.fast_decode:
+                return history_page(events_data)
+            return EventHistoryResponse.model_validate(events_data)
         except Exception as e:
             logger.error(f"Failed to parse event history response: {e}")
             logger.debug(f"Response data: {events_data}")
             raise
 
-        # Filter items without pandas
-        filtered_items = []
-        for item in events.items:
-            if capability is not None and item.capability not in capability:
-                continue
-            if attribute is not None and item.attribute != attribute:
-                continue
-
-            filtered_item = {
-                'deviceId': item.device_id,
-                'time': item.time,
-                'component': item.component,
-                'capability': item.capability,
-                'attribute': item.attribute,
-                'value': item.value,
-                'unit': None if item.unit == "" else item.unit
-            }
-            filtered_items.append(filtered_item)
-
-        return filtered_items
-
-    def _rooms(self):
-        return self.session.get_json(f"v1/locations/{self.location_id}/rooms")
-
-    @cached_property
-    def rooms(self) -> dict[UUID, str]:
-        res = {}
-        for r in self._rooms()['items']:
-            res[UUID(r['roomId'])] = r['name']
-
-        return res
-
-    @cached_property
-    def device_ids(self) -> set[UUID]:
-        """Set of device UUIDs available in this location."""
-        devices = self.get_devices_short(include_status=False)
-        return {d['deviceId'] for d in devices}
-
-    def validate_device_id(self, device_id: UUID) -> UUID:
-        """Validate that a device ID exists in the location.
+    @staticmethod
+    def _event_matches(item: HistoryItem,
+                       capability: Set[Capability] | None = None,
+                       attribute: Attribute | None = None) -> bool:
+        if capability is not None and item.capability not in capability:
+            return False
+        if attribute is not None and item.attribute != attribute:
+            return False
+        return True
 
-        Args:
-            device_id: Device UUID.
+    @staticmethod
+    def _event_dict(item: HistoryItem) -> dict:
+        return {
+            'deviceId': item.device_id,
+            'time': item.time,
+            'component': item.component,
+            'capability': item.capability,
+            'attribute': item.attribute,
+            'value': item.value,
+            'unit': None if item.unit == "" else item.unit
+        }
 
-        Returns:
-            Normalised UUID if valid.
+    @classmethod
+    def _filter_events(cls, events: EventHistoryResponse | HistoryPage,
+                       capability: Set[Capability] | None = None,
+                       attribute: Attribute | None = None) -> List[dict]:
+        # Filter items without pandas
+        return [cls._event_dict(item) for item in events.items
+                if cls._event_matches(item, capability, attribute)]
 
-        Raises:
-            ValueError: If the ID format is invalid or not known.
-        """
-        if not isinstance(device_id, UUID):
-            raise ValueError(f"'{device_id}' is not a valid UUID") from None
+    @staticmethod
+    def _next_page_url(events: EventHistoryResponse | HistoryPage | dict, base_url: str) -> str | None:
+        """Relative URL of the next page, or None on the last page."""
+        if isinstance(events, dict):
+            href = next_href(events)
+        elif isinstance(events, HistoryPage):
+            href = events.next_href
+        elif events.links is not None and events.links.next is not None:
+            href = events.links.next.href
+        else:
+            href = None
+        if href is None:
+            return None
+        if href.startswith(base_url):
+            href = href[len(base_url):]
+        return href.lstrip('/')
 
-        if device_id not in self.device_ids:
+    @staticmethod
+    def _capability_filter(capability: Set[Capability] | Capability | None) -> List[str]:
+        """Validated capability ids of a device filter, with the 'humidity' alias resolved."""
+        if capability is None:
+            return []
+        if isinstance(capability, str):
+            capability = {capability}
+        resolved = []
+        for c in capability:
+            if c == 'humidity':
+                c = "relativeHumidityMeasurement"
+
+            if c not in Capability.__args__:
+                raise ValueError(f"capability '{c}' is unknown, must be one of {Capability.__args__}")
+            resolved.append(c)
+        return resolved
+
+    @classmethod
+    def _matching_devices(cls, index: DeviceIndex,
+                          capability: Set[Capability] | Capability | None = None,
+                          capabilities_mode: CapabilitiesMode | None = None,
+                          room_id: UUID | None = None,
+                          category: ComponentCategory | None = None,
+                          connection_type: ConnectionType | None = None) -> List[DeviceItem]:
+        """Local equivalent of the ``devices`` query filters, for already fetched devices."""
+        wanted = cls._capability_filter(capability)
+        if capabilities_mode is not None and capabilities_mode not in CapabilitiesMode.__args__:
             raise ValueError(
-                f"deviceId '{device_id}' is unknown, use get_devices to list valid ids"
-            )
-
-        return device_id
-
-    def get_room_name(self, room_id: UUID) -> str:
-        """Get room name by UUID."""
-        if room_id not in self.rooms:
-            raise ValueError(f"roomId '{room_id}' is unknown, must be one of {self.rooms.keys()}")
-        return self.rooms[room_id]
-
-    ###
-    def _get_devices(self, url: str):
-        return DeviceResponse.model_validate(self.session.get_json(url)).items
-
-    def get_devices(self, capability: Set[Capability] | Capability | None = None, capabilities_mode: CapabilitiesMode | None = None,
-                    include_restricted: bool = False,
-                    room_id: UUID | None = None, include_status: bool = True,
-                    category: ComponentCategory | None = None,
-                    connection_type: ConnectionType | None = None) -> List[DeviceItem]:
+                f"capabilitiesMode '{capabilities_mode}' is unknown, must be one of {CapabilitiesMode.__args__}")
+        if connection_type is not None and connection_type not in ConnectionType.__args__:
+            raise ValueError(f"type must be one of {ConnectionType.__args__}")
+        # the API treats several capabilities as "and" unless asked otherwise
+        return index.select(wanted, capabilities_mode == "or", room_id, category, connection_type)
+
+    def _indexed_devices(self, capability: Set[Capability] | Capability | None,
+                         capabilities_mode: CapabilitiesMode | None, include_restricted: bool,
+                         room_id: UUID | None, include_status: bool, category: ComponentCategory | None,
+                         connection_type: ConnectionType | None) -> List[DeviceItem] | None:
+        """A ``devices`` query answered from the catalog index, or None when it has to go upstream.
+
+        The catalog holds neither statuses nor restricted devices, and is only
+        trusted while younger than its `max_age`. `room_id` must already be
+        validated.
+        """
+        snapshot = self.catalog.fresh() if self.catalog is not None else None
+        if snapshot is None or include_status or include_restricted:
+            return None
+        return self._matching_devices(snapshot.index, capability, capabilities_mode, room_id, category,
+                                      connection_type)
+
+    def _devices_url(self, capability: Set[Capability] | Capability | None = None, capabilities_mode: CapabilitiesMode | None = None,
+                     include_restricted: bool = False,
+                     room_id: UUID | None = None, include_status: bool = True,
+                     category: ComponentCategory | None = None,
+                     connection_type: ConnectionType | None = None) -> str:
+        """Build the ``devices`` query URL, `room_id` must already be validated."""
         url = f"devices?locationId={self.location_id}"
-        if capability is not None:
-            if isinstance(capability, str):
-                capability = {capability}
-            for c in capability:
-                if c == 'humidity':
-                    c = "relativeHumidityMeasurement"
-
-                if c not in Capability.__args__:
-                    raise ValueError(f"capability '{c}' is unknown, must be one of {Capability.__args__}")
-                url += f"&capability={c}"
+        for c in self._capability_filter(capability):
+            url += f"&capability={c}"
 
         if category is not None:
             url += f"&category={category}"
@@ -226,10 +341,6 @@ class Location(ILocation):
         if include_restricted:
             url += "&includeRestricted=true"
         if room_id is not None:
-            if not isinstance(room_id, UUID):
-                room_id = UUID(room_id)
-            if room_id not in self.rooms:
-                raise ValueError(f"roomId '{room_id}' is unknown, must be one of {self.rooms.keys()}")
             url += f"&roomId={room_id}"
         if include_status:
             url += "&includeStatus=true"
@@ -238,17 +349,16 @@ class Location(ILocation):
                 raise ValueError(f"type must be one of {ConnectionType.__args__}")
             url += f"&type={connection_type}"
 
-        return self._get_devices(url)
-
-    def get_devices_short(self, capability: Set[Capability] | None = None, capabilities_mode: CapabilitiesMode | None = None,
-                          include_restricted: bool = False,
-                          room_id: UUID | None = None, include_status: bool = True,
-                          category: ComponentCategory | None = None,
-                          connection_type: ConnectionType | None = None) -> List[dict]:
-        devices = self.get_devices(capability, capabilities_mode, include_restricted, room_id, include_status, category, connection_type)
+        return url
 
+    @staticmethod
+    def _short_devices(devices: List[DeviceItem],
+                       statuses: Callable[[UUID], dict[str, dict[str, dict[str, StatusModel]]] | None] | None = None
+                       ) -> List[dict]:
+        """Trimmed device dicts; `statuses`, when given, supplies each device's status by component."""
         filtered_devices = []
         for device in devices:
+            components = statuses(device.device_id) if statuses is not None else None
             filtered_device = {'deviceId': device.device_id, 'label': device.label,
                                'manufacturerName': device.manufacturer_name}
 
@@ -266,9 +376,12 @@ class Location(ILocation):
                     if '.' in _capability.id or _capability.id in IGNORE_CAPABILITIES:
                         continue
                     filtered_capability: dict[str, Any] = {'id': _capability.id}
-                    if _capability.status is not None:
+                    status = _capability.status
+                    if components is not None:
+                        status = components.get(component.id, {}).get(_capability.id, {})
+                    if status is not None:
                         filtered_capability['status'] = {}
-                        for (k, v) in _capability.status.items():
+                        for (k, v) in status.items():
                             if k.startswith('supported') or k in {'numberOfButtons', ''}:
                                 continue
                             filtered_capability['status'][k] = {}
@@ -279,7 +392,7 @@ class Location(ILocation):
                             #    filtered_capability['status'][k]['timestamp'] = v.timestamp
                     filtered_component['capabilities'].append(filtered_capability)
                 filtered_device['components'].append(filtered_component)
-            
+
 
             if device.parent_device_id is not None:
                 filtered_device['parentDeviceId'] = device.parent_device_id
@@ -288,6 +401,105 @@ class Location(ILocation):
 
         return filtered_devices
 
+    @staticmethod
+    def _short_devices_raw(items: List[dict]) -> List[dict]:
+        """:meth:`_short_devices` straight from the ``devices`` JSON, without building `DeviceItem` models."""
+        filtered_devices = []
+        for device in items:
+            filtered_device = {'deviceId': uuid(device['deviceId']), 'label': device['label'],
+                               'manufacturerName': device['manufacturerName']}
+            if device.get('roomId') is not None:
+                filtered_device['roomId'] = uuid(device['roomId'])
+            filtered_device['components'] = []
+            for component in device['components']:
+                filtered_component = {'id': component['id'], 'label': component['label'],
+                                      'categories': [{'name': c['name']} for c in component['categories']],
+                                      'capabilities': []}
+                for _capability in component['capabilities']:
+                    capability_id = _capability['id']
+                    if '.' in capability_id or capability_id in IGNORE_CAPABILITIES:
+                        continue
+                    filtered_capability: dict[str, Any] = {'id': capability_id}
+                    status = _capability.get('status')
+                    if status is not None:
+                        filtered_capability['status'] = {}
+                        for (k, v) in status.items():
+                            if k.startswith('supported') or k in {'numberOfButtons', ''}:
+                                continue
+                            filtered_capability['status'][k] = {'value': v['value']}
+                            if v.get('unit') is not None:
+                                filtered_capability['status'][k]['unit'] = v['unit']
+                    filtered_component['capabilities'].append(filtered_capability)
+                filtered_device['components'].append(filtered_component)
+
+            if device.get('parentDeviceId') is not None:
+                filtered_device['parentDeviceId'] = uuid(device['parentDeviceId'])
+            filtered_device['connection_type'] = device['type']
+            filtered_devices.append(filtered_device)
+
+        return filtered_devices
+
+    @staticmethod
+    def devices_table(devices: List[dict]) -> dict:
+        """:meth:`_short_devices` output as a header row plus one row per device.
+
+        Nested names collapse into paths: capabilities and categories of any
+        component but ``main`` are prefixed with ``<component>/``, and each
+        status becomes ``"<capability>.<attribute>": value``, or
+        ``[value, unit]`` when it has a unit. `capabilities` only lists those
+        without a status entry, and `components` maps component ids to
+        labels where the two differ.
+        """
+        rows = []
+        for device in devices:
+            categories: list[str] = []
+            capabilities: list[str] = []
+            status: dict[str, Any] = {}
+            labels: dict[str, str] = {}
+            for component in device['components']:
+                prefix = '' if component['id'] == 'main' else f"{component['id']}/"
+                if component['label'] != component['id']:
+                    labels[component['id']] = component['label']
+                categories.extend(prefix + c['name'] for c in component['categories'])
+                for capability in component['capabilities']:
+                    attributes = capability.get('status')
+                    if not attributes:
+                        capabilities.append(prefix + capability['id'])
+                        continue
+                    for attribute, state in attributes.items():
+                        status[f"{prefix}{capability['id']}.{attribute}"] = _flat_state(state)
+            rows.append([device['deviceId'], device['label'], device['manufacturerName'], device.get('roomId'),
+                         device['connection_type'], device.get('parentDeviceId'), categories, capabilities,
+                         status, labels or None])
+        return {"columns": list(DEVICES_TABLE_COLUMNS), "rows": rows}
+
+    @staticmethod
+    def _status_snapshot(devices: List[dict], device_ids: AbstractSet[UUID] | None = None,
+                         capability: AbstractSet[Capability] | None = None,
+                         attributes: AbstractSet[Attribute] | None = None) -> List[dict]:
+        """Project :meth:`_short_devices` output onto the requested devices, capabilities and attributes.
+
+        Status entries are keyed and valued as in :meth:`devices_table`.
+        Devices left without any entry are dropped.
+        """
+        snapshot = []
+        for device in devices:
+            if device_ids is not None and device['deviceId'] not in device_ids:
+                continue
+            status: dict[str, Any] = {}
+            for component in device['components']:
+                prefix = '' if component['id'] == 'main' else f"{component['id']}/"
+                for _capability in component['capabilities']:
+                    if capability is not None and _capability['id'] not in capability:
+                        continue
+                    for attribute, state in (_capability.get('status') or {}).items():
+                        if attributes is None or attribute in attributes:
+                            status[f"{prefix}{_capability['id']}.{attribute}"] = _flat_state(state)
+            if status:
+                snapshot.append({'deviceId': device['deviceId'], 'label': device['label'],
+                                 'roomId': device.get('roomId'), 'status': status})
+        return snapshot
+
     @staticmethod
     def get_status(status: dict| None):
         if status is None or status == {}:
@@ -298,6 +510,328 @@ class Location(ILocation):
                 continue
             return k, v['value'], v.get('unit'), v.get('timestamp')
 
+    @staticmethod
+    def _commands_payload(commands: list[Command]) -> dict:
+        return {"commands": [cmd.to_dict() for cmd in commands]}
+
+    @staticmethod
+    def _check_batch(devices: List[DeviceCommands] | None, commands: List[Command] | None,
+                     room_id: UUID | None, capability: Capability | None) -> None:
+        if devices is not None and (commands is not None or room_id is not None or capability is not None):
+            raise ValueError("pass either `devices` or `commands` with a room/capability selector, not both")
+        if devices is None:
+            if not commands:
+                raise ValueError("`commands` is required when devices are selected by room or capability")
+            if room_id is None and capability is None:
+                raise ValueError("select devices with `room_id` and/or `capability`, or list them in `devices`")
+
+    @staticmethod
+    def _batch_error(device_id: UUID, error: Exception) -> dict:
+        logger.error(f"Batch command for device {device_id} failed: {error}")
+        return {"deviceId": device_id, "error": str(error)}
+
+    def _after_commands(self, device_id: UUID, result: dict) -> dict:
+        """Drop the cached status of a device once any of its commands is accepted."""
+        if self.status_cache is not None and any(
+                r.get("status") == "ACCEPTED" for r in result.get("results", ()) if isinstance(r, dict)):
+            self.status_cache.invalidate(device_id)
+        return result
+
+    def _calc_epoch_range(self, delta_start: str, delta_end: str | None = None) -> tuple[int, int]:
+        """Calculate epoch millisecond range from ISO8601 durations."""
+        import isodate
+
+        now = datetime.now(self.timezone)
+        start_delta: timedelta = isodate.parse_duration(delta_start)
+        start_time = now - start_delta
+        end_time: datetime = now
+        if delta_end is not None:
+            end_delta: timedelta = isodate.parse_duration(delta_end)
+            end_time = now - end_delta
+
+        # Type annotation helps the type checker understand these are datetime objects
+        start_timestamp = start_time.timestamp()  # type: ignore
+        end_timestamp = end_time.timestamp()  # type: ignore
+
+        return int(start_timestamp * 1000), int(end_timestamp * 1000)
+
+
+class Location(LocationBase[DeviceCatalog], ILocation):
+    session : "CustomSession"
+    catalog: DeviceCatalog | None = None
+
+    # Served from the current catalog snapshot, which refreshes itself in the background.
+    device_ids = CatalogField[frozenset[UUID]]("device_ids")
+
+    @property
+    def rooms(self) -> dict[UUID, str]:
+        """Get room UUID and names.
+
+        A property rather than a :class:`catalog.CatalogField` because
+        :class:`ILocation` declares it as one; the setter pins the rooms the
+        way setting ``device_ids`` pins the device ids.
+        """
+        rooms = self.__dict__.get("rooms")
+        return rooms if rooms is not None else self._snapshot().rooms
+
+    @rooms.setter
+    def rooms(self, rooms: dict[UUID, str]) -> None:
+        self.__dict__["rooms"] = rooms
+
+    def __init__(self, auth: str, location_id: UUID | str | None = None, store: EventStore | None = None,
+                 status_cache: TTLCache[UUID, DeviceStatusResponse] | None = None,
+                 catalog_max_age: float = 300.0, fast_decode: bool = False, **session_kwargs):
+        # requests is only needed by this synchronous client
+        from custom_session import CustomSession
+
+        self.store = store
+        self.status_cache = status_cache
+        self.fast_decode = fast_decode
+        self.catalog = DeviceCatalog(self._fetch_catalog, max_age=catalog_max_age)
+        self.session = CustomSession(auth=auth, **session_kwargs)
+        self._location_id = location_id
+        self._ready_lock = threading.Lock()
+
+    def ready(self) -> "Location":
+        """Fetch location details once; concurrent callers wait on the same fetch."""
+        if "timezone" in self.__dict__:
+            return self
+        with self._ready_lock:
+            if "timezone" in self.__dict__:
+                return self
+            location_id = self._location_id
+            if location_id is None:
+                locations = self.session.get_json("v1/locations")
+                location_id = locations['items'][0]['locationId']
+            self.location_id = location_id
+            self.location = self._location()
+
+            import pytz
+
+            self.timezone = pytz.timezone(self.location['timeZoneId'])
+            #self.timeZoneOffset = datetime.datetime.now(self.timezone).strftime('%z')
+        return self
+
+    def _not_ready(self, name: str) -> None:
+        # location_id, location and timezone are fetched on first use rather than in the constructor
+        self.ready()
+
+    def warm_up(self) -> None:
+        """Fetch the location and the device catalog on a background thread."""
+        threading.Thread(target=self._warm_up, name="location-warm-up", daemon=True).start()
+
+    def _warm_up(self) -> None:
+        try:
+            self.ready()
+            self._snapshot()
+        except Exception as e:
+            logger.warning(f"Warm-up failed, retrying on first use: {e}")
+
+    def _location(self):
+        return self.session.get_json(f"v1/locations/{self.location_id}")
+
+    def _device_status(self, device_id: UUID) -> DeviceStatusResponse:
+        return DeviceStatusResponse.model_validate(self.session.get_json(f"v1/devices/{device_id}/status"))
+
+    def device_status(self, device_id: UUID) -> dict[str, dict[Union[Capability, str], dict[Union[Attribute, str], StatusModel]]]:
+        device_id = self.validate_device_id(device_id)
+        status = self.status_cache.get(device_id) if self.status_cache is not None else None
+        if status is None:
+            status = self._device_status(device_id)
+            if self.status_cache is not None:
+                self.status_cache.put(device_id, status)
+        return status.components
+
+    def event_history(self, device_id: UUID | None = None, limit: int = 500,
+                      capability: Set[Capability] | None = None,
+                      capability_mode: CapabilitiesMode | None = "or",
+                      attribute: Attribute | None = None,
+                      oldest_first: bool = False, paging_after_epoch: int | None = None, paging_after_hash: int | None = None,
+                      paging_before_epoch: int | None = None, paging_before_hash: int | None = None,
+                      all_pages: bool = False, max_events: int | None = None) -> List[dict]:
+        """Fetch history events as dicts.
+
+        By default a single page of at most `limit` events is returned. With
+        `all_pages` the `_links.next` chain is followed (`limit` is then the
+        page size) until the range or the `max_events` budget is exhausted.
+        """
+        if all_pages:
+            return [self._event_dict(item) for item in self.iter_event_history(
+                device_id, capability, attribute, oldest_first,
+                paging_after_epoch, paging_after_hash, paging_before_epoch, paging_before_hash,
+                max_events=max_events, page_size=limit)]
+
+        url = self._event_history_url(device_id, limit, oldest_first,
+                                      paging_after_epoch, paging_after_hash,
+                                      paging_before_epoch, paging_before_hash)
+        events = self._parse_event_history(self.session.get_json(url))
+        return self._filter_events(events, capability, attribute)
+
+    def iter_event_history(self, device_id: UUID | None = None,
+                           capability: Set[Capability] | None = None,
+                           attribute: Attribute | None = None,
+                           oldest_first: bool = False,
+                           paging_after_epoch: int | None = None, paging_after_hash: int | None = None,
+                           paging_before_epoch: int | None = None, paging_before_hash: int | None = None,
+                           max_events: int | None = None, page_size: int = 500) -> Iterator[HistoryItem]:
+        """Lazily yield history events, following `_links.next` page by page.
+
+        Only one page is held in memory at a time. Iteration stops after
+        `max_events` matching events, or when the API reports no next page.
+        """
+        if max_events is not None and max_events <= 0:
+            return
+        url: str | None = self._event_history_url(device_id, page_size, oldest_first,
+                                                  paging_after_epoch, paging_after_hash,
+                                                  paging_before_epoch, paging_before_hash)
+        remaining = max_events
+        while url is not None:
+            events = self._parse_event_history(self.session.get_json(url))
+            for item in events.items:
+                if not self._event_matches(item, capability, attribute):
+                    continue
+                yield item
+                if remaining is not None:
+                    remaining -= 1
+                    if remaining <= 0:
+                        return
+            url = self._next_page_url(events, self.session.base_url)
+
+    def _sync_store(self, store: EventStore, device_id: UUID, start_ms: int, end_ms: int) -> None:
+        """Fetch the parts of [start_ms, end_ms] missing from `store`."""
+        for after_epoch, after_hash, before_epoch in store.gaps(device_id, start_ms, end_ms):
+            store.add(device_id, self.iter_event_history(
+                device_id=device_id,
+                paging_after_epoch=after_epoch,
+                paging_after_hash=after_hash,
+                paging_before_epoch=before_epoch,
+            ))
+        store.mark_synced(device_id, start_ms, end_ms)
+
+    def _stored_frame(self, store: EventStore, device_id: UUID, attribute: Attribute | None,
+                      start_ms: int, end_ms: int, max_events: int | None = None) -> HistoryFrame:
+        """Sync the parts of [start_ms, end_ms] missing from `store`, then answer from it."""
+        self._sync_store(store, device_id, start_ms, end_ms)
+        return store.frame(device_id, start_ms, end_ms, attribute=attribute, limit=max_events)
+
+    def _stored_history(self, store: EventStore, device_id: UUID, attribute: Attribute | None,
+                        start_ms: int, end_ms: int, max_events: int | None = None) -> List[dict]:
+        return self._stored_frame(store, device_id, attribute, start_ms, end_ms, max_events).to_dicts()
+
+    def _rooms(self):
+        return self.session.get_json(f"v1/locations/{self.location_id}/rooms")
+
+    def _fetch_catalog(self) -> CatalogData:
+        return self._parse_rooms(self._rooms()), self._get_devices(self._devices_url(include_status=False))
+
+    def _snapshot(self) -> CatalogSnapshot:
+        """Current catalog snapshot; without a catalog, a freshly fetched one."""
+        if self.catalog is None:
+            rooms, devices = self._fetch_catalog()
+            return CatalogSnapshot(rooms=rooms, devices=tuple(devices), fetched_at=time.monotonic())
+        return self.catalog.snapshot()
+
+    def _refresh_catalog(self) -> None:
+        """Refetch the catalog after a lookup miss, at most once per `min_refresh_interval`."""
+        if self.catalog is not None:
+            self.catalog.refresh(if_older_than=self.catalog.min_refresh_interval)
+
+    def _known_room_id(self, room_id: UUID | str) -> UUID:
+        if not isinstance(room_id, UUID):
+            room_id = UUID(room_id)
+        if room_id not in self.rooms:
+            self._refresh_catalog()
+        return self._check_room_id(room_id, self.rooms)
+
+    def validate_device_id(self, device_id: UUID) -> UUID:
+        """Validate that a device ID exists in the location.
+
+        Args:
+            device_id: Device UUID.
+
+        Returns:
+            Normalised UUID if valid.
+
+        Raises:
+            ValueError: If the ID format is invalid or not known.
+        """
+        if isinstance(device_id, UUID) and device_id not in self.device_ids:
+            self._refresh_catalog()
+        return self._check_device_id(device_id, self.device_ids)
+
+    def get_room_name(self, room_id: UUID) -> str:
+        """Get room name by UUID."""
+        return self.rooms[self._known_room_id(room_id)]
+
+    ###
+    def _device_items(self, url: str, decode: Callable[[dict], List[T]]) -> List[T]:
+        """Items of every page of a device list, decoded by `decode`, following ``_links.next``.
+
+        The next page is requested from a worker thread as soon as its link is
+        known, so it is in flight while the current page is decoded.
+        """
+        items: List[T] = []
+        page = self.session.get_json(url)
+        with ThreadPoolExecutor(max_workers=1) as prefetch:
+            while (next_url := self._next_page_url(page, self.session.base_url)) is not None:
+                pending = prefetch.submit(self.session.get_json, next_url)
+                items.extend(decode(page))
+                page = pending.result()
+        items.extend(decode(page))
+        return items
+
+    def _get_devices(self, url: str):
+        return self._device_items(url, lambda page: DeviceResponse.model_validate(page).items)
+
+    def get_devices(self, capability: Set[Capability] | Capability | None = None, capabilities_mode: CapabilitiesMode | None = None,
+                    include_restricted: bool = False,
+                    room_id: UUID | None = None, include_status: bool = True,
+                    category: ComponentCategory | None = None,
+                    connection_type: ConnectionType | None = None) -> List[DeviceItem]:
+        if room_id is not None:
+            room_id = self._known_room_id(room_id)
+        indexed = self._indexed_devices(capability, capabilities_mode, include_restricted, room_id, include_status,
+                                        category, connection_type)
+        if indexed is not None:
+            return indexed
+        url = self._devices_url(capability, capabilities_mode, include_restricted, room_id, include_status,
+                                category, connection_type)
+        return self._get_devices(url)
+
+    def get_devices_short(self, capability: Set[Capability] | None = None, capabilities_mode: CapabilitiesMode | None = None,
+                          include_restricted: bool = False,
+                          room_id: UUID | None = None, include_status: bool = True,
+                          category: ComponentCategory | None = None,
+                          connection_type: ConnectionType | None = None) -> List[dict]:
+        if self.fast_decode:
+            if room_id is not None:
+                room_id = self._known_room_id(room_id)
+            indexed = self._indexed_devices(capability, capabilities_mode, include_restricted, room_id,
+                                            include_status, category, connection_type)
+            if indexed is not None:
+                return self._short_devices(indexed)
+            url = self._devices_url(capability, capabilities_mode, include_restricted, room_id, include_status,
+                                    category, connection_type)
+            return self._device_items(url, lambda page: self._short_devices_raw(page['items']))
+        devices = self.get_devices(capability, capabilities_mode, include_restricted, room_id, include_status, category, connection_type)
+        return self._short_devices(devices)
+
+    def status_snapshot(self, room_id: UUID | None = None, capability: Set[Capability] | None = None,
+                        device_ids: Iterable[UUID] | None = None,
+                        attributes: Set[Attribute] | None = None) -> List[dict]:
+        """Current status of many devices from a single ``devices?includeStatus=true`` request.
+
+        Devices are selected by room, by capability (any of them) and/or by
+        id; only the requested capabilities and attributes are kept. Returns
+        one ``{'deviceId', 'label', 'roomId', 'status'}`` entry per device,
+        see :meth:`_status_snapshot`.
+        """
+        if device_ids is not None:
+            device_ids = {self.validate_device_id(device_id) for device_id in device_ids}
+        capability = set(capability) if capability else None
+        devices = self.get_devices_short(capability, 'or' if capability else None, room_id=room_id,
+                                         include_status=True)
+        return self._status_snapshot(devices, device_ids, capability, set(attributes) if attributes else None)
 
     def _device_commands(self, device_id: UUID, commands: list[Command]) -> dict:
         """Low-level API call to execute commands on a device.
@@ -311,13 +845,38 @@ class Location(ILocation):
         }
         """
         url = f"v1/devices/{device_id}/commands"
-        payload = {"commands": [cmd.to_dict() for cmd in commands]}
-        return self.session.post_json(url, json=payload)
-        
+        return self.session.post_json(url, json=self._commands_payload(commands))
+
     def device_commands(self, device_id: UUID, commands: list[Command]) -> dict:
         """Execute SmartThings commands on a device."""
         device_id = self.validate_device_id(device_id)
-        return self._device_commands(device_id, commands)
+        return self._after_commands(device_id, self._device_commands(device_id, commands))
+
+    def batch_commands(self, devices: List[DeviceCommands] | None = None,
+                       commands: List[Command] | None = None,
+                       room_id: UUID | None = None, capability: Capability | None = None,
+                       concurrency: int | None = None) -> List[dict]:
+        """Send commands to many devices concurrently.
+
+        Either list `devices` with their own commands, or send the same
+        `commands` to every device matching `room_id` and/or `capability`.
+        Returns one entry per device, in request order, holding either the
+        API response or an ``error`` message; one failure does not stop the rest.
+        """
+        self._check_batch(devices, commands, room_id, capability)
+        if devices is None:
+            selected = self.get_devices(capability=capability, room_id=room_id, include_status=False)
+            devices = [DeviceCommands(deviceId=d.device_id, commands=commands or []) for d in selected]
+
+        def send(request: DeviceCommands) -> dict:
+            try:
+                return {"deviceId": request.device_id, **self.device_commands(request.device_id, request.commands)}
+            except Exception as e:
+                return self._batch_error(request.device_id, e)
+
+        workers = max(1, min(concurrency or self.command_concurrency, len(devices)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-commands") as pool:
+            return list(pool.map(send, devices))
 
     def room_history(
         self,
@@ -325,45 +884,53 @@ class Location(ILocation):
         attribute: Attribute | None = None,
         start_ms: int | None = None,
         end_ms: int | None = None,
+        concurrency: int | None = None,
+        max_events: int | None = None,
     ) -> List[dict]:
-        """Aggregate history across all devices in a room."""
+        """History events of every device in a room, newest first.
+
+        The devices' event streams are combined by :func:`merge.merge_events`,
+        which drops events seen twice; each device reads its next page ahead
+        on one of up to `concurrency` worker threads (defaults to
+        `history_concurrency`). Every device's history is paged through,
+        capped at `max_events` each.
+        """
+        return [self._event_dict(item) for item in self._merged_history(
+            self._room_device_ids(room_id), attribute, start_ms, end_ms, max_events, concurrency)]
+
+    def _room_device_ids(self, room_id: UUID) -> List[UUID]:
         devices = self.get_devices_short(
             room_id=room_id,
             include_status=False,
         )
+        return [d["deviceId"] for d in devices]
 
-        events: List[dict] = []
-        for d in devices:
-            events.extend(
-                self.event_history(
-                    device_id=d["deviceId"],
-                    attribute=attribute,
-                    limit=500,
-                    paging_after_epoch=start_ms,
-                    paging_before_epoch=end_ms,
-                )
-            )
-
-        return events
+    def _history_items(self, device_id: UUID | None, attribute: Attribute | None, start_ms: int | None,
+                       end_ms: int | None, max_events: int | None = None) -> Iterator[HistoryItem]:
+        """History of one device (or all, for None), newest first, from the store when there is one.
 
-    def _calc_epoch_range(self, delta_start: str, delta_end: str | None = None) -> tuple[int, int]:
-        """Calculate epoch millisecond range from ISO8601 durations."""
-        import isodate
-        from datetime import timedelta
-
-        now = datetime.now(self.timezone)
-        start_delta: timedelta = isodate.parse_duration(delta_start)
-        start_time = now - start_delta
-        end_time: datetime = now
-        if delta_end is not None:
-            end_delta: timedelta = isodate.parse_duration(delta_end)
-            end_time = now - end_delta
+        A generator, so that the store sync runs where the first event is read.
+        """
+        if self.store is not None and device_id is not None and start_ms is not None and end_ms is not None:
+            self._sync_store(self.store, device_id, start_ms, end_ms)
+            yield from self.store.iter_events(device_id, start_ms, end_ms, attribute=attribute, limit=max_events)
+            return
+        yield from self.iter_event_history(
+            device_id=device_id,
+            attribute=attribute,
+            paging_after_epoch=start_ms,
+            paging_before_epoch=end_ms,
+            max_events=max_events,
+        )
 
-        # Type annotation helps the type checker understand these are datetime objects
-        start_timestamp = start_time.timestamp()  # type: ignore
-        end_timestamp = end_time.timestamp()  # type: ignore
-        
-        return int(start_timestamp * 1000), int(end_timestamp * 1000)
+    def _merged_history(self, device_ids: Sequence[UUID | None], attribute: Attribute | None,
+                        start_ms: int | None, end_ms: int | None, max_events: int | None = None,
+                        concurrency: int | None = None) -> Iterator[HistoryItem]:
+        """History of every device, merged newest first, read ahead on up to `concurrency` threads."""
+        workers = max(1, min(concurrency or self.history_concurrency, len(device_ids)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="room-history") as pool:
+            yield from merge_events([read_ahead(self._history_items(d, attribute, start_ms, end_ms, max_events), pool)
+                                     for d in device_ids])
 
     def history(
         self,
@@ -374,47 +941,190 @@ class Location(ILocation):
         attribute: Attribute | None = None,
         granularity: Granularity = "hourly",
         aggregate: Aggregate = "raw",
+        max_events: int | None = None,
+        max_points: int | None = None,
     ) -> List[dict]:
-        """Fetch history for a device or room using ISO durations."""
+        """Fetch history for a device or room using ISO durations.
+
+        The whole range is paged through. For a room, the devices' events
+        are merged newest first by :func:`merge.merge_events`, which drops
+        events seen twice, and aggregated as they stream by: the merge holds
+        one event per device and each device reads at most one page ahead.
+        `max_events` caps the events read per device. With a `store`,
+        device history is answered locally after syncing the gap.
+        `max_points` downsamples the answer with LTTB, keeping peaks and dips.
+        """
         start_ms, end_ms = self._calc_epoch_range(delta_start, delta_end)
-        if room_id is not None:
-            events = self.room_history(
-                room_id=room_id,
-                attribute=attribute,
-                start_ms=start_ms,
-                end_ms=end_ms,
-            )
+        aggregator = _HistoryAggregator(granularity, aggregate, max_points)
+        device_ids: Sequence[UUID | None] = self._room_device_ids(room_id) if room_id is not None else [device_id]
+        for item in self._merged_history(device_ids, attribute, start_ms, end_ms, max_events):
+            aggregator.add_item(item)
+
+        return aggregator.result()
+
+
+class _HistoryAggregator:
+    """Incremental form of :func:`_aggregate_history`.
+
+    Events are fed one at a time. With NumPy installed, event times and values
+    are buffered in compact arrays and bucketed and reduced in one vectorized
+    pass by :func:`aggregate.reduce_buckets`. Without it, ``min``, ``max``,
+    ``count``, ``first`` and ``last`` keep a running accumulator per bucket,
+    and the other aggregates keep the bucket's values: sums are taken with
+    :func:`math.fsum` when the result is built, so both paths give the same
+    floats as :func:`_aggregate_values`.
+
+    With `max_points`, the result is downsampled to at most that many points
+    by :func:`aggregate.lttb`.
+    """
+
+    def __init__(self, granularity: Granularity = "hourly", aggregate: Aggregate = "raw",
+                 max_points: int | None = None):
+        if aggregate not in Aggregate.__args__:
+            raise ValueError(f"Unknown aggregation: {aggregate}")
+        if granularity not in Granularity.__args__:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        if max_points is not None and max_points < 1:
+            raise ValueError(f"max_points must be positive, got {max_points}")
+        self.granularity: Granularity = granularity
+        self.aggregate: Aggregate = aggregate
+        self.max_points = max_points
+        self._events: List[dict] = []
+        self._buckets: Dict[datetime, list] = {}
+        self._keeps_values = aggregate in ("raw", "sum", "avg", "median", "p95", "stddev")
+        self.vectorized = np is not None and not (aggregate == "raw" and granularity == "realtime")
+        self._times = array('q')
+        self._values = array('d')
+        self._tz: Any = None
+        self._offset: timedelta | None = None
+        self._offset_us = 0
+
+    def add(self, ev: dict) -> None:
+        if self.aggregate == "raw" and self.granularity == "realtime":
+            self._events.append(ev)
+            return
+        self._add_value(ev["time"], ev["value"])
+
+    def add_item(self, item: HistoryItem) -> None:
+        """Add one event as read from the API or the event store."""
+        if self.aggregate == "raw" and self.granularity == "realtime":
+            self._events.append(LocationBase._event_dict(item))
+            return
+        self._add_value(item.time, item.value)
+
+    def _add_value(self, ts: datetime, value: Any) -> None:
+        try:
+            val = float(value)
+        except (TypeError, ValueError):
+            return
+
+        if self.vectorized:
+            offset = ts.utcoffset()
+            if not self._values:
+                self._tz, self._offset = ts.tzinfo, offset
+                self._offset_us = 0 if offset is None else offset // MICROSECOND
+            elif offset != self._offset:
+                # Buckets follow each event's wall clock, which is only one
+                # integer timeline while the UTC offset stays the same.
+                self._unvectorize()
+            if self.vectorized:
+                if offset is None:
+                    self._times.append((ts - LOCAL_EPOCH) // MICROSECOND)
+                else:
+                    # timestamp() is several times cheaper than datetime arithmetic;
+                    # its whole seconds are exact, the microseconds are taken as is.
+                    self._times.append(math.floor(ts.timestamp()) * 1_000_000 + ts.microsecond + self._offset_us)
+                self._values.append(val)
+                return
+
+        bucket = _bucket_time(ts, self.granularity)
+        acc = self._buckets.get(bucket)
+        if self._keeps_values:
+            if acc is None:
+                self._buckets[bucket] = [val]
+            else:
+                acc.append(val)
+        elif acc is None:
+            self._buckets[bucket] = [1, val, val, ts, val, ts, val]
         else:
-            events = self.event_history(
-                device_id=device_id,
-                attribute=attribute,
-                limit=500,
-                paging_after_epoch=start_ms,
-                paging_before_epoch=end_ms,
-            )
+            acc[0] += 1
+            if val < acc[1]:
+                acc[1] = val
+            if val > acc[2]:
+                acc[2] = val
+            if ts < acc[3]:
+                acc[3], acc[4] = ts, val
+            if ts >= acc[5]:
+                acc[5], acc[6] = ts, val
+
+    def extend(self, events: Iterable[dict]) -> None:
+        for ev in events:
+            self.add(ev)
 
-        if aggregate == "raw" and granularity == "realtime":
-            return sorted(events, key=lambda e: e["time"])
+    def _unvectorize(self) -> None:
+        self.vectorized = False
+        times, values = self._times, self._values
+        self._times, self._values = array('q'), array('d')
+        for us, val in zip(times, values):
+            self.add({"time": self._datetime(us), "value": val})
 
-        buckets: Dict[datetime, List[float]] = {}
-        for ev in events:
-            bucket = _bucket_time(ev["time"], granularity)
-            try:
-                val = float(ev["value"])
-            except (TypeError, ValueError):
-                continue
-            buckets.setdefault(bucket, []).append(val)
+    def _datetime(self, local_us: int) -> datetime:
+        return (LOCAL_EPOCH + local_us * MICROSECOND).replace(tzinfo=self._tz)
+
+    def _downsample(self, rows: List[dict]) -> List[dict]:
+        if self.max_points is None or len(rows) <= self.max_points:
+            return rows
+        try:
+            ys = [float(row["value"]) for row in rows]
+        except (TypeError, ValueError):
+            # States such as "on"/"off" have no curve to preserve; keep an even spread.
+            step = (len(rows) - 1) / max(self.max_points - 1, 1)
+            return [rows[round(i * step)] for i in range(self.max_points)]
+        start = rows[0]["time"]
+        xs = [(row["time"] - start).total_seconds() for row in rows]
+        return [rows[i] for i in lttb(xs, ys, self.max_points)]
+
+    def result(self) -> List[dict]:
+        if self.aggregate == "raw" and self.granularity == "realtime":
+            return self._downsample(sorted(self._events, key=lambda e: e["time"]))
+
+        if self.vectorized:
+            keys, values = reduce_buckets(self._times, self._values, self.granularity, self.aggregate)
+            if self.max_points is not None and len(keys) > self.max_points:
+                kept = lttb(keys, values, self.max_points)
+                keys, values = [keys[i] for i in kept], [values[i] for i in kept]
+            return [{"time": self._datetime(k), "value": v} for k, v in zip(keys, values)]
 
         result = []
-        for ts, vals in sorted(buckets.items()):
-            if aggregate == "raw":
-                for v in vals:
+        for ts, acc in sorted(self._buckets.items()):
+            if self.aggregate == "raw":
+                for v in acc:
                     result.append({"time": ts, "value": v})
+            elif self._keeps_values:
+                result.append({"time": ts, "value": _aggregate_values(acc, self.aggregate)})
             else:
-                agg_value = _aggregate_values(vals, aggregate)
-                result.append({"time": ts, "value": agg_value})
-
-        return result
+                count, low, high, _, first, _, last = acc
+                if self.aggregate == "min":
+                    value = float(low)
+                elif self.aggregate == "max":
+                    value = float(high)
+                elif self.aggregate == "count":
+                    value = float(count)
+                elif self.aggregate == "first":
+                    value = float(first)
+                else:
+                    value = float(last)
+                result.append({"time": ts, "value": value})
+
+        return self._downsample(result)
+
+
+def _aggregate_history(events: Iterable[dict], granularity: Granularity = "hourly",
+                       aggregate: Aggregate = "raw") -> List[dict]:
+    """Bucket events by granularity and reduce each bucket with aggregate."""
+    aggregator = _HistoryAggregator(granularity, aggregate)
+    aggregator.extend(events)
+    return aggregator.result()
 
 
 def _bucket_time(ts: datetime, granularity: Granularity = "realtime") -> datetime:
@@ -431,16 +1141,29 @@ def _bucket_time(ts: datetime, granularity: Granularity = "realtime") -> datetim
 
 
 def _aggregate_values(values: List[float], agg: Aggregate = "raw") -> float:
-    """Aggregate numeric values according to agg method."""
+    """Aggregate numeric values according to agg method.
+
+    `values` are in time order, for ``first`` and ``last``; ``stddev`` is the
+    population standard deviation.
+    """
     if not values:
         return float("nan")
     if agg == "sum":
-        return float(sum(values))
+        return math.fsum(values)
     if agg == "avg":
-        return float(sum(values) / len(values))
+        return math.fsum(values) / len(values)
     if agg == "min":
         return float(min(values))
     if agg == "max":
         return float(max(values))
+    if agg == "count":
+        return float(len(values))
+    if agg == "first":
+        return float(values[0])
+    if agg == "last":
+        return float(values[-1])
+    if agg in PERCENTILES:
+        return float(percentile(sorted(values), PERCENTILES[agg]))
+    if agg == "stddev":
+        return stddev(values)
     raise ValueError(f"Unknown aggregation: {agg}")
-
@@ -0,0 +1,570 @@
+import asyncio
+import logging
+import time
+from itertools import islice
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Sequence, Set, Union
+from uuid import UUID
+
+from st.device import DeviceItem, DeviceResponse, DeviceStatusResponse, StatusModel
+from st.command import Command, DeviceCommands
+from st.literals import (
+    Aggregate,
+    Attribute,
+    CapabilitiesMode,
+    Capability,
+    ComponentCategory,
+    ConnectionType,
+    Granularity,
+)
+from api import LocationBase, T, _HistoryAggregator
+from cache import TTLCache
+from catalog import AsyncDeviceCatalog, CatalogData, CatalogSnapshot
+from decode import HistoryItem
+from async_session import AsyncCustomSession
+from merge import amerge_events, aread_ahead
+from mirror import DeviceEventSubscription, StateMirror
+from store import EventStore
+from warm_start import WarmStart, WarmStartCache
+
+logger = logging.getLogger(__name__)
+
+# (progress, total, message), the signature of the MCP `Context.report_progress`.
+ProgressCallback = Callable[[float, float | None, str | None], Awaitable[None]]
+
+
+class _HistoryProgress:
+    """Pages read, events seen and devices finished by one history query.
+
+    Every page and every finished device is one step of progress, so the
+    reported value only grows; the total is unknown until the last page.
+    """
+
+    def __init__(self, report: ProgressCallback | None, devices: int):
+        self.report = report
+        self.devices = devices
+        self.devices_done = 0
+        self.pages = 0
+        self.events = 0
+
+    async def page(self, events: int) -> None:
+        self.pages += 1
+        self.events += events
+        await self._send()
+
+    async def device_done(self) -> None:
+        self.devices_done += 1
+        await self._send()
+
+    async def _send(self) -> None:
+        if self.report is not None:
+            await self.report(self.pages + self.devices_done, None,
+                              f"{self.devices_done}/{self.devices} devices, {self.pages} pages, {self.events} events")
+
+
+class AsyncLocation(LocationBase[AsyncDeviceCatalog]):
+    """asyncio-native twin of :class:`api.Location`.
+
+    Construction does no I/O: the location, its timezone, rooms and device ids
+    are fetched on first use, so the object can be created at import time and
+    the network calls happen on the event loop that serves the tools.
+    """
+    session: AsyncCustomSession
+    catalog: AsyncDeviceCatalog | None = None
+    # Device state kept current by an event subscription; answers status reads while live.
+    mirror: StateMirror | None = None
+    _subscription: DeviceEventSubscription | None = None
+    _warm_up_task: "asyncio.Task[None] | None" = None
+    # Last known location, rooms and devices on disk, served while they are refetched.
+    warm_start: WarmStartCache | None = None
+    _verify_task: "asyncio.Task[None] | None" = None
+
+    def __init__(self, auth: str, location_id: UUID | str | None = None, store: EventStore | None = None,
+                 status_cache: TTLCache[UUID, DeviceStatusResponse] | None = None,
+                 catalog_max_age: float = 300.0, fast_decode: bool = False, live_state: bool = False,
+                 warm_start: WarmStartCache | None = None, **session_kwargs):
+        self.store = store
+        self.warm_start = warm_start
+        self.status_cache = status_cache
+        self.fast_decode = fast_decode
+        if live_state:
+            self.mirror = StateMirror()
+        self.catalog = AsyncDeviceCatalog(self._fetch_catalog, max_age=catalog_max_age)
+        self.session = AsyncCustomSession(auth=auth, **session_kwargs)
+        self._location_id = location_id
+        self._ready = False
+        self._ready_lock = asyncio.Lock()
+
+    async def ready(self) -> "AsyncLocation":
+        """Fetch location details once; concurrent callers wait on the same fetch.
+
+        With a usable `warm_start` snapshot nothing is fetched here: the
+        location and the catalog come from disk and are refetched on a
+        background task.
+        """
+        if self._ready:
+            return self
+        async with self._ready_lock:
+            if self._ready:
+                return self
+            cached = await self._load_warm_start()
+            if cached is not None:
+                self.location_id = cached.location_id
+                self.location = cached.location
+            else:
+                location_id = self._location_id
+                if location_id is None:
+                    locations = await self.session.get_json("v1/locations")
+                    location_id = locations['items'][0]['locationId']
+                self.location_id = location_id
+                self.location = await self._location()
+
+            import pytz
+
+            self.timezone = pytz.timezone(self.location['timeZoneId'])
+            if self.mirror is not None:
+                self._subscription = DeviceEventSubscription(self.session, str(self.location_id), self.mirror,
+                                                             self._mirror_devices)
+                self._subscription.start()
+            self._ready = True
+            if cached is not None:
+                self._verify_task = asyncio.get_running_loop().create_task(self._verify_warm_start())
+        return self
+
+    async def _load_warm_start(self) -> WarmStart | None:
+        if self.warm_start is None or self.catalog is None or self.catalog.peek() is not None:
+            return None
+        cached = await asyncio.to_thread(self.warm_start.load, self._location_id)
+        if cached is not None:
+            self.catalog.seed((cached.rooms, cached.devices), age=cached.age)
+            logger.info(f"Warm start from {self.warm_start.path}, saved {cached.age:.0f} s ago")
+        return cached
+
+    async def _verify_warm_start(self) -> None:
+        """Refetch what the warm-start snapshot answered with; the catalog refresh rewrites the file."""
+        try:
+            self.location = await self._location()
+            import pytz
+
+            self.timezone = pytz.timezone(self.location['timeZoneId'])
+            if self.catalog is not None:
+                await self.catalog.refresh()
+        except Exception as e:
+            logger.warning(f"Could not verify the warm-start snapshot, serving it until the next refresh: {e}")
+
+    def warm_up(self) -> None:
+        """Fetch the location and the device catalog on a background task.
+
+        Failures are only logged; the first tool call that needs the data
+        fetches it again.
+        """
+        if self._ready or (self._warm_up_task is not None and not self._warm_up_task.done()):
+            return
+        self._warm_up_task = asyncio.get_running_loop().create_task(self._warm_up())
+
+    async def _warm_up(self) -> None:
+        try:
+            await self._snapshot()
+        except Exception as e:
+            logger.warning(f"Warm-up failed, retrying on first use: {e}")
+
+    async def _location(self):
+        return await self.session.get_json(f"v1/locations/{self.location_id}")
+
+    async def aclose(self):
+        for task in (self._warm_up_task, self._verify_task):
+            if task is not None:
+                task.cancel()
+        if self._subscription is not None:
+            await self._subscription.stop()
+        await self.session.aclose()
+
+    async def _mirror_devices(self) -> List[dict]:
+        """Raw devices with status, the state a (re)connected subscription starts from."""
+        return await self._device_items(f"devices?locationId={self.location_id}&includeStatus=true",
+                                        lambda page: page['items'])
+
+    async def _device_status(self, device_id: UUID) -> DeviceStatusResponse:
+        return DeviceStatusResponse.model_validate(await self.session.get_json(f"v1/devices/{device_id}/status"))
+
+    async def device_status(self, device_id: UUID) -> dict[str, dict[Union[Capability, str], dict[Union[Attribute, str], StatusModel]]]:
+        device_id = await self.validate_device_id(device_id)
+        if self.mirror is not None:
+            components = self.mirror.status(device_id)
+            if components is not None:
+                return components
+        status = self.status_cache.get(device_id) if self.status_cache is not None else None
+        if status is None:
+            status = await self._device_status(device_id)
+            if self.status_cache is not None:
+                self.status_cache.put(device_id, status)
+        if self.mirror is not None and self.mirror.live:
+            # a device added since the last resync; its events now keep this state current
+            self.mirror.seed(device_id, status.components)
+        return status.components
+
+    async def event_history(self, device_id: UUID | None = None, limit: int = 500,
+                            capability: Set[Capability] | None = None,
+                            capability_mode: CapabilitiesMode | None = "or",
+                            attribute: Attribute | None = None,
+                            oldest_first: bool = False, paging_after_epoch: int | None = None, paging_after_hash: int | None = None,
+                            paging_before_epoch: int | None = None, paging_before_hash: int | None = None,
+                            all_pages: bool = False, max_events: int | None = None) -> List[dict]:
+        """Fetch history events as dicts, see :meth:`api.Location.event_history`."""
+        if all_pages:
+            return [self._event_dict(item) async for item in self.iter_event_history(
+                device_id, capability, attribute, oldest_first,
+                paging_after_epoch, paging_after_hash, paging_before_epoch, paging_before_hash,
+                max_events=max_events, page_size=limit)]
+
+        await self.ready()
+        url = self._event_history_url(device_id, limit, oldest_first,
+                                      paging_after_epoch, paging_after_hash,
+                                      paging_before_epoch, paging_before_hash)
+        events = self._parse_event_history(await self.session.get_json(url))
+        return self._filter_events(events, capability, attribute)
+
+    async def iter_event_history(self, device_id: UUID | None = None,
+                                 capability: Set[Capability] | None = None,
+                                 attribute: Attribute | None = None,
+                                 oldest_first: bool = False,
+                                 paging_after_epoch: int | None = None, paging_after_hash: int | None = None,
+                                 paging_before_epoch: int | None = None, paging_before_hash: int | None = None,
+                                 max_events: int | None = None, page_size: int = 500,
+                                 on_page: Callable[[int], Awaitable[None]] | None = None) -> AsyncIterator[HistoryItem]:
+        """Lazily yield history events, following `_links.next` page by page.
+
+        `on_page` is awaited with the number of events of every page read.
+        """
+        if max_events is not None and max_events <= 0:
+            return
+        await self.ready()
+        url: str | None = self._event_history_url(device_id, page_size, oldest_first,
+                                                  paging_after_epoch, paging_after_hash,
+                                                  paging_before_epoch, paging_before_hash)
+        remaining = max_events
+        while url is not None:
+            events = self._parse_event_history(await self.session.get_json(url))
+            if on_page is not None:
+                await on_page(len(events.items))
+            for item in events.items:
+                if not self._event_matches(item, capability, attribute):
+                    continue
+                yield item
+                if remaining is not None:
+                    remaining -= 1
+                    if remaining <= 0:
+                        return
+            url = self._next_page_url(events, self.session.base_url)
+
+    async def _sync_store(self, store: EventStore, device_id: UUID, start_ms: int, end_ms: int,
+                          on_page: Callable[[int], Awaitable[None]] | None = None) -> None:
+        """Fetch the parts of [start_ms, end_ms] missing from `store`.
+
+        SQLite calls run on a worker thread so other requests keep going during a sync.
+        """
+        gaps = await asyncio.to_thread(store.gaps, device_id, start_ms, end_ms)
+        for after_epoch, after_hash, before_epoch in gaps:
+            batch: List[HistoryItem] = []
+            async for item in self.iter_event_history(
+                device_id=device_id,
+                paging_after_epoch=after_epoch,
+                paging_after_hash=after_hash,
+                paging_before_epoch=before_epoch,
+                on_page=on_page,
+            ):
+                batch.append(item)
+                if len(batch) >= 500:
+                    await asyncio.to_thread(store.add, device_id, batch)
+                    batch = []
+            await asyncio.to_thread(store.add, device_id, batch)
+        await asyncio.to_thread(store.mark_synced, device_id, start_ms, end_ms)
+
+    async def _rooms(self):
+        return await self.session.get_json(f"v1/locations/{self.location_id}/rooms")
+
+    async def _fetch_catalog(self) -> CatalogData:
+        await self.ready()
+        rooms, devices = await asyncio.gather(self._rooms(), self._get_devices(self._devices_url(include_status=False)))
+        rooms = self._parse_rooms(rooms)
+        if self.warm_start is not None:
+            await asyncio.to_thread(self.warm_start.save, self.location_id, self.location, rooms, devices)
+        return rooms, devices
+
+    async def _refresh_catalog(self) -> None:
+        """Refetch the catalog after a lookup miss, at most once per `min_refresh_interval`."""
+        if self.catalog is not None:
+            await self.catalog.refresh(if_older_than=self.catalog.min_refresh_interval)
+
+    async def _snapshot(self) -> CatalogSnapshot:
+        """Current catalog snapshot; without a catalog, a freshly fetched one."""
+        await self.ready()  # may seed the catalog from the warm-start snapshot
+        if self.catalog is None:
+            rooms, devices = await self._fetch_catalog()
+            return CatalogSnapshot(rooms=rooms, devices=tuple(devices), fetched_at=time.monotonic())
+        return await self.catalog.snapshot()
+
+    async def get_rooms(self) -> dict[UUID, str]:
+        """Get room UUID and names."""
+        return (await self._snapshot()).rooms
+
+    async def get_device_ids(self) -> frozenset[UUID]:
+        """Set of device UUIDs available in this location."""
+        return (await self._snapshot()).device_ids
+
+    async def _known_room_id(self, room_id: UUID | str) -> UUID:
+        if not isinstance(room_id, UUID):
+            room_id = UUID(room_id)
+        if room_id not in await self.get_rooms():
+            await self._refresh_catalog()
+        return self._check_room_id(room_id, await self.get_rooms())
+
+    async def validate_device_id(self, device_id: UUID) -> UUID:
+        """Validate that a device ID exists in the location.
+
+        Raises:
+            ValueError: If the ID format is invalid or not known.
+        """
+        if isinstance(device_id, UUID) and device_id not in await self.get_device_ids():
+            await self._refresh_catalog()
+        return self._check_device_id(device_id, await self.get_device_ids())
+
+    async def get_room_name(self, room_id: UUID) -> str:
+        """Get room name by UUID."""
+        return (await self.get_rooms())[await self._known_room_id(room_id)]
+
+    ###
+    async def _device_items(self, url: str, decode: Callable[[dict], List[T]]) -> List[T]:
+        """Items of every page of a device list, decoded by `decode`, following ``_links.next``.
+
+        The next page is requested as soon as its link is known. Meanwhile the
+        current page is decoded in a worker thread, which leaves the event loop
+        free to send that request and read its response.
+        """
+        items: List[T] = []
+        page = await self.session.get_json(url)
+        while (next_url := self._next_page_url(page, self.session.base_url)) is not None:
+            pending = asyncio.ensure_future(self.session.get_json(next_url))
+            try:
+                items.extend(await asyncio.to_thread(decode, page))
+                page = await pending
+            except BaseException:
+                pending.cancel()
+                raise
+        items.extend(decode(page))
+        return items
+
+    async def _get_devices(self, url: str) -> List[DeviceItem]:
+        return await self._device_items(url, lambda page: DeviceResponse.model_validate(page).items)
+
+    async def get_devices(self, capability: Set[Capability] | Capability | None = None, capabilities_mode: CapabilitiesMode | None = None,
+                          include_restricted: bool = False,
+                          room_id: UUID | None = None, include_status: bool = True,
+                          category: ComponentCategory | None = None,
+                          connection_type: ConnectionType | None = None) -> List[DeviceItem]:
+        await self.ready()
+        if room_id is not None:
+            room_id = await self._known_room_id(room_id)
+        indexed = self._indexed_devices(capability, capabilities_mode, include_restricted, room_id, include_status,
+                                        category, connection_type)
+        if indexed is not None:
+            return indexed
+        url = self._devices_url(capability, capabilities_mode, include_restricted, room_id, include_status,
+                                category, connection_type)
+        return await self._get_devices(url)
+
+    async def get_devices_short(self, capability: Set[Capability] | None = None, capabilities_mode: CapabilitiesMode | None = None,
+                                include_restricted: bool = False,
+                                room_id: UUID | None = None, include_status: bool = True,
+                                category: ComponentCategory | None = None,
+                                connection_type: ConnectionType | None = None) -> List[dict]:
+        if self.mirror is not None and self.mirror.live and not include_restricted:
+            devices = await self._mirrored_devices_short(capability, capabilities_mode, room_id, include_status,
+                                                         category, connection_type)
+            if devices is not None:
+                return devices
+        if self.fast_decode:
+            await self.ready()
+            if room_id is not None:
+                room_id = await self._known_room_id(room_id)
+            indexed = self._indexed_devices(capability, capabilities_mode, include_restricted, room_id,
+                                            include_status, category, connection_type)
+            if indexed is not None:
+                return self._short_devices(indexed)
+            url = self._devices_url(capability, capabilities_mode, include_restricted, room_id, include_status,
+                                    category, connection_type)
+            return await self._device_items(url, lambda page: self._short_devices_raw(page['items']))
+        devices = await self.get_devices(capability, capabilities_mode, include_restricted, room_id, include_status,
+                                         category, connection_type)
+        return self._short_devices(devices)
+
+    async def status_snapshot(self, room_id: UUID | None = None, capability: Set[Capability] | None = None,
+                              device_ids: Iterable[UUID] | None = None,
+                              attributes: Set[Attribute] | None = None) -> List[dict]:
+        """Current status of many devices from one request, see :meth:`api.Location.status_snapshot`.
+
+        With a live state mirror no request is made at all.
+        """
+        if device_ids is not None:
+            device_ids = {await self.validate_device_id(device_id) for device_id in device_ids}
+        capability = set(capability) if capability else None
+        devices = await self.get_devices_short(capability, 'or' if capability else None, room_id=room_id,
+                                               include_status=True)
+        return self._status_snapshot(devices, device_ids, capability, set(attributes) if attributes else None)
+
+    async def _mirrored_devices_short(self, capability: Set[Capability] | None,
+                                      capabilities_mode: CapabilitiesMode | None, room_id: UUID | None,
+                                      include_status: bool, category: ComponentCategory | None,
+                                      connection_type: ConnectionType | None) -> List[dict] | None:
+        """:meth:`get_devices_short` from the catalog and the mirror, None if the mirror lacks a device."""
+        mirror = self.mirror
+        if mirror is None:
+            return None
+        if room_id is not None:
+            room_id = await self._known_room_id(room_id)
+        devices = self._matching_devices((await self._snapshot()).index, capability, capabilities_mode,
+                                         room_id, category, connection_type)
+        if not include_status:
+            return self._short_devices(devices)
+        statuses = {device.device_id: mirror.status(device.device_id) for device in devices}
+        if any(status is None for status in statuses.values()):
+            return None
+        return self._short_devices(devices, statuses.get)
+
+    async def _device_commands(self, device_id: UUID, commands: list[Command]) -> dict:
+        url = f"v1/devices/{device_id}/commands"
+        return await self.session.post_json(url, json=self._commands_payload(commands))
+
+    async def device_commands(self, device_id: UUID, commands: list[Command]) -> dict:
+        """Execute SmartThings commands on a device."""
+        device_id = await self.validate_device_id(device_id)
+        return self._after_commands(device_id, await self._device_commands(device_id, commands))
+
+    async def batch_commands(self, devices: List[DeviceCommands] | None = None,
+                             commands: List[Command] | None = None,
+                             room_id: UUID | None = None, capability: Capability | None = None,
+                             concurrency: int | None = None) -> List[dict]:
+        """Send commands to many devices concurrently, see :meth:`api.Location.batch_commands`."""
+        self._check_batch(devices, commands, room_id, capability)
+        if devices is None:
+            selected = await self.get_devices(capability=capability, room_id=room_id, include_status=False)
+            devices = [DeviceCommands(deviceId=d.device_id, commands=commands or []) for d in selected]
+
+        semaphore = asyncio.Semaphore(max(1, concurrency or self.command_concurrency))
+
+        async def send(request: DeviceCommands) -> dict:
+            async with semaphore:
+                try:
+                    return {"deviceId": request.device_id,
+                            **await self.device_commands(request.device_id, request.commands)}
+                except Exception as e:
+                    return self._batch_error(request.device_id, e)
+
+        return list(await asyncio.gather(*(send(d) for d in devices)))
+
+    async def room_history(
+        self,
+        room_id: UUID,
+        attribute: Attribute | None = None,
+        start_ms: int | None = None,
+        end_ms: int | None = None,
+        concurrency: int | None = None,
+        max_events: int | None = None,
+    ) -> List[dict]:
+        """History events of every device in a room, newest first.
+
+        The devices' event streams are combined by :func:`merge.amerge_events`,
+        which drops events seen twice; each device reads its next page ahead,
+        at most `concurrency` of them at a time (defaults to
+        `history_concurrency`). Every device's history is paged through,
+        capped at `max_events` each.
+        """
+        device_ids = await self._room_device_ids(room_id)
+        return [self._event_dict(item) async for item in self._merged_history(
+            device_ids, attribute, start_ms, end_ms, max_events, concurrency)]
+
+    async def _room_device_ids(self, room_id: UUID) -> List[UUID]:
+        devices = await self.get_devices_short(
+            room_id=room_id,
+            include_status=False,
+        )
+        return [d["deviceId"] for d in devices]
+
+    async def _history_items(self, device_id: UUID | None, attribute: Attribute | None, start_ms: int | None,
+                             end_ms: int | None, max_events: int | None = None,
+                             on_page: Callable[[int], Awaitable[None]] | None = None) -> AsyncIterator[HistoryItem]:
+        """History of one device (or all, for None), newest first, from the store when there is one."""
+        store = self.store
+        if store is not None and device_id is not None and start_ms is not None and end_ms is not None:
+            await self._sync_store(store, device_id, start_ms, end_ms, on_page=on_page)
+            events = store.iter_events(device_id, start_ms, end_ms, attribute=attribute, limit=max_events)
+            while page := await asyncio.to_thread(lambda: list(islice(events, 500))):
+                for item in page:
+                    yield item
+            return
+        async for item in self.iter_event_history(
+            device_id=device_id,
+            attribute=attribute,
+            paging_after_epoch=start_ms,
+            paging_before_epoch=end_ms,
+            max_events=max_events,
+            on_page=on_page,
+        ):
+            yield item
+
+    async def _merged_history(self, device_ids: Sequence[UUID | None], attribute: Attribute | None,
+                              start_ms: int | None, end_ms: int | None, max_events: int | None = None,
+                              concurrency: int | None = None,
+                              on_page: Callable[[int], Awaitable[None]] | None = None,
+                              on_done: Callable[[int], Awaitable[None]] | None = None) -> AsyncIterator[HistoryItem]:
+        """History of every device, merged newest first, at most `concurrency` devices reading at a time.
+
+        `on_done` is awaited with the index in `device_ids` of each device finished.
+        """
+        limit = asyncio.Semaphore(max(1, concurrency or self.history_concurrency))
+        streams = [aread_ahead(self._history_items(d, attribute, start_ms, end_ms, max_events, on_page), limit)
+                   for d in device_ids]
+        async for item in amerge_events(streams, on_done):
+            yield item
+
+    async def history(
+        self,
+        delta_start: str,
+        delta_end: str | None = None,
+        device_id: UUID | None = None,
+        room_id: UUID | None = None,
+        attribute: Attribute | None = None,
+        granularity: Granularity = "hourly",
+        aggregate: Aggregate = "raw",
+        max_events: int | None = None,
+        max_points: int | None = None,
+        progress: ProgressCallback | None = None,
+        partial: Callable[[List[dict]], Awaitable[None]] | None = None,
+    ) -> List[dict]:
+        """Fetch history for a device or room using ISO durations.
+
+        Events are merged and aggregated as they stream by, as in
+        :meth:`api.Location.history`. `progress` is awaited after every page
+        read and every device finished, that is once its last event is merged.
+        For a room, `partial` is awaited with the result so far each time
+        another device with events in the range is finished (but the last): it
+        covers every device back to that device's oldest event. With an event
+        store, the devices synced before a cancellation stay synced.
+        """
+        await self.ready()
+        start_ms, end_ms = self._calc_epoch_range(delta_start, delta_end)
+        aggregator = _HistoryAggregator(granularity, aggregate, max_points)
+        device_ids: Sequence[UUID | None] = await self._room_device_ids(room_id) if room_id is not None else [device_id]
+        tracker = _HistoryProgress(progress, len(device_ids))
+        with_events: set[UUID] = set()
+
+        async def device_done(i: int) -> None:
+            await tracker.device_done()
+            if partial is not None and tracker.devices_done < len(device_ids) and device_ids[i] in with_events:
+                await partial(aggregator.result())
+
+        async for item in self._merged_history(device_ids, attribute, start_ms, end_ms, max_events,
+                                               on_page=tracker.page, on_done=device_done):
+            with_events.add(item.device_id)
+            aggregator.add_item(item)
+
+        return aggregator.result()
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+
+import httpx
+
+from decode import loads
+from metrics import Metrics
+from scheduler import RequestScheduler
+from singleflight import AsyncSingleFlight, request_key
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCustomSession:
+    """
+    asyncio counterpart of :class:`custom_session.CustomSession` built on a pooled ``httpx.AsyncClient``.
+    Connections are kept alive between calls, so concurrent tool calls share a small
+    pool of sockets instead of opening one per request. By default every connection
+    the pool may open is also kept alive, so a burst of calls does not close and
+    reopen connections past a lower keep-alive limit.
+    """
+
+    def __init__(self, auth: str, base_url: str = "https://api.smartthings.com/",
+                 max_connections: int = 20, max_keepalive_connections: int | None = None,
+                 keepalive_expiry: float = 30.0, timeout: float = 30.0,
+                 scheduler: RequestScheduler | None = None, metrics: Metrics | None = None, **kwargs):
+        self.base_url = base_url
+        self.scheduler = scheduler or RequestScheduler()
+        self.metrics = metrics
+        self.singleflight = AsyncSingleFlight()
+        self.headers = {
+            'Accept': 'application/vnd.smartthings+json;v=20170916',
+            'Authorization': "Bearer " + auth,
+        }
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=(max_connections if max_keepalive_connections is None
+                                                         else max_keepalive_connections),
+                              keepalive_expiry=keepalive_expiry)
+        self.client = httpx.AsyncClient(base_url=base_url, headers=self.headers, limits=limits,
+                                        timeout=timeout, **kwargs)
+
+    async def _scheduled(self, method: str, url: str, send) -> httpx.Response:
+        """Pace `send` through the scheduler and retry it while the scheduler allows."""
+        attempt = 0
+        while True:
+            wait = self.scheduler.reserve(url)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            started = time.perf_counter()
+            try:
+                res = await send()
+            except httpx.TransportError as e:
+                self._observe(method, url, "error", started, wait)
+                delay = self.scheduler.retry_delay(method, url, attempt)
+                if delay is None:
+                    raise
+                logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.2f}s")
+            else:
+                self._observe(method, url, res.status_code, started, wait, len(res.content))
+                if res.status_code <= 299:
+                    return res
+                delay = self.scheduler.retry_delay(method, url, attempt, res.status_code,
+                                                   res.headers.get("Retry-After"))
+                if delay is None:
+                    logger.error(f"{method} request failed with status code {res.status_code}: {res.text}")
+                    res.raise_for_status()
+                    return res
+                logger.warning(f"{method} {url} returned {res.status_code}, retrying in {delay:.2f}s")
+            if self.metrics is not None:
+                self.metrics.observe_retry(method, url)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _observe(self, method: str, url: str, status: int | str, started: float, wait: float,
+                 nbytes: int = 0) -> None:
+        if self.metrics is not None:
+            self.metrics.observe_upstream(method, url, status, time.perf_counter() - started, nbytes)
+            if wait > 0:
+                self.metrics.observe_wait(method, url, wait)
+
+    async def get(self, url, **kwargs) -> httpx.Response:
+        try:
+            return await self._scheduled("GET", url, lambda: self.client.get(url, **kwargs))
+
+        except Exception as e:
+            logger.error(f"Error occurred while making GET request: {e}")
+            raise
+
+    async def post(self, url, data=None, json=None, **kwargs) -> httpx.Response:
+        try:
+            logger.info(f"POST request to {self.base_url + url} with {data=} and {json=}")
+
+            return await self._scheduled("POST", url, lambda: self.client.post(url, data=data, json=json, **kwargs))
+
+        except Exception as e:
+            logger.error(f"Error occurred while making POST request: {e}")
+            raise
+
+    async def get_json(self, url, **kwargs):
+        """
+        Convenience method to get JSON response from a GET request.
+        Identical concurrent requests share one upstream call and its parsed result.
+        """
+        return await self.singleflight.do(request_key(url, kwargs), lambda: self._get_json(url, **kwargs))
+
+    async def _get_json(self, url, **kwargs):
+        response = await self.get(url, **kwargs)
+        try:
+            return loads(response.content)
+        except ValueError:
+            logger.error(f"Failed to decode JSON from response: {response.text}")
+            return {"error": "Failed to decode response", "status": response.status_code, "text": response.text}
+
+    async def post_json(self, url, data=None, json=None, **kwargs):
+        """
+        Convenience method to get JSON response from a POST request.
+        """
+        response = await self.post(url, data=data, json=json, **kwargs)
+        try:
+            return response.json()
+        except ValueError:
+            logger.error(f"Failed to decode JSON from response: {response.text}")
+            return {"error": "Failed to decode response", "status": response.status_code, "text": response.text}
+
+    async def aclose(self):
+        """
+        Close the underlying connection pool.
+        """
+        await self.client.aclose()
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Collection, Generic, Self, Sequence, TypeVar, overload
+from uuid import UUID
+
+from st.device import DeviceItem
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+_NONE: frozenset[int] = frozenset()
+
+
+class DeviceIndex:
+    """Inverted index of a device list for the ``devices`` query filters.
+
+    Maps each capability, room, category and connection type to the
+    positions of the devices that have it, so a filtered listing is a few
+    set intersections (or a union, for "any of these capabilities") instead
+    of a scan. Positions rather than ids keep the set operations and the
+    final ordering in C: UUIDs hash and compare in Python.
+    """
+
+    def __init__(self, devices: Sequence[DeviceItem]):
+        self._devices = tuple(devices)
+        by_capability, by_room = defaultdict(set), defaultdict(set)
+        by_category, by_connection_type = defaultdict(set), defaultdict(set)
+        for i, device in enumerate(self._devices):
+            by_room[device.room_id].add(i)
+            by_connection_type[device.connection_type].add(i)
+            for component in device.components:
+                for capability in component.capabilities:
+                    by_capability[capability.id].add(i)
+                for category in component.categories:
+                    by_category[category.name].add(i)
+        self.by_capability = {k: frozenset(v) for k, v in by_capability.items()}
+        self.by_room = {k: frozenset(v) for k, v in by_room.items()}
+        self.by_category = {k: frozenset(v) for k, v in by_category.items()}
+        self.by_connection_type = {k: frozenset(v) for k, v in by_connection_type.items()}
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def select(self, capabilities: Collection[str] = (), any_capability: bool = False,
+               room_id: UUID | None = None, category: str | None = None,
+               connection_type: str | None = None) -> list[DeviceItem]:
+        """Devices matching every given filter, in list order.
+
+        All `capabilities` must be present, or any one of them with `any_capability`.
+        """
+        sets = []
+        if capabilities:
+            matches = [self.by_capability.get(c, _NONE) for c in capabilities]
+            sets.append(_NONE.union(*matches) if any_capability else min(matches, key=len).intersection(*matches))
+        if room_id is not None:
+            sets.append(self.by_room.get(room_id, _NONE))
+        if category is not None:
+            sets.append(self.by_category.get(category, _NONE))
+        if connection_type is not None:
+            sets.append(self.by_connection_type.get(connection_type, _NONE))
+        if not sets:
+            return list(self._devices)
+        sets.sort(key=len)
+        devices = self._devices
+        return [devices[i] for i in sorted(sets[0].intersection(*sets[1:]))]
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Immutable view of a location's rooms and devices at one point in time."""
+    rooms: dict[UUID, str]
+    devices: Sequence[DeviceItem]
+    fetched_at: float
+    device_ids: frozenset[UUID] = field(init=False)
+    _index: DeviceIndex | None = field(init=False, default=None, repr=False, compare=False)
+    _index_lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "device_ids", frozenset(d.device_id for d in self.devices))
+
+    @property
+    def index(self) -> DeviceIndex:
+        """Built once, on first use; concurrent first readers wait for the same build."""
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    object.__setattr__(self, "_index", DeviceIndex(self.devices))
+        return self._index  # type: ignore[return-value]
+
+
+CatalogData = tuple[dict[UUID, str], Sequence[DeviceItem]]
+
+
+class _CatalogBase:
+    """Staleness bookkeeping shared by the thread and asyncio catalogs.
+
+    A snapshot older than `max_age` is still served, but triggers a background
+    refresh (stale-while-revalidate). A new snapshot replaces the old one in a
+    single attribute assignment, so readers never see a half-built catalog.
+    """
+
+    def __init__(self, max_age: float = 300.0, min_refresh_interval: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_age = max_age
+        self.min_refresh_interval = min_refresh_interval
+        self._clock = clock
+        self._snapshot: CatalogSnapshot | None = None
+
+    def _build(self, data: CatalogData, started_at: float) -> CatalogSnapshot:
+        rooms, devices = data
+        snapshot = CatalogSnapshot(rooms=dict(rooms), devices=tuple(devices), fetched_at=started_at)
+        self._snapshot = snapshot
+        logger.info(f"Device catalog refreshed: {len(snapshot.rooms)} rooms, {len(snapshot.devices)} devices")
+        return snapshot
+
+    def _is_stale(self, snapshot: CatalogSnapshot) -> bool:
+        return self._clock() - snapshot.fetched_at >= self.max_age
+
+    def _fresh_enough(self, if_older_than: float | None) -> CatalogSnapshot | None:
+        snapshot = self._snapshot
+        if snapshot is not None and if_older_than is not None and self._clock() - snapshot.fetched_at < if_older_than:
+            return snapshot
+        return None
+
+    def peek(self) -> CatalogSnapshot | None:
+        """Current snapshot without triggering any fetch."""
+        return self._snapshot
+
+    def fresh(self) -> CatalogSnapshot | None:
+        """Current snapshot if it is younger than `max_age`, without triggering any fetch."""
+        snapshot = self._snapshot
+        return snapshot if snapshot is not None and not self._is_stale(snapshot) else None
+
+    def seed(self, data: CatalogData, age: float) -> CatalogSnapshot | None:
+        """Install data that was fetched `age` seconds ago elsewhere, e.g. loaded from disk.
+
+        Ignored once a snapshot is loaded. An old enough seed is stale right
+        away and is served only until the next refresh completes.
+        """
+        if self._snapshot is not None:
+            return None
+        return self._build(data, self._clock() - age)
+
+
+class DeviceCatalog(_CatalogBase):
+    """Rooms and devices of a location, refreshed on a background thread."""
+
+    def __init__(self, fetch: Callable[[], CatalogData], **kwargs):
+        super().__init__(**kwargs)
+        self._fetch = fetch
+        self._refresh_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+        self._generation = 0
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Current snapshot; blocks only for the very first load."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.refresh()
+        if self._is_stale(snapshot):
+            self.refresh_in_background()
+        return snapshot
+
+    def refresh(self, if_older_than: float | None = None) -> CatalogSnapshot:
+        """Fetch a new snapshot now, unless one younger than `if_older_than` seconds exists.
+
+        Callers that arrive while a fetch is running share its result.
+        """
+        if (snapshot := self._fresh_enough(if_older_than)) is not None:
+            return snapshot
+        generation = self._generation
+        with self._refresh_lock:
+            if self._generation != generation and self._snapshot is not None:
+                return self._snapshot
+            started_at = self._clock()
+            snapshot = self._build(self._fetch(), started_at)
+            self._generation += 1
+            return snapshot
+
+    def refresh_in_background(self) -> None:
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="catalog-refresh", daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"Background catalog refresh failed, keeping the previous snapshot: {e}")
+        finally:
+            with self._state_lock:
+                self._refreshing = False
+
+
+class AsyncDeviceCatalog(_CatalogBase):
+    """asyncio counterpart of :class:`DeviceCatalog`, refreshed on a background task."""
+
+    def __init__(self, fetch: Callable[[], Awaitable[CatalogData]], **kwargs):
+        super().__init__(**kwargs)
+        self._fetch = fetch
+        self._task: asyncio.Task[CatalogSnapshot] | None = None
+
+    async def snapshot(self) -> CatalogSnapshot:
+        """Current snapshot; awaits the network only for the very first load."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return await self.refresh()
+        if self._is_stale(snapshot):
+            self.refresh_in_background()
+        return snapshot
+
+    async def refresh(self, if_older_than: float | None = None) -> CatalogSnapshot:
+        """Fetch a new snapshot now, unless one younger than `if_older_than` seconds exists."""
+        if (snapshot := self._fresh_enough(if_older_than)) is not None:
+            return snapshot
+        return await asyncio.shield(self._start())
+
+    def refresh_in_background(self) -> None:
+        self._start()
+
+    def _start(self) -> "asyncio.Task[CatalogSnapshot]":
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._load())
+            self._task.add_done_callback(self._log_failure)
+        return self._task
+
+    async def _load(self) -> CatalogSnapshot:
+        started_at = self._clock()
+        return self._build(await self._fetch(), started_at)
+
+    @staticmethod
+    def _log_failure(task: "asyncio.Task[CatalogSnapshot]") -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Catalog refresh failed, keeping the previous snapshot: {task.exception()}")
+
+
+class CatalogField(Generic[V]):
+    """Attribute backed by one field of the owner's ``_snapshot()``.
+
+    Setting it pins a value on the instance, which then takes precedence
+    over the catalog.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    @overload
+    def __get__(self, obj: None, objtype: Any = None) -> Self: ...
+
+    @overload
+    def __get__(self, obj: object, objtype: Any = None) -> V: ...
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if self.name in obj.__dict__:
+            return obj.__dict__[self.name]
+        return getattr(obj._snapshot(), self.name)
+
+    def __set__(self, obj: object, value: V) -> None:
+        obj.__dict__[self.name] = value
@@ -2,39 +2,113 @@
 
 from requests import Session
 import logging
+import socket
+import time
+from typing import cast
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+from decode import loads
+from metrics import Metrics
+from scheduler import RequestScheduler
+from singleflight import SingleFlight, request_key
 
 logger = logging.getLogger(__name__)
 
 
+class PooledAdapter(HTTPAdapter):
+    """``HTTPAdapter`` whose sockets also enable TCP keep-alive, next to urllib3's ``TCP_NODELAY``.
+
+    Idle pooled connections to the API can sit unused for minutes; keep-alive
+    probes let the OS notice a silently dropped one before a request is sent on it.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        # urllib3 declares it ClassVar[Final[...]], which type checkers read as an opaque "Final"
+        defaults = cast(list[tuple[int, int, int | bytes]], HTTPConnection.default_socket_options)
+        kwargs.setdefault("socket_options", defaults + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)])
+        super().init_poolmanager(*args, **kwargs)
+
+
 class CustomSession(Session):
     """
-    Custom session class to handle session management for SmartThings API.
-    This class is a placeholder for any custom session handling logic that may be needed.
+    ``requests.Session`` for the SmartThings API with pacing, retries and an explicit connection pool.
+
+    `Location` calls it from many threads at once (FastMCP worker threads,
+    room history and batch commands). The pool keeps up to `max_connections`
+    connections alive per host; with `pool_block` a thread that finds all of
+    them busy waits for one, rather than opening a connection that is thrown
+    away after a single request. Retries are left to the scheduler.
     """
 
-    def __init__(self, auth:str, base_url:str = "https://api.smartthings.com/", **kwargs):
+    def __init__(self, auth:str, base_url:str = "https://api.smartthings.com/",
+                 max_connections: int = 20, pool_block: bool = True, timeout: float = 30.0,
+                 scheduler: RequestScheduler | None = None, metrics: Metrics | None = None, **kwargs):
+        super().__init__(**kwargs)
         self.base_url = base_url
+        self.timeout = timeout
+        self.scheduler = scheduler or RequestScheduler()
+        self.metrics = metrics
+        self.singleflight = SingleFlight()
         self.headers = {
             'Accept': 'application/vnd.smartthings+json;v=20170916',
             'Authorization': "Bearer " + auth,
             # 'cache-control': "no-cache",
         }
-        super().__init__(**kwargs)
+        adapter = PooledAdapter(pool_maxsize=max_connections, pool_block=pool_block, max_retries=0)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def _scheduled(self, method: str, url: str, send) -> requests.Response:
+        """Pace `send` through the scheduler and retry it while the scheduler allows."""
+        attempt = 0
+        while True:
+            wait = self.scheduler.reserve(url)
+            if wait > 0:
+                time.sleep(wait)
+            started = time.perf_counter()
+            try:
+                res = send()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._observe(method, url, "error", started, wait)
+                delay = self.scheduler.retry_delay(method, url, attempt)
+                if delay is None:
+                    raise
+                logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.2f}s")
+            else:
+                self._observe(method, url, res.status_code, started, wait, len(res.content))
+                if res.status_code <= 299:
+                    return res
+                delay = self.scheduler.retry_delay(method, url, attempt, res.status_code,
+                                                   res.headers.get("Retry-After"))
+                if delay is None:
+                    logger.error(f"{method} request failed with status code {res.status_code}: {res.text}")
+                    res.raise_for_status()
+                    return res
+                logger.warning(f"{method} {url} returned {res.status_code}, retrying in {delay:.2f}s")
+            if self.metrics is not None:
+                self.metrics.observe_retry(method, url)
+            time.sleep(delay)
+            attempt += 1
+
+    def _observe(self, method: str, url: str, status: int | str, started: float, wait: float,
+                 nbytes: int = 0) -> None:
+        if self.metrics is not None:
+            self.metrics.observe_upstream(method, url, status, time.perf_counter() - started, nbytes)
+            if wait > 0:
+                self.metrics.observe_wait(method, url, wait)
 
     def get(self, url, **kwargs):
         """
-        Override the get method to add custom behavior if needed.
+        Override the get method to add pacing and retries.
         """
+        kwargs.setdefault("timeout", self.timeout)
         # Call the parent class's get method
         try:
-            res = super().get(self.base_url + url, **kwargs)
-            if res.status_code > 299:
-                logger.error(f"GET request failed with status code {res.status_code}: {res.text}")
-                res.raise_for_status()
-            return res
-        
+            return self._scheduled("GET", url, lambda: super(CustomSession, self).get(self.base_url + url, **kwargs))
+
         except Exception as e:
             # Handle exceptions as needed
             logger.error(f"Error occurred while making GET request: {e}")
@@ -42,18 +116,16 @@ class CustomSession(Session):
 
     def post(self, url, data=None, json=None, **kwargs):
         """
-        Override the post method to add custom behavior if needed.
+        Override the post method to add pacing and retries on 429.
         """
+        kwargs.setdefault("timeout", self.timeout)
         # Call the parent class's post method
         try:
             logger.info(f"POST request to {self.base_url + url} with {data=} and {json=}")
 
-            res = super().post(self.base_url + url, data=data, json=json, **kwargs)
-            if res.status_code > 299:
-                logger.error(f"POST request failed with status code {res.status_code}: {res.text}")
-                res.raise_for_status()
-            return res
-        
+            return self._scheduled("POST", str(url), lambda: super(CustomSession, self).post(
+                self.base_url + url, data=data, json=json, **kwargs))
+
         except Exception as e:
             # Handle exceptions as needed
             logger.error(f"Error occurred while making POST request: {e}")
@@ -62,10 +134,14 @@ class CustomSession(Session):
     def get_json(self, url, **kwargs):
         """
         Convenience method to get JSON response from a GET request.
+        Identical concurrent requests share one upstream call and its parsed result.
         """
+        return self.singleflight.do(request_key(url, kwargs), lambda: self._get_json(url, **kwargs))
+
+    def _get_json(self, url, **kwargs):
         response = self.get(url, **kwargs)
         try:
-            return response.json()
+            return loads(response.content)
         except ValueError:
             logger.error(f"Failed to decode JSON from response: {response.text}")
             return {"error": "Failed to decode response", "status": response.status_code, "text": response.text}
@@ -90,4 +166,4 @@ class CustomSession(Session):
         # Add any additional cleanup logic if necessary
         # For example, clearing cookies or session data
         self.cookies.clear()
-        self.headers.clear()
\ No newline at end of file
+        self.headers.clear()
@@ -0,0 +1,79 @@
+import json
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, List, NamedTuple, Protocol
+from uuid import UUID
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # optional: fall back to the standard library parser
+    loads = json.loads
+
+
+# Device ids repeat on every event of a page, parse each one once.
+uuid = lru_cache(maxsize=4096)(UUID)
+
+
+class HistoryEvent(NamedTuple):
+    """The fields of an ``EventHistoryItem`` that the history tools read.
+
+    Attribute names match the pydantic model, so code written against
+    ``EventHistoryItem`` (event dicts, filters, the event store) accepts both.
+    """
+    device_id: UUID
+    time: datetime
+    component: str
+    capability: str
+    attribute: str
+    value: Any
+    unit: str | None
+    epoch: int
+    hash: int
+
+
+class HistoryItem(Protocol):
+    """A history event as the helpers read it: an ``EventHistoryItem`` or a :class:`HistoryEvent`."""
+    @property
+    def device_id(self) -> UUID: ...
+    @property
+    def time(self) -> datetime: ...
+    @property
+    def component(self) -> str: ...
+    @property
+    def capability(self) -> str: ...
+    @property
+    def attribute(self) -> str: ...
+    @property
+    def value(self) -> Any: ...
+    @property
+    def unit(self) -> str | None: ...
+    @property
+    def epoch(self) -> int: ...
+    @property
+    def hash(self) -> int: ...
+
+
+class HistoryPage(NamedTuple):
+    items: List[HistoryEvent]
+    next_href: str | None
+
+
+def history_page(data: dict) -> HistoryPage:
+    """Decode a ``v1/history/devices`` page without model validation.
+
+    Meant for trusted SmartThings responses: only the fields above are
+    read, and their types are taken as they come from the JSON parser.
+    """
+    items = [HistoryEvent(uuid(item["deviceId"]), datetime.fromisoformat(item["time"]), item["component"],
+                          item["capability"], item["attribute"], item["value"], item.get("unit"),
+                          item["epoch"], item["hash"])
+             for item in data["items"]]
+    return HistoryPage(items, next_href(data))
+
+
+def next_href(data: dict) -> str | None:
+    """``_links.next.href`` of a paged response, if any."""
+    links = data.get("_links") or {}
+    link = links.get("next")
+    return link["href"] if link else None
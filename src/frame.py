@@ -0,0 +1,139 @@
+import math
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Hashable, Iterable, Iterator, List
+from uuid import UUID
+
+from aggregate import LOCAL_EPOCH, MICROSECOND
+from decode import HistoryItem
+
+UTC_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+NAN = float("nan")
+
+
+class _Dictionary:
+    """Distinct values of a dictionary-encoded column; rows store their index."""
+
+    def __init__(self):
+        self.values: List[Any] = []
+        self._codes: dict[Hashable, int] = {}
+
+    def code(self, value: Any) -> int:
+        # keyed with the type so that True, 1 and 1.0 stay distinct values
+        try:
+            key = (type(value), value)
+            code = self._codes.get(key)
+        except TypeError:  # unhashable (e.g. a dict value), store as is
+            key, code = None, None
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            if key is not None:
+                self._codes[key] = code
+        return code
+
+
+class HistoryFrame:
+    """Columnar event history.
+
+    Numbers live in typed arrays: the API ``epoch`` (ms) and ``hash``, the
+    event ``time`` as UTC microseconds, and the value as float64 (NaN when it
+    is not numeric). Device, component, capability, attribute and unit are
+    dictionary-encoded, as are values that are not floats, so every row
+    converts back exactly to the dict returned by ``event_history``. Times
+    are returned in the zone of the first row appended.
+
+    Rows take under 60 bytes, against several hundred for an event dict and
+    its objects, so whole ranges can be held for aggregation and only turned
+    into dicts where a caller needs them.
+    """
+
+    def __init__(self):
+        self.epoch = array('q')
+        self.hash = array('q')
+        self.time = array('q')
+        self.value = array('d')
+        self.tz: Any = None
+        # UTC offset of `tz`, None for naive times; time + offset is wall-clock time.
+        self.offset: timedelta | None = None
+        self._raw = array('i')
+        self._raw_values = _Dictionary()
+        self._columns = {name: (array('i'), _Dictionary())
+                         for name in ("deviceId", "component", "capability", "attribute", "unit")}
+
+    @classmethod
+    def from_items(cls, items: Iterable[HistoryItem]) -> "HistoryFrame":
+        """Frame of ``EventHistoryItem`` models or ``decode.HistoryEvent`` tuples."""
+        frame = cls()
+        frame.extend(items)
+        return frame
+
+    def __len__(self) -> int:
+        return len(self.epoch)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns, excluding the distinct values."""
+        arrays = [self.epoch, self.hash, self.time, self.value, self._raw] + [c for c, _ in self._columns.values()]
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    def append(self, device_id: UUID, time: datetime, component: str, capability: str, attribute: str,
+               value: Any, unit: str | None, epoch: int, hash: int) -> None:
+        if not self.epoch:
+            self.tz, self.offset = time.tzinfo, time.utcoffset()
+
+        if self.offset is None:
+            self.time.append((time - LOCAL_EPOCH) // MICROSECOND)
+        else:
+            self.time.append(math.floor(time.timestamp()) * 1_000_000 + time.microsecond)
+        self.epoch.append(epoch)
+        self.hash.append(hash)
+
+        if type(value) is float:
+            self.value.append(value)
+            self._raw.append(-1)
+        else:
+            try:
+                self.value.append(float(value))
+            except (TypeError, ValueError):
+                self.value.append(NAN)
+            self._raw.append(self._raw_values.code(value))
+
+        for name, field in (("deviceId", device_id), ("component", component), ("capability", capability),
+                            ("attribute", attribute), ("unit", None if unit == "" else unit)):
+            codes, values = self._columns[name]
+            codes.append(values.code(field))
+
+    def add_item(self, item: Any) -> None:
+        self.append(item.device_id, item.time, item.component, item.capability, item.attribute,
+                    item.value, item.unit, item.epoch, item.hash)
+
+    def extend(self, items: Iterable[HistoryItem]) -> None:
+        for item in items:
+            self.add_item(item)
+
+    def _datetime(self, time_us: int) -> datetime:
+        if self.offset is None:
+            return LOCAL_EPOCH + time_us * MICROSECOND
+        return (UTC_EPOCH + time_us * MICROSECOND).astimezone(self.tz)
+
+    def iter_dicts(self) -> Iterator[dict]:
+        """Rows in the shape of ``LocationBase._event_dict``."""
+        columns = [(codes, values.values) for codes, values in self._columns.values()]
+        raw_values = self._raw_values.values
+        for i in range(len(self)):
+            device, component, capability, attribute, unit = (values[codes[i]] for codes, values in columns)
+            raw = self._raw[i]
+            yield {
+                'deviceId': device,
+                'time': self._datetime(self.time[i]),
+                'component': component,
+                'capability': capability,
+                'attribute': attribute,
+                'value': self.value[i] if raw < 0 else raw_values[raw],
+                'unit': unit,
+            }
+
+    def to_dicts(self) -> List[dict]:
+        return list(self.iter_dicts())
+
@@ -0,0 +1,125 @@
+import asyncio
+import heapq
+from concurrent.futures import Executor
+from itertools import islice
+from operator import attrgetter
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Hashable, Iterable, Iterator, List, Sequence, TypeVar
+
+from decode import HistoryItem
+
+T = TypeVar("T")
+
+_epoch = attrgetter("epoch")
+
+
+class _Unique:
+    """Drops an event whose ``(epoch, hash)`` was already seen for the same device.
+
+    Like the event store's primary key, the device is part of the key. Only
+    the keys of the current epoch are kept, as a newest-first stream brings
+    every copy of an event together.
+    """
+
+    def __init__(self):
+        self.epoch: int | None = None
+        self.keys: set[Hashable] = set()
+
+    def first(self, item: HistoryItem) -> bool:
+        if item.epoch != self.epoch:
+            self.epoch = item.epoch
+            self.keys.clear()
+        key = (item.hash, item.device_id)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+
+def merge_events(streams: Iterable[Iterable[HistoryItem]]) -> Iterator[HistoryItem]:
+    """Newest-first event streams (one per device) as a single newest-first stream.
+
+    A lazy k-way merge: the heap holds the next event of every stream, so no
+    stream is read further ahead than its current event. Duplicate events are
+    dropped. Events of one epoch keep the order of their streams.
+    """
+    unique = _Unique()
+    return (item for item in heapq.merge(*streams, key=_epoch, reverse=True) if unique.first(item))
+
+
+async def amerge_events(streams: Sequence[AsyncGenerator[HistoryItem, None]],
+                        on_done: Callable[[int], Awaitable[None]] | None = None) -> AsyncIterator[HistoryItem]:
+    """asyncio counterpart of :func:`merge_events`.
+
+    `on_done` is awaited with a stream's index each time a stream runs out,
+    after its last event was consumed. Streams still open when the merge stops
+    are closed.
+    """
+    unique = _Unique()
+    heap: List[tuple[int, int, HistoryItem]] = []
+    try:
+        for i, stream in enumerate(streams):
+            item = await anext(stream, None)
+            if item is not None:
+                heap.append((-item.epoch, i, item))
+            elif on_done is not None:
+                await on_done(i)
+        heapq.heapify(heap)
+        while heap:
+            _, i, item = heap[0]
+            if unique.first(item):
+                yield item
+            following = await anext(streams[i], None)
+            if following is not None:
+                heapq.heapreplace(heap, (-following.epoch, i, following))
+                continue
+            heapq.heappop(heap)
+            if on_done is not None:
+                await on_done(i)
+    finally:
+        for stream in streams:
+            await stream.aclose()
+
+
+def read_ahead(items: Iterator[T], executor: Executor, size: int = 500) -> Iterator[T]:
+    """Yield `items`, reading the next `size` of them on `executor` while the current ones are consumed.
+
+    The first read is submitted right away, so the streams of a merge start
+    at once. At most two chunks of a stream are held at a time.
+    """
+    future = executor.submit(lambda: list(islice(items, size)))
+
+    def chunks() -> Iterator[T]:
+        nonlocal future
+        while chunk := future.result():
+            future = executor.submit(lambda: list(islice(items, size)))
+            yield from chunk
+
+    return chunks()
+
+
+def aread_ahead(items: AsyncIterator[T], limit: asyncio.Semaphore,
+                size: int = 500) -> AsyncGenerator[T, None]:
+    """asyncio counterpart of :func:`read_ahead`; `limit` bounds the streams reading at once."""
+
+    async def take() -> List[T]:
+        chunk: List[T] = []
+        async with limit:
+            async for item in items:
+                chunk.append(item)
+                if len(chunk) >= size:
+                    break
+        return chunk
+
+    task = asyncio.ensure_future(take())
+
+    async def chunks() -> AsyncGenerator[T, None]:
+        nonlocal task
+        try:
+            while chunk := await task:
+                task = asyncio.ensure_future(take())
+                for item in chunk:
+                    yield item
+        finally:
+            task.cancel()
+
+    return chunks()
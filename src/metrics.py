@@ -0,0 +1,188 @@
+import re
+import threading
+from bisect import bisect_left
+from typing import Callable, Iterable
+from urllib.parse import urlsplit
+
+# Upper bounds of the latency buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_ID = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+
+
+def endpoint_template(url: str) -> str:
+    """``v1/devices/{id}/status`` for any device id; the query string is dropped."""
+    path = urlsplit(url).path.strip("/")
+    return "/".join("{id}" if _ID.match(segment) else segment for segment in path.split("/"))
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, in the cumulative layout Prometheus expects."""
+
+    def __init__(self, buckets: Iterable[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[int]:
+        total, result = 0, []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate by linear interpolation inside the bucket, like PromQL's ``histogram_quantile``."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, seen = 0.0, 0
+        for upper, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]  # in the +Inf bucket: the largest finite bound is all we know
+
+    def summary(self) -> dict:
+        return {"count": self.count, "sum": self.sum,
+                "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99)}
+
+
+class Metrics:
+    """Counters and latency histograms of upstream requests and tool calls.
+
+    Sessions record each request attempt by method and endpoint template, the
+    server records each tool call. Components with their own counters (status
+    cache, request coalescing, state mirror) are registered as collectors and
+    read when the metrics are exported. Safe to update from several threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.upstream: dict[tuple[str, str], Histogram] = {}
+        self.upstream_status: dict[tuple[str, str, str], int] = {}
+        self.upstream_bytes: dict[tuple[str, str], int] = {}
+        self.upstream_wait: dict[tuple[str, str], float] = {}
+        self.retries: dict[tuple[str, str], int] = {}
+        self.tools: dict[str, Histogram] = {}
+        self.tool_errors: dict[str, int] = {}
+        self.tool_bytes: dict[str, int] = {}
+        self._collectors: dict[str, Callable[[], dict]] = {}
+
+    def observe_upstream(self, method: str, url: str, status: int | str, seconds: float, nbytes: int) -> None:
+        """One request attempt; `status` is "error" when no response was received."""
+        key = (method, endpoint_template(url))
+        with self._lock:
+            histogram = self.upstream.get(key)
+            if histogram is None:
+                histogram = self.upstream[key] = Histogram()
+            histogram.observe(seconds)
+            status_key = (*key, str(status))
+            self.upstream_status[status_key] = self.upstream_status.get(status_key, 0) + 1
+            self.upstream_bytes[key] = self.upstream_bytes.get(key, 0) + nbytes
+
+    def observe_wait(self, method: str, url: str, seconds: float) -> None:
+        """Time a request spent held back by the client-side rate limits."""
+        key = (method, endpoint_template(url))
+        with self._lock:
+            self.upstream_wait[key] = self.upstream_wait.get(key, 0.0) + seconds
+
+    def observe_retry(self, method: str, url: str) -> None:
+        key = (method, endpoint_template(url))
+        with self._lock:
+            self.retries[key] = self.retries.get(key, 0) + 1
+
+    def observe_tool(self, name: str, seconds: float, nbytes: int, error: bool = False) -> None:
+        with self._lock:
+            histogram = self.tools.get(name)
+            if histogram is None:
+                histogram = self.tools[name] = Histogram()
+            histogram.observe(seconds)
+            self.tool_bytes[name] = self.tool_bytes.get(name, 0) + nbytes
+            if error:
+                self.tool_errors[name] = self.tool_errors.get(name, 0) + 1
+
+    def register(self, name: str, collect: Callable[[], dict]) -> None:
+        """Export the numbers of ``collect()`` (e.g. a cache's ``stats()``) as gauges named after `name`."""
+        self._collectors[name] = collect
+
+    def _collected(self) -> dict[str, dict]:
+        return {name: collect() for name, collect in self._collectors.items()}
+
+    def snapshot(self) -> dict:
+        """Everything as plain JSON-friendly data, latencies summarized as p50/p90/p99."""
+        with self._lock:
+            upstream = {f"{method} {endpoint}": {
+                **histogram.summary(),
+                "status": {status: n for (m, e, status), n in self.upstream_status.items()
+                           if (m, e) == (method, endpoint)},
+                "bytes": self.upstream_bytes.get((method, endpoint), 0),
+                "wait_seconds": self.upstream_wait.get((method, endpoint), 0.0),
+                "retries": self.retries.get((method, endpoint), 0),
+            } for (method, endpoint), histogram in sorted(self.upstream.items())}
+            tools = {name: {**histogram.summary(), "errors": self.tool_errors.get(name, 0),
+                            "bytes": self.tool_bytes.get(name, 0)}
+                     for name, histogram in sorted(self.tools.items())}
+        return {"upstream": upstream, "tools": tools, **self._collected()}
+
+    def prometheus(self) -> str:
+        """Text exposition format, version 0.0.4."""
+        lines: list[str] = []
+        with self._lock:
+            _histograms(lines, "smartthings_upstream_request_duration_seconds",
+                        "Latency of SmartThings API request attempts.",
+                        {_labels(method=m, endpoint=e): h for (m, e), h in sorted(self.upstream.items())})
+            _counters(lines, "smartthings_upstream_requests_total", "SmartThings API request attempts by status.",
+                      {_labels(method=m, endpoint=e, status=s): n
+                       for (m, e, s), n in sorted(self.upstream_status.items())})
+            _counters(lines, "smartthings_upstream_response_bytes_total", "Bytes of SmartThings API responses.",
+                      {_labels(method=m, endpoint=e): n for (m, e), n in sorted(self.upstream_bytes.items())})
+            _counters(lines, "smartthings_upstream_wait_seconds_total",
+                      "Time requests were held back by client-side rate limits.",
+                      {_labels(method=m, endpoint=e): n for (m, e), n in sorted(self.upstream_wait.items())})
+            _counters(lines, "smartthings_upstream_retries_total", "Retried SmartThings API requests.",
+                      {_labels(method=m, endpoint=e): n for (m, e), n in sorted(self.retries.items())})
+            _histograms(lines, "smartthings_tool_duration_seconds", "Wall time of MCP tool calls.",
+                        {_labels(tool=name): h for name, h in sorted(self.tools.items())})
+            _counters(lines, "smartthings_tool_errors_total", "MCP tool calls that raised.",
+                      {_labels(tool=name): n for name, n in sorted(self.tool_errors.items())})
+            _counters(lines, "smartthings_tool_response_bytes_total", "Bytes of MCP tool results.",
+                      {_labels(tool=name): n for name, n in sorted(self.tool_bytes.items())})
+        for name, values in self._collected().items():
+            for key, value in _flatten(values):
+                metric = f"smartthings_{name}_{key}"
+                lines += [f"# TYPE {metric} gauge", f"{metric} {float(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{k}="{v}"' for k, v in labels.items())
+
+
+def _counters(lines: list[str], name: str, help: str, values: dict[str, float]) -> None:
+    lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+    lines += [f"{name}{{{labels}}} {value}" for labels, value in values.items()]
+
+
+def _histograms(lines: list[str], name: str, help: str, histograms: dict[str, Histogram]) -> None:
+    lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+    for labels, histogram in histograms.items():
+        bounds = [str(b) for b in histogram.buckets] + ["+Inf"]
+        lines += [f'{name}_bucket{{{labels},le="{le}"}} {n}' for le, n in zip(bounds, histogram.cumulative())]
+        lines += [f"{name}_sum{{{labels}}} {histogram.sum}", f"{name}_count{{{labels}}} {histogram.count}"]
+
+
+def _flatten(values: dict, prefix: str = "") -> Iterable[tuple[str, float]]:
+    """Numeric leaves of a stats dict, nested keys joined with underscores."""
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}_")
+        elif isinstance(value, (int, float)):  # bools included, as 0/1
+            yield f"{prefix}{key}", value
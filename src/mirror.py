@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import random
+from typing import AsyncIterator, Awaitable, Callable, Iterable
+from uuid import UUID
+
+import httpx
+
+from async_session import AsyncCustomSession
+from decode import loads
+from st.device import StatusModel
+
+logger = logging.getLogger(__name__)
+
+# component -> capability -> attribute -> state, as in DeviceStatusResponse.components
+Components = dict[str, dict[str, dict[str, StatusModel]]]
+
+
+class StateMirror:
+    """In-memory copy of every device's attribute state, kept current by device events.
+
+    The mirror only answers while it is `live`, i.e. subscribed and resynced
+    since the last disconnect. Otherwise :meth:`status` returns None and
+    callers poll the API as usual.
+    """
+
+    def __init__(self):
+        self._devices: dict[UUID, Components] = {}
+        self.live = False
+        self.events = 0
+        self.resyncs = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, device_id: UUID) -> bool:
+        return device_id in self._devices
+
+    def status(self, device_id: UUID) -> Components | None:
+        """A copy of the device's current state, or None when the mirror cannot answer."""
+        components = self._devices.get(device_id) if self.live else None
+        if components is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {component: {capability: dict(attributes) for capability, attributes in capabilities.items()}
+                for component, capabilities in components.items()}
+
+    def seed(self, device_id: UUID, components: Components) -> None:
+        """Adopt a polled status for a device the mirror has not seen yet."""
+        self._devices.setdefault(device_id, components)
+
+    def replace(self, devices: Iterable[dict]) -> None:
+        """Reset the mirror from raw ``devices?includeStatus=true`` items."""
+        mirrored: dict[UUID, Components] = {}
+        for device in devices:
+            components: Components = {}
+            for component in device.get('components', []):
+                capabilities = components[component['id']] = {}
+                for capability in component.get('capabilities', []):
+                    status = capability.get('status')
+                    if status:
+                        capabilities[capability['id']] = {attribute: StatusModel.model_validate(state)
+                                                          for attribute, state in status.items()}
+            mirrored[UUID(device['deviceId'])] = components
+        self._devices = mirrored
+        self.resyncs += 1
+
+    def apply(self, event: dict) -> bool:
+        """Apply one ``DEVICE_EVENT``; returns False for devices the mirror does not know.
+
+        Events older than the state already held for the attribute are ignored.
+        """
+        device_event = event.get('deviceEvent', event)
+        components = self._devices.get(UUID(device_event['deviceId']))
+        if components is None:
+            return False
+        attributes = components.setdefault(device_event.get('componentId', 'main'), {}) \
+            .setdefault(device_event['capability'], {})
+        previous = attributes.get(device_event['attribute'])
+        state = StatusModel.model_validate({
+            'value': device_event.get('value'),
+            'unit': device_event.get('unit', previous.unit if previous is not None else None),
+            'timestamp': event.get('eventTime'),
+        })
+        # events queued while a resync was in flight may be older than what it returned
+        if previous is None or previous.timestamp is None or state.timestamp is None \
+                or state.timestamp >= previous.timestamp:
+            attributes[device_event['attribute']] = state
+        self.events += 1
+        return True
+
+    def stats(self) -> dict:
+        return {"live": self.live, "devices": len(self._devices), "events": self.events,
+                "resyncs": self.resyncs, "hits": self.hits, "misses": self.misses}
+
+
+async def iter_sse(lines: AsyncIterator[str]) -> AsyncIterator[tuple[str, str]]:
+    """``(event, data)`` pairs of a ``text/event-stream``; comments and ids are skipped."""
+    event, data = "message", []
+    async for line in lines:
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue
+        else:
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+
+
+class DeviceEventSubscription:
+    """Keeps a :class:`StateMirror` current from a SmartThings SSE subscription.
+
+    Each connection registers a location-wide ``DEVICE_EVENT`` subscription,
+    opens its event stream and then resyncs the mirror, so nothing that
+    happened while disconnected is lost. When the stream ends, errors or stays
+    silent for `idle_timeout` seconds, the mirror stops answering and the
+    connection is retried with jittered exponential backoff.
+    """
+
+    def __init__(self, session: AsyncCustomSession, location_id: str, mirror: StateMirror,
+                 resync: Callable[[], Awaitable[Iterable[dict]]],
+                 idle_timeout: float = 300.0, backoff_base: float = 1.0, backoff_cap: float = 60.0):
+        self.session = session
+        self.location_id = location_id
+        self.mirror = mirror
+        self._resync = resync
+        self.idle_timeout = idle_timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        # A cancellation that lands while the HTTP client is opening a connection
+        # can be absorbed by its cleanup, so keep cancelling until the task ends.
+        while task is not None and not task.done():
+            task.cancel()
+            await asyncio.wait({task}, timeout=0.5)
+        self.mirror.live = False
+
+    async def run(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                await self._connect()
+                attempt = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Device event stream failed: {e}")
+                attempt += 1
+            finally:
+                self.mirror.live = False
+            delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+            logger.info(f"Reconnecting device event stream in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def _register(self) -> str:
+        # through the session, so the registration is paced, retried and measured like any other call
+        response = await self.session.post("subscriptions", json={
+            "name": "smartthings-mcp",
+            "version": 1,
+            "subscriptionFilters": [{"type": "LOCATIONIDS", "value": [str(self.location_id)],
+                                     "eventType": ["DEVICE_EVENT"]}],
+        })
+        return response.json()["registrationUrl"]
+
+    async def _connect(self) -> None:
+        url = await self._register()
+        timeout = httpx.Timeout(30.0, read=self.idle_timeout)
+        async with self.session.client.stream("GET", url, headers={"Accept": "text/event-stream"}, timeout=timeout) as response:
+            response.raise_for_status()
+            self.mirror.replace(await self._resync())
+            self.mirror.live = True
+            logger.info(f"Device event stream connected, mirroring {self.mirror.stats()['devices']} devices")
+            async for event, data in iter_sse(response.aiter_lines()):
+                if event in ("DEVICE_EVENT", "message"):
+                    self.mirror.apply(loads(data))
+        logger.warning("Device event stream closed by the server")
@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable
+
+# Requests per second and burst size of each endpoint family. These are
+# client-side guesses kept below the SmartThings per-token quota; tune them
+# through RequestScheduler(limits=...).
+DEFAULT_LIMITS: dict[str, tuple[float, int]] = {
+    "devices": (10.0, 20),
+    "history": (5.0, 10),
+    "commands": (5.0, 10),
+    "other": (5.0, 10),
+}
+
+# Status codes worth retrying for idempotent requests.
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def endpoint_family(url: str) -> str:
+    """Map a request path such as ``v1/devices/{id}/commands`` to its rate-limit family."""
+    path = url.split("?", 1)[0].lstrip("/")
+    if path.startswith("v1/history"):
+        return "history"
+    if path.endswith("/commands"):
+        return "commands"
+    if path.startswith("devices") or path.startswith("v1/devices"):
+        return "devices"
+    return "other"
+
+
+def parse_retry_after(value: str | None, now: Callable[[], datetime] = lambda: datetime.now(timezone.utc)) -> float | None:
+    """Seconds to wait from a ``Retry-After`` header given as seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - now()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket that hands out reservations instead of blocking.
+
+    :meth:`reserve` takes a token and returns how long the caller must wait
+    before using it, so the same bucket paces both threads and coroutines.
+    """
+
+    def __init__(self, rate: float, capacity: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def block(self, seconds: float) -> None:
+        """Hold back every request of this bucket for `seconds`, e.g. after a 429."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+
+class RequestScheduler:
+    """Client-side pacing and retry decisions for SmartThings requests.
+
+    Each endpoint family has its own :class:`TokenBucket`. A 429 honours
+    ``Retry-After`` and pauses the whole family. Idempotent GETs are also
+    retried on 5xx and transport errors with jittered exponential backoff.
+    POSTs are only retried on 429, because the API rejected those before
+    running any command.
+    """
+
+    def __init__(self, limits: dict[str, tuple[float, int]] | None = None, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_cap: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic, rng: random.Random | None = None):
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.buckets = {family: TokenBucket(rate, burst, clock) for family, (rate, burst) in limits.items()}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._rng = rng or random.Random()
+        self.retries = 0
+        self.throttled = 0
+
+    def reserve(self, url: str) -> float:
+        """Seconds to wait before sending a request to `url`."""
+        return self.buckets[endpoint_family(url)].reserve()
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+        return self._rng.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def retry_delay(self, method: str, url: str, attempt: int, status: int | None = None,
+                    retry_after: str | None = None) -> float | None:
+        """Delay before retrying a failed request, or None to give up.
+
+        `status` is None when the request failed before a response arrived.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if status == 429:
+            self.throttled += 1
+            delay = parse_retry_after(retry_after)
+            if delay is None:
+                delay = self.backoff(attempt)
+            self.buckets[endpoint_family(url)].block(delay)
+        elif method != "GET" or (status is not None and status not in RETRY_STATUS):
+            return None
+        else:
+            delay = parse_retry_after(retry_after) if status == 503 else None
+            if delay is None:
+                delay = self.backoff(attempt)
+        self.retries += 1
+        return delay
@@ -1,12 +1,18 @@
+from contextlib import asynccontextmanager
 from datetime import datetime
+import json
 from os import environ
-from typing import List, Literal, Optional
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Literal, Optional, Sequence, cast, get_args
 from uuid import UUID
 import logging
-from mcp.types  import ToolAnnotations
+from mcp.types  import ContentBlock, ToolAnnotations
 
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 from dotenv import load_dotenv
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
 
 from api import (
     Attribute,
@@ -15,14 +21,61 @@ from api import (
     Command,
     ComponentCategory,
     ConnectionType,
-    Location,
+    DeviceCommands,
+    table_json,
 )
+from async_api import AsyncLocation, ProgressCallback
+from cache import TTLCache
+from metrics import Metrics
+from st.literals import DevicesLayout
+from store import EventStore
+from warm_start import WarmStartCache, account_key
 
 load_dotenv()
 token = environ.get("TOKEN")
 if token is None:
     raise ValueError("TOKEN environment variable must be set")
-location = Location(token)
+
+
+def _cache_path(name: str) -> str:
+    """Path of a file in the per-user cache directory."""
+    cache_dir = environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir, "smartthings-mcp", name)
+
+
+def _history_store() -> EventStore | None:
+    """Event store at HISTORY_DB (default: user cache dir); empty HISTORY_DB disables it."""
+    path = environ.get("HISTORY_DB", _cache_path("history.sqlite3"))
+    if not path:
+        return None
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return EventStore(path)
+
+
+def _warm_start(token: str, base_url: str) -> WarmStartCache | None:
+    """Snapshot file at WARM_START (default: user cache dir); empty WARM_START disables it."""
+    path = environ.get("WARM_START", _cache_path("warm_start.json"))
+    if not path:
+        return None
+    return WarmStartCache(path, account_key(token, base_url))
+
+
+base_url = environ.get("SMARTTHINGS_API_URL", "https://api.smartthings.com/")
+status_cache: TTLCache = TTLCache(ttl=float(environ.get("STATUS_TTL", "5")))
+metrics = Metrics()
+location = AsyncLocation(token, store=_history_store(), status_cache=status_cache, metrics=metrics,
+                         catalog_max_age=float(environ.get("CATALOG_MAX_AGE", "300")),
+                         fast_decode=environ.get("FAST_DECODE", "1") != "0",
+                         live_state=environ.get("LIVE_STATE", "0") == "1",
+                         warm_start=_warm_start(token, base_url), base_url=base_url,
+                         max_connections=int(environ.get("MAX_CONNECTIONS", "20")))
+metrics.register("status_cache", status_cache.stats)
+metrics.register("singleflight", lambda: location.session.singleflight.stats())
+metrics.register("scheduler", lambda: {"retries": location.session.scheduler.retries,
+                                        "throttled": location.session.scheduler.throttled})
+if location.mirror is not None:
+    metrics.register("mirror", location.mirror.stats)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -30,8 +83,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def warm_up(server: FastMCP) -> AsyncIterator[None]:
+    """Start fetching the location, rooms and devices without holding up the MCP handshake."""
+    location.warm_up()
+    yield
+
+
+class InstrumentedFastMCP(FastMCP):
+    """FastMCP that records the wall time, failures and result size of every tool call."""
+
+    async def call_tool(self, name: str, arguments: dict[str, Any]) -> Sequence[ContentBlock] | dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            result = await super().call_tool(name, arguments)
+        except Exception:
+            metrics.observe_tool(name, time.perf_counter() - started, 0, error=True)
+            raise
+        metrics.observe_tool(name, time.perf_counter() - started, _result_bytes(result))
+        return result
+
+
+def _result_bytes(result: Any) -> int:
+    """Size of the text a tool result puts on the wire: content blocks plus any structured output."""
+    if isinstance(result, tuple):  # (content blocks, structured output) of tools with an output schema
+        return sum(_result_bytes(part) for part in result)
+    if isinstance(result, dict):
+        return len(json.dumps(result, default=str).encode())
+    return sum(len(block.text.encode()) for block in result if hasattr(block, "text"))
+
+
 # Create server
-mcp = FastMCP("SmartThings", port=8001)
+mcp = InstrumentedFastMCP("SmartThings", port=8001, lifespan=warm_up)
 
 
 @mcp.tool(description="Get rooms UUID and names", annotations=ToolAnnotations(
@@ -41,8 +125,8 @@ mcp = FastMCP("SmartThings", port=8001)
     idempotentHint=True,
     openWorldHint=False)
 )
-def get_rooms() -> dict[UUID, str]:
-    return location.rooms
+async def get_rooms() -> dict[UUID, str]:
+    return await location.get_rooms()
 
 
 @mcp.tool(description="""
@@ -56,6 +140,9 @@ Parameters:
 - include_status: Include device status information in the response. Default is True.
 - category: Filter devices by their component category.
 - connection_type: Filter devices by their connection type (e.g., Wi-Fi, Zigbee).
+- layout: 'nested' (default) returns one object per device with its components, capabilities and status.
+  'table' returns a `columns` header and one row per device, with statuses flattened to
+  "capability.attribute": value (or [value, unit]); prefer it for large homes.
 """, annotations=ToolAnnotations(
     title="Get Smart Home Devices",
     readOnlyHint=True,
@@ -63,7 +150,7 @@ Parameters:
     idempotentHint=True,
     openWorldHint=False)
 )
-def get_devices(
+async def get_devices(
     capability: List[Capability] | None = None,
     capabilities_mode: CapabilitiesMode | None = 'or',
     include_restricted: bool = False,
@@ -71,9 +158,15 @@ def get_devices(
     include_status: bool = True,
     category: ComponentCategory | None = None,
     connection_type: ConnectionType | None = None,
+    layout: DevicesLayout = 'nested',
 ):
     """Get devices in the location"""
-    return location.get_devices_short(**locals())
+    devices = await location.get_devices_short(set(capability) if capability else None, capabilities_mode,
+                                               include_restricted, room_id, include_status, category,
+                                               connection_type)
+    if layout == 'table':
+        return table_json(location.devices_table(devices))
+    return devices
 
 
 @mcp.tool(description="Get device status", annotations=ToolAnnotations(
@@ -83,9 +176,36 @@ def get_devices(
     idempotentHint=True,
     openWorldHint=False)
 )
-def get_device_status(device_id: UUID):
+async def get_device_status(device_id: UUID):
     logger.info(f"Getting status for device {device_id}")
-    return location.device_status(device_id)
+    return await location.device_status(device_id)
+
+
+@mcp.tool(description="""
+Current status of many devices in one call, instead of one get_device_status call per device.
+
+Parameters:
+- room_id: Only devices in this room.
+- capability: Only devices with any of these capabilities, and only their attributes.
+- device_ids: Only these devices.
+- attributes: Only these attributes (e.g. ['temperature', 'humidity']).
+
+Returns one entry per device with its `status` as "capability.attribute": value, or [value, unit].
+""", annotations=ToolAnnotations(
+    title="Get Status Snapshot",
+    readOnlyHint=True,
+    destructiveHint=False,
+    idempotentHint=True,
+    openWorldHint=False)
+)
+async def get_status_snapshot(
+    room_id: UUID | None = None,
+    capability: List[Capability] | None = None,
+    device_ids: List[UUID] | None = None,
+    attributes: List[Attribute] | None = None,
+):
+    return await location.status_snapshot(room_id=room_id, capability=set(capability) if capability else None,
+                                          device_ids=device_ids, attributes=set(attributes) if attributes else None)
 
 
 @mcp.tool(description="Execute commands on a device", annotations=ToolAnnotations(
@@ -95,14 +215,37 @@ def get_device_status(device_id: UUID):
     idempotentHint=False,
     openWorldHint=False)
 )
-def execute_commands(device_id: UUID, commands: List[Command]):
+async def execute_commands(device_id: UUID, commands: List[Command]):
     """Send SmartThings commands to a device.
     Hints:
         first component of a device is usually 'main', but there might be 2-3 switches.
 
     """
     logger.info(f"Executing commands on device {device_id}: {commands}")
-    return location.device_commands(device_id, commands)
+    return await location.device_commands(device_id, commands)
+
+
+@mcp.tool(description="Execute commands on many devices at once", annotations=ToolAnnotations(
+    title="Execute Batch Device Commands",
+    readOnlyHint=False,
+    destructiveHint=True,
+    idempotentHint=False,
+    openWorldHint=False)
+)
+async def execute_batch_commands(
+    devices: List[DeviceCommands] | None = None,
+    commands: List[Command] | None = None,
+    room_id: UUID | None = None,
+    capability: Capability | None = None,
+):
+    """Send commands to several devices concurrently and return one result per device.
+    Hints:
+        either list `devices` (each with its own `deviceId` and `commands`),
+        or pass `commands` plus `room_id` and/or `capability` to target every matching device,
+        e.g. turn off all lights in a room: commands=[switch.off], room_id=..., capability='switch'.
+    """
+    logger.info(f"Executing batch commands: {devices=} {commands=} {room_id=} {capability=}")
+    return await location.batch_commands(devices=devices, commands=commands, room_id=room_id, capability=capability)
 
 
 @mcp.tool(description="Answer questions about past values or trends. Use ISO8601 Duration for `delta_start` and `delta_end` (e.g. P1D for 1 day, PT1H for 1 hour).",
@@ -113,7 +256,7 @@ def execute_commands(device_id: UUID, commands: List[Command]):
     idempotentHint=True,
     openWorldHint=False)
     )
-def get_device_history(
+async def get_device_history(
     *,
     device_id: Optional[UUID] = None,
     room_id:   Optional[UUID] = None,
@@ -121,7 +264,11 @@ def get_device_history(
     delta_start: str,
     delta_end: str | None = None,
     granularity: Literal["realtime", "5min", "hourly", "daily"] = "hourly",
-    aggregate:   Literal["raw", "sum", "avg", "min", "max"]   = "raw",
+    aggregate:   Literal["raw", "sum", "avg", "min", "max", "count", "median", "p95", "stddev", "first", "last"] = "raw",
+    max_events: int | None = None,
+    max_points: int | None = None,
+    partial_results: bool = False,
+    ctx: Context,
 ) -> List[dict]:
     """
     LLM-guidance
@@ -133,12 +280,31 @@ def get_device_history(
       an average/graph for a past period.  
     • `metric` must match a path from *Get Device Status*  
       (e.g. "powerMeter.power", "temperature.value").  
-    • Cap the returned set to ≲500 points; raise `granularity` as needed.
+    • Cap the returned set to ≲500 points: raise `granularity`, or pass
+      `max_points` to downsample the series while keeping spikes and dips
+      (e.g. `granularity="realtime", max_points=300` for a power curve).
+    • `aggregate` reduces each bucket: `count` of events, `median`/`p95`
+      percentiles, population `stddev`, or the `first`/`last` value in time.
     • Use ISO8601 Duration for `delta_start` and `delta_end` (e.g. "P1D" for 1 day, "PT1H" for 1 hour).
     • If `delta_end` is not provided, it defaults to now.
+    • The whole range is paged through; `max_events` caps how many raw events
+      are read (per device for a room).
+    • Progress is reported as pages and devices finish. For a room,
+      `partial_results=true` also sends the result so far as a log message
+      each time another device with events is finished; it covers the recent part
+      of the range.
 
     """
-    return location.history(
+    progress: ProgressCallback | None = None
+    partial: Callable[[List[dict]], Awaitable[None]] | None = None
+    if _in_request(ctx):
+        progress = ctx.report_progress
+        if partial_results:
+            async def send_partial(points: List[dict]) -> None:
+                await ctx.session.send_log_message(level="info", data={"partial": True, "points": points},
+                                                   logger="get_device_history", related_request_id=ctx.request_id)
+            partial = send_partial
+    return await location.history(
         device_id=device_id,
         room_id=room_id,
         attribute=attribute,
@@ -146,15 +312,55 @@ def get_device_history(
         delta_end=delta_end,
         granularity=granularity,
         aggregate=aggregate,
+        max_events=max_events,
+        max_points=max_points,
+        progress=progress,
+        partial=partial,
     )
 
+
+def _in_request(ctx: Context) -> bool:
+    """Whether `ctx` belongs to a client request (not e.g. a direct `mcp.call_tool`)."""
+    try:
+        ctx.request_context
+    except ValueError:
+        return False
+    return True
+
+
+@mcp.resource("smartthings://metrics", name="metrics",
+              description="Upstream latency per endpoint, tool wall time and result size, retries, throttling, "
+                          "request coalescing, status cache and live state mirror counters",
+              mime_type="application/json")
+def metrics_snapshot() -> dict:
+    return metrics.snapshot()
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    """The same metrics in Prometheus text format, served next to the SSE / HTTP transport."""
+    return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @mcp.tool(description="Get hub time")
-def get_hub_time() -> str:
+async def get_hub_time() -> str:
     """Get the current time of the hub."""
+    await location.ready()
     now = datetime.now(location.timezone)
     return f"{now} Timezone: {location.timezone}"
 
+Transport = Literal["stdio", "sse", "streamable-http"]
+
+
+def _transport() -> Transport:
+    """MCP_TRANSPORT, checked against the transports FastMCP can run."""
+    transport = environ.get("MCP_TRANSPORT", "sse")
+    if transport not in get_args(Transport):
+        raise ValueError(f"MCP_TRANSPORT must be one of {', '.join(get_args(Transport))}, got {transport!r}")
+    return cast(Transport, transport)
+
+
 if __name__ == "__main__":
     """Run the FastMCP server."""
-    mcp.run(transport="sse")
+    mcp.run(transport=_transport())
 
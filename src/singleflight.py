@@ -0,0 +1,89 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+
+def request_key(url: str, kwargs: dict) -> Hashable:
+    """Coalescing key of a GET: the URL plus its (sorted) request arguments."""
+    return url, tuple(sorted((k, repr(v)) for k, v in kwargs.items()))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+C = TypeVar("C")
+
+
+class _Counters(Generic[C]):
+    """Counters and the in-flight calls by key, shared by the thread and asyncio variants."""
+
+    def __init__(self):
+        self.calls: int = 0
+        self.collapsed: int = 0
+        self._calls: dict[Hashable, C] = {}
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "collapsed": self.collapsed, "in_flight": len(self._calls)}
+
+
+class SingleFlight(_Counters[_Call]):
+    """Run at most one call per key at a time; threads asking meanwhile share its outcome.
+
+    `calls` counts calls that actually ran, `collapsed` the callers served by
+    another caller's in-flight call. The shared result is the same object for
+    every caller, so it must be treated as read-only.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight(_Counters[asyncio.Task[Any]]):
+    """asyncio counterpart of :class:`SingleFlight`.
+
+    The shared call runs as its own task, so a caller that is cancelled does
+    not cancel the request for the others still waiting on it.
+    """
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self.calls += 1
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.collapsed += 1
+        return await asyncio.shield(task)
@@ -5,7 +5,7 @@ This package contains models for working with the SmartThings API.
 
 from .device import DeviceItem, DeviceResponse, DeviceStatusResponse, StatusModel
 from .history import EventHistoryItem, EventHistoryResponse
-from .command import Command
+from .command import Command, DeviceCommands
 from .links import Links
 from .literals import (
     Attribute, 
@@ -23,6 +23,7 @@ __all__ = [
     'EventHistoryItem', 
     'EventHistoryResponse',
     'Command',
+    'DeviceCommands',
     'Links',
     'Attribute', 
     'Capability', 
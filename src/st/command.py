@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from uuid import UUID
+
+from pydantic import BaseModel, Field
 
 from .literals import Capability
 
@@ -14,4 +16,9 @@ class Command(BaseModel):
             "capability": self.capability,
             "command": self.command,
             "arguments": self.arguments or []
-        }
\ No newline at end of file
+        }
+
+
+class DeviceCommands(BaseModel):
+    device_id: UUID = Field(..., alias="deviceId")
+    commands: list[Command]
@@ -9,6 +9,8 @@ Capability = Literal['button', 'motionSensor', 'dustSensor', 'carbonDioxideMeasu
 
 CapabilitiesMode = Literal['and', 'or']
 
+DevicesLayout = Literal['nested', 'table']
+
 Attribute = Literal[
     'motion', 'battery', 'illuminance', 'temperature', 'tamper', 'atmosphericPressure', 'humidity', 'contact',
     'power', 'energy', 'level', 'voltage', 'rssi', 'lqi', 'shadeLevel', 'volume', 'water', 'presence', 'lock',
@@ -26,4 +28,4 @@ ComponentCategory = Literal[
 ExecutionContext = Literal['CLOUD', 'LOCAL']
 
 Granularity = Literal["realtime", "5min", "hourly", "daily"]
-Aggregate = Literal["raw", "sum", "avg", "min", "max"]
+Aggregate = Literal["raw", "sum", "avg", "min", "max", "count", "median", "p95", "stddev", "first", "last"]
@@ -0,0 +1,170 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List
+from uuid import UUID
+
+from frame import HistoryFrame
+from decode import HistoryEvent, HistoryItem
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    device_id  TEXT    NOT NULL,
+    component  TEXT    NOT NULL,
+    capability TEXT    NOT NULL,
+    attribute  TEXT    NOT NULL,
+    epoch      INTEGER NOT NULL,
+    hash       INTEGER NOT NULL,
+    time       TEXT    NOT NULL,
+    value,
+    unit       TEXT,
+    PRIMARY KEY (device_id, epoch, hash)
+);
+CREATE INDEX IF NOT EXISTS events_by_attribute ON events (device_id, capability, attribute, epoch);
+CREATE TABLE IF NOT EXISTS sync_state (
+    device_id   TEXT    PRIMARY KEY,
+    synced_from INTEGER NOT NULL,
+    synced_to   INTEGER NOT NULL,
+    last_epoch  INTEGER,
+    last_hash   INTEGER
+);
+"""
+
+# (paging_after_epoch, paging_after_hash, paging_before_epoch) of a range still to fetch.
+Gap = tuple[int, int | None, int]
+
+
+class EventStore:
+    """Local SQLite copy of device event history.
+
+    Each device has one contiguous synced range ``[synced_from, synced_to]``
+    plus the ``(epoch, hash)`` of the newest stored event. :meth:`gaps` tells
+    the caller which parts of a query range still have to be fetched; forward
+    gaps resume from the newest event's watermark, so repeated "last 24 hours"
+    questions only download what happened since the previous call.
+
+    Nothing is ever deleted: the store keeps every event it was asked to
+    sync, so its size follows the history ranges that were queried.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def gaps(self, device_id: UUID, start_ms: int, end_ms: int) -> List[Gap]:
+        """Ranges of [start_ms, end_ms] that are not in the store yet."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_from, synced_to, last_epoch, last_hash FROM sync_state WHERE device_id = ?",
+                (str(device_id),)).fetchone()
+        if row is None:
+            return [(start_ms, None, end_ms)]
+
+        synced_from, synced_to, last_epoch, last_hash = row
+        gaps: List[Gap] = []
+        if start_ms < synced_from:
+            gaps.append((start_ms, None, synced_from))
+        if end_ms > synced_to:
+            if last_epoch is not None:
+                gaps.append((last_epoch, last_hash, end_ms))
+            else:
+                gaps.append((synced_to, None, end_ms))
+        return gaps
+
+    def add(self, device_id: UUID, items: Iterable[HistoryItem], batch_size: int = 500) -> int:
+        """Insert events, ignoring ones already stored. Returns the number of events offered."""
+        count = 0
+        iterator = iter(items)
+        while batch := list(islice(iterator, batch_size)):
+            rows = [(str(device_id), item.component, item.capability, item.attribute, item.epoch, item.hash,
+                     item.time.isoformat(), item.value, None if item.unit == "" else item.unit)
+                    for item in batch]
+            with self._lock, self._conn:
+                self._conn.executemany("INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            count += len(rows)
+        return count
+
+    def mark_synced(self, device_id: UUID, start_ms: int, end_ms: int) -> None:
+        """Record that [start_ms, end_ms] is complete, merging it with the existing range."""
+        with self._lock, self._conn:
+            newest = self._conn.execute(
+                "SELECT epoch, hash FROM events WHERE device_id = ? ORDER BY epoch DESC, hash DESC LIMIT 1",
+                (str(device_id),)).fetchone()
+            last_epoch, last_hash = newest if newest is not None else (None, None)
+            self._conn.execute(
+                "INSERT INTO sync_state VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(device_id) DO UPDATE SET synced_from = min(synced_from, excluded.synced_from), "
+                "synced_to = max(synced_to, excluded.synced_to), "
+                "last_epoch = excluded.last_epoch, last_hash = excluded.last_hash",
+                (str(device_id), start_ms, end_ms, last_epoch, last_hash))
+
+    def iter_events(self, device_id: UUID, start_ms: int | None = None, end_ms: int | None = None,
+                    attribute: str | None = None, capability: str | None = None,
+                    limit: int | None = None, page_size: int = 500) -> Iterator[HistoryEvent]:
+        """Stored events, newest first.
+
+        Rows are read `page_size` at a time, each page a query that resumes
+        below the last row of the previous one, so the lock is not held while
+        the caller works through a page.
+        """
+        query = ("SELECT time, component, capability, attribute, value, unit, epoch, hash "
+                 "FROM events WHERE device_id = ?")
+        params: list = [str(device_id)]
+        if capability is not None:
+            query += " AND capability = ?"
+            params.append(capability)
+        if attribute is not None:
+            query += " AND attribute = ?"
+            params.append(attribute)
+        if start_ms is not None:
+            query += " AND epoch > ?"
+            params.append(start_ms)
+        if end_ms is not None:
+            query += " AND epoch < ?"
+            params.append(end_ms)
+
+        device_id = UUID(str(device_id))
+        after: tuple[int, int] | None = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            page_query, page_params = query, list(params)
+            if after is not None:
+                page_query += " AND (epoch, hash) < (?, ?)"
+                page_params.extend(after)
+            page_query += " ORDER BY epoch DESC, hash DESC LIMIT ?"
+            page_params.append(size)
+            with self._lock:
+                rows = self._conn.execute(page_query, page_params).fetchall()
+            for time, component, row_capability, row_attribute, value, unit, epoch, hash in rows:
+                yield HistoryEvent(device_id, datetime.fromisoformat(time), component, row_capability, row_attribute,
+                                   value, unit, epoch, hash)
+            if len(rows) < size:
+                return
+            after = rows[-1][-2:]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def frame(self, device_id: UUID, start_ms: int | None = None, end_ms: int | None = None,
+              attribute: str | None = None, capability: str | None = None,
+              limit: int | None = None) -> HistoryFrame:
+        """Stored events, newest first, as a :class:`HistoryFrame`."""
+        return HistoryFrame.from_items(self.iter_events(device_id, start_ms, end_ms, attribute, capability, limit))
+
+    def events(self, device_id: UUID, start_ms: int | None = None, end_ms: int | None = None,
+               attribute: str | None = None, capability: str | None = None,
+               limit: int | None = None) -> List[dict]:
+        """Stored events, newest first, in the shape returned by `Location.event_history`."""
+        return self.frame(device_id, start_ms, end_ms, attribute, capability, limit).to_dicts()
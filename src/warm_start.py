@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Sequence
+from uuid import UUID
+
+from pydantic import BaseModel, ValidationError
+
+from st.device import DeviceItem
+
+logger = logging.getLogger(__name__)
+
+# Bump when the file layout or the DeviceItem model changes incompatibly.
+FORMAT_VERSION = 1
+
+
+def account_key(auth: str, base_url: str) -> str:
+    """Short digest identifying the account a snapshot was taken with, without storing the token."""
+    return hashlib.sha256(f"{base_url}\0{auth}".encode()).hexdigest()[:16]
+
+
+class _SnapshotFile(BaseModel):
+    version: int
+    key: str
+    saved_at: float
+    location_id: str
+    location: dict[str, Any]
+    rooms: dict[UUID, str]
+    devices: list[DeviceItem]
+
+
+@dataclass(frozen=True)
+class WarmStart:
+    """Location details, rooms and devices as they were when the snapshot was saved."""
+    location_id: str
+    location: dict[str, Any]
+    rooms: dict[UUID, str]
+    devices: list[DeviceItem]
+    saved_at: float
+
+    @property
+    def age(self) -> float:
+        """Seconds since the snapshot was saved (wall clock, so it survives restarts)."""
+        return max(0.0, time.time() - self.saved_at)
+
+
+class WarmStartCache:
+    """Single JSON file holding the last known location, rooms and device list.
+
+    Every restart of the stdio server would otherwise fetch all of them before
+    its first useful answer. The file is read with one ``read()`` and parsed
+    and validated by pydantic's JSON parser in a single pass; it is replaced
+    atomically on save, so a crash mid-write leaves the previous snapshot.
+    Snapshots from another account, another API, another location or an older
+    format are ignored.
+    """
+
+    def __init__(self, path: str, key: str):
+        self.path = path
+        self.key = key
+
+    def load(self, location_id: UUID | str | None = None) -> WarmStart | None:
+        """The saved snapshot, or None if there is no usable one."""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Could not read warm-start snapshot {self.path}: {e}")
+            return None
+        try:
+            snapshot = _SnapshotFile.model_validate_json(data)
+        except ValidationError as e:
+            logger.info(f"Ignoring unreadable warm-start snapshot {self.path}: {e.error_count()} errors")
+            return None
+        if snapshot.version != FORMAT_VERSION or snapshot.key != self.key:
+            return None
+        if location_id is not None and snapshot.location_id != str(location_id):
+            return None
+        return WarmStart(snapshot.location_id, snapshot.location, snapshot.rooms, snapshot.devices,
+                         snapshot.saved_at)
+
+    def save(self, location_id: UUID | str, location: dict[str, Any], rooms: dict[UUID, str],
+             devices: Sequence[DeviceItem]) -> None:
+        """Write a new snapshot; failures are only logged."""
+        snapshot = _SnapshotFile.model_construct(version=FORMAT_VERSION, key=self.key, saved_at=time.time(),
+                                                 location_id=str(location_id), location=location,
+                                                 rooms=rooms, devices=list(devices))
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(snapshot.model_dump_json(by_alias=True).encode())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write warm-start snapshot {self.path}: {e}")
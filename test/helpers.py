@@ -0,0 +1,96 @@
+"""Builders for the SmartThings API payloads the unit tests serve."""
+import datetime
+import os
+import sys
+import uuid
+from typing import Any, Iterable, Mapping
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.async_api import AsyncLocation
+
+LOCATION_ID = "22222222-2222-2222-2222-222222222222"
+DEVICE_ID = uuid.UUID("11111111-1111-1111-1111-111111111111")
+ROOM_ID = uuid.UUID("00000000-0000-0000-0000-000000000001")
+
+
+def device(device_id, room_id, capabilities: Mapping[str, Any] | Iterable[str] = ("switch",),
+           category: str | None = None) -> dict:
+    """A `/devices` item with one "main" component.
+
+    `capabilities` is either a list of capability ids or a mapping of id to
+    the capability's `status`, as returned with `includeStatus=true`.
+    """
+    if isinstance(capabilities, Mapping):
+        capability_items = [{"id": capability, "status": status} for capability, status in capabilities.items()]
+    else:
+        capability_items = [{"id": capability} for capability in capabilities]
+    categories = [] if category is None else [{"name": category, "categoryType": "manufacturer"}]
+    return {
+        "deviceId": str(device_id),
+        "name": "Device",
+        "label": f"Device {device_id}",
+        "manufacturerName": "SmartThings",
+        "presentationId": "p",
+        "roomId": str(room_id),
+        "locationId": LOCATION_ID,
+        "components": [{"id": "main", "label": "main", "capabilities": capability_items, "categories": categories}],
+        "createTime": "2025-01-01T00:00:00.000Z",
+        "profile": {"id": "33333333-3333-3333-3333-333333333333"},
+        "type": "ZIGBEE",
+        "restrictionTier": 0,
+        "allowed": [],
+        "executionContext": "LOCAL",
+        "relationships": [],
+    }
+
+
+def history_item(epoch: int, value, attribute: str = "temperature", device_id=DEVICE_ID,
+                 hash: int | None = None) -> dict:
+    """A `/v1/history/devices` item of a temperature sensor; `hash` defaults to `epoch`."""
+    return {
+        "deviceId": str(device_id),
+        "deviceName": "Device1",
+        "locationId": LOCATION_ID,
+        "locationName": "Home",
+        "time": datetime.datetime.fromtimestamp(epoch / 1000, datetime.timezone.utc).isoformat(),
+        "text": "",
+        "component": "main",
+        "componentLabel": "main",
+        "capability": "temperatureMeasurement",
+        "attribute": attribute,
+        "value": value,
+        "unit": "C",
+        "epoch": epoch,
+        "hash": epoch if hash is None else hash,
+    }
+
+
+def room_location(history: dict, page_size: int | None = None) -> AsyncLocation:
+    """AsyncLocation whose mock room holds the devices of `history`, served `page_size` events a page."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == f"/v1/locations/{LOCATION_ID}":
+            body = {"locationId": LOCATION_ID, "timeZoneId": "UTC"}
+        elif path == "/devices":
+            body = {"items": [device(d, ROOM_ID, ["temperatureMeasurement"]) for d in history]}
+        elif path == f"/v1/locations/{LOCATION_ID}/rooms":
+            body = {"items": [{"roomId": str(ROOM_ID), "name": "Room"}]}
+        elif path == "/v1/history/devices":
+            events = history[uuid.UUID(request.url.params["deviceId"])]
+            if page_size is None:
+                body = {"items": events}
+            else:
+                page = int(request.url.params.get("page", 0))
+                body = {"items": events[page * page_size:(page + 1) * page_size]}
+                if (page + 1) * page_size < len(events):
+                    params = request.url.params.set("page", str(page + 1))
+                    body["_links"] = {"next": {"href": str(request.url.copy_with(params=params))}}
+        else:
+            raise AssertionError(f"unexpected request {request.url}")
+        return httpx.Response(200, json=body)
+
+    return AsyncLocation("token", location_id=LOCATION_ID, fast_decode=True,
+                         transport=httpx.MockTransport(handler))
@@ -3,13 +3,16 @@ import sys
 import uuid
 import datetime
 import math
+import random
 
 import pytest
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
 
 from src.st.device import DeviceItem
-from src.api import Command, Location, _bucket_time, _aggregate_values
+from src.decode import HistoryEvent
+from src.api import Command, Location, _HistoryAggregator, _aggregate_history, _bucket_time, _aggregate_values
+from test.helpers import history_item
 
 noRoomId = uuid.UUID("00000000-0000-0000-0000-000000000000")
 room1Id = uuid.UUID("00000000-0000-0000-0000-000000000001")
@@ -19,7 +22,7 @@ def _make_location():
     loc = object.__new__(Location)
     loc.location_id = "loc1"
     loc.rooms = {room1Id: "Room 1"}
-    loc.device_ids = set()
+    loc.device_ids = frozenset()
     return loc
 
 
@@ -85,7 +88,7 @@ def test_get_devices_invalid(monkeypatch):
 def test_device_commands(monkeypatch):
     loc = _make_location()
     valid = uuid.UUID("11111111-1111-1111-1111-111111111111")
-    loc.device_ids = {valid}
+    loc.device_ids = frozenset({valid})
 
     captured = {}
 
@@ -107,7 +110,7 @@ def test_device_commands(monkeypatch):
 def test_validate_device_id():
     loc = _make_location()
     valid = uuid.UUID("11111111-1111-1111-1111-111111111111")
-    loc.device_ids = {valid}
+    loc.device_ids = frozenset({valid})
 
     assert loc.validate_device_id(valid) == valid
 
@@ -139,33 +142,167 @@ def test_aggregate_values():
         _aggregate_values(values, "bogus") # type: ignore
 
 
-def test_room_history_raw(monkeypatch):
+def test_aggregate_values_statistics():
+    values = [4.0, 1.0, 3.0, 2.0]
+    assert _aggregate_values(values, "count") == 4.0
+    assert _aggregate_values(values, "first") == 4.0
+    assert _aggregate_values(values, "last") == 2.0
+    assert _aggregate_values(values, "median") == 2.5
+    assert _aggregate_values(values, "p95") == pytest.approx(3.85)
+    assert _aggregate_values(values, "stddev") == pytest.approx(math.sqrt(1.25))
+
+
+def _random_events(n, tz: datetime.tzinfo | None = datetime.timezone.utc):
+    rng = random.Random(7)
+    start = datetime.datetime(2025, 3, 1, tzinfo=tz)
+    events = [{"time": start + datetime.timedelta(seconds=rng.randrange(3 * 86400)),
+               "value": round(rng.uniform(-10, 40), 1)} for _ in range(n)]
+    events.append({"time": start, "value": "n/a"})
+    return events
+
+
+@pytest.mark.parametrize("aggregate", ["raw", "sum", "avg", "min", "max", "count",
+                                       "median", "p95", "stddev", "first", "last"])
+@pytest.mark.parametrize("granularity", ["realtime", "5min", "hourly", "daily"])
+def test_vectorized_aggregation_matches_python(granularity, aggregate):
+    pytest.importorskip("numpy")
+    events = _random_events(2000, datetime.timezone(datetime.timedelta(hours=2)))
+
+    vectorized = _HistoryAggregator(granularity, aggregate)
+    python = _HistoryAggregator(granularity, aggregate)
+    python.vectorized = False
+    vectorized.extend(events)
+    python.extend(events)
+
+    assert vectorized.vectorized or (aggregate == "raw" and granularity == "realtime")
+    assert vectorized.result() == python.result() == _reference_history(events, granularity, aggregate)
+
+
+def _reference_history(events, granularity, aggregate):
+    """Events bucketed by _bucket_time and reduced by _aggregate_values, one bucket at a time."""
+    if aggregate == "raw" and granularity == "realtime":
+        return sorted(events, key=lambda e: e["time"])
+    buckets = {}
+    for event in sorted(events, key=lambda e: e["time"]) if aggregate in ("first", "last") else events:
+        try:
+            value = float(event["value"])
+        except ValueError:
+            continue
+        buckets.setdefault(_bucket_time(event["time"], granularity), []).append(value)
+    if aggregate == "raw":
+        return [{"time": t, "value": v} for t, values in sorted(buckets.items()) for v in values]
+    return [{"time": t, "value": _aggregate_values(values, aggregate)} for t, values in sorted(buckets.items())]
+
+
+@pytest.mark.parametrize("aggregate", ["sum", "avg", "stddev"])
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_aggregation_sums_are_exactly_rounded(aggregate, vectorized):
+    if vectorized:
+        pytest.importorskip("numpy")
+    base = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    for values in ([0.1] * 10, [1e16, 1, -1e16, 0.1, 0.2, 0.3]):
+        agg = _HistoryAggregator("daily", aggregate)
+        agg.vectorized = agg.vectorized and vectorized
+        agg.extend({"time": base + datetime.timedelta(minutes=i), "value": v} for i, v in enumerate(values))
+
+        assert agg.result() == [{"time": base, "value": _aggregate_values(values, aggregate)}]
+    assert _aggregate_values([0.1] * 10, "sum") == 1.0
+    assert _aggregate_values([1e16, 1, -1e16, 0.1, 0.2, 0.3], "sum") == 1.6
+
+
+def test_vectorized_aggregation_naive_times():
+    pytest.importorskip("numpy")
+    events = _random_events(300, tz=None)
+    python = _HistoryAggregator("hourly", "max")
+    python.vectorized = False
+    python.extend(events)
+
+    assert _aggregate_history(events, "hourly", "max") == python.result()
+
+
+def test_vectorized_aggregation_falls_back_on_mixed_offsets():
+    pytest.importorskip("numpy")
+    utc = _random_events(50)
+    shifted = [{"time": e["time"].astimezone(datetime.timezone(datetime.timedelta(hours=-5))),
+                "value": e["value"]} for e in _random_events(50)]
+    agg = _HistoryAggregator("daily", "count")
+    agg.extend(utc + shifted)
+
+    assert not agg.vectorized
+    assert agg.result() == _aggregate_history(utc + shifted, "daily", "count")
+    assert sum(row["value"] for row in agg.result()) == 100
+
+
+def test_lttb_keeps_spikes_and_ends(monkeypatch):
+    from src import aggregate
+
+    xs = list(range(1000))
+    ys = [5.0] * 1000
+    ys[437] = 90.0
+    ys[702] = -40.0
+    kept = aggregate.lttb(xs, ys, 20)
+
+    assert len(kept) == 20
+    assert kept[0] == 0 and kept[-1] == 999
+    assert {437, 702} <= set(kept)
+    assert aggregate.lttb(xs, ys, 2000) == xs
+
+    if aggregate.np is not None:
+        noisy = [random.Random(5).gauss(0, 1) for _ in xs]
+        vectorized = aggregate.lttb(xs, noisy, 50)
+        monkeypatch.setattr(aggregate, "np", None)
+        assert aggregate.lttb(xs, noisy, 50) == vectorized
+
+
+@pytest.mark.parametrize("granularity", ["realtime", "5min"])
+def test_history_max_points(granularity):
+    events = _random_events(3000)
+    vectorized = _HistoryAggregator(granularity, "max", max_points=100)
+    python = _HistoryAggregator(granularity, "max", max_points=100)
+    python.vectorized = False
+    vectorized.extend(events)
+    python.extend(events)
+
+    result = vectorized.result()
+    assert len(result) == 100
+    assert result == python.result()
+    full = _aggregate_history(events, granularity, "max")
+    assert result[0] == full[0] and result[-1] == full[-1]
+    assert all(r in full for r in result)
+
+
+def test_history_max_points_states():
+    base = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    events = [{"time": base + datetime.timedelta(minutes=i), "value": "on" if i % 2 else "off"} for i in range(50)]
+    agg = _HistoryAggregator("realtime", "raw", max_points=5)
+    agg.extend(events)
+    assert [e["time"].minute for e in agg.result()] == [0, 12, 24, 37, 49]
+
+    with pytest.raises(ValueError):
+        _HistoryAggregator("hourly", "avg", max_points=0)
+
+
+def _event(device_id, epoch, value, hash=0):
+    time = datetime.datetime.fromtimestamp(epoch / 1000, datetime.timezone.utc)
+    return HistoryEvent(device_id, time, "main", "temperatureMeasurement", "temperature", value, "C", epoch, hash)
+
+
+def test_room_history_merges_devices_newest_first(monkeypatch):
     loc = _make_location()
-    loc.get_devices_short = lambda **kwargs: [  # type: ignore
-        {"deviceId": "dev1"},
-        {"deviceId": "dev2"},
-    ]
-    base = datetime.datetime(2025, 1, 1, 12, 0, 0)
+    dev1, dev2 = uuid.UUID(int=1), uuid.UUID(int=2)
+    loc.get_devices_short = lambda **kwargs: [{"deviceId": dev1}, {"deviceId": dev2}]  # type: ignore
     events = {
-        "dev1": [{"time": base, "value": 1}],
-        "dev2": [{"time": base + datetime.timedelta(minutes=3), "value": 2}],
+        # the event at 300_000 was returned on two pages
+        dev1: [_event(dev1, 400_000, 4), _event(dev1, 300_000, 3), _event(dev1, 300_000, 3), _event(dev1, 100_000, 1)],
+        dev2: [_event(dev2, 300_000, 30, hash=7), _event(dev2, 200_000, 20)],
     }
+    loc.iter_event_history = lambda device_id, **kwargs: iter(events[device_id])  # type: ignore
 
-    def fake_event_history(device_id, *args, **kwargs):
-        return events[device_id]
+    res = loc.room_history(room_id=room1Id, attribute="temperature", start_ms=0, end_ms=0)
 
-    loc.event_history = fake_event_history # type: ignore
-
-    res = loc.room_history(
-        room_id=room1Id,
-        attribute="temperature",
-        start_ms=0,
-        end_ms=0
-    )
-    assert res == [
-        {"time": base, "value": 1.0},
-        {"time": base + datetime.timedelta(minutes=3), "value": 2.0},
-    ]
+    assert [(e["deviceId"], e["value"]) for e in res] == [
+        (dev1, 4), (dev1, 3), (dev2, 30), (dev2, 20), (dev1, 1)]
+    assert res[0] == Location._event_dict(events[dev1][0])
 
 
 def test_calc_epoch_range(monkeypatch):
@@ -196,14 +333,14 @@ def test_history_calls_event(monkeypatch):
 
     captured = {}
 
-    def fake_event_history(*, device_id=None, attribute=None, limit=None,
-                           paging_after_epoch=None, paging_before_epoch=None, **kwargs):
+    def fake_iter_event_history(*, device_id=None, attribute=None,
+                                paging_after_epoch=None, paging_before_epoch=None, **kwargs):
         captured["device_id"] = device_id
         captured["paging_after_epoch"] = paging_after_epoch
         captured["paging_before_epoch"] = paging_before_epoch
-        return []
+        return iter([])
 
-    loc.event_history = fake_event_history  # type: ignore
+    loc.iter_event_history = fake_iter_event_history  # type: ignore
 
     fake_now = datetime.datetime(2025, 1, 2, 0, 0, 0, tzinfo=datetime.timezone.utc)
 
@@ -275,3 +412,220 @@ def test_event_history_capability_filter(monkeypatch):
 
     assert len(result) == 1
     assert result[0]["capability"] == "switch"
+
+
+def test_room_history_concurrent_is_deterministic(monkeypatch):
+    import threading
+    import time
+
+    loc = _make_location()
+    device_ids = [uuid.UUID(int=i) for i in range(6)]
+    loc.get_devices_short = lambda **kwargs: [{"deviceId": d} for d in device_ids]  # type: ignore
+
+    in_flight = []
+    lock = threading.Lock()
+    active = {"now": 0}
+
+    def fake_iter_event_history(device_id, **kwargs):
+        with lock:
+            active["now"] += 1
+            in_flight.append(active["now"])
+        # later devices answer first, so a naive merge would reorder them
+        time.sleep(0.02 * (len(device_ids) - device_ids.index(device_id)))
+        with lock:
+            active["now"] -= 1
+        return iter([_event(device_id, epoch, epoch) for epoch in (2000, 1000)])
+
+    loc.iter_event_history = fake_iter_event_history  # type: ignore
+
+    res = loc.room_history(room_id=room1Id, concurrency=3)
+
+    # newest first; events of the same epoch in device order
+    assert [(e["value"], e["deviceId"]) for e in res] == [(epoch, d) for epoch in (2000, 1000) for d in device_ids]
+    assert max(in_flight) == 3
+
+
+class PagedSession:
+    base_url = "https://api.smartthings.com/"
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.urls = []
+
+    def get_json(self, url):
+        self.urls.append(url)
+        index = 0 if "page=" not in url else int(url.rsplit("page=", 1)[1])
+        page = {"items": self.pages[index]}
+        if index + 1 < len(self.pages):
+            page["_links"] = {"next": {"href": f"{self.base_url}v1/history/devices?locationId=loc1&page={index + 1}"}}
+        return page
+
+
+def test_iter_event_history_follows_next_links():
+    loc = _make_location()
+    hour = 3_600_000
+    loc.session = PagedSession([  # type: ignore
+        [history_item(3 * hour, 3), history_item(3 * hour, 1, attribute="humidity")],
+        [history_item(2 * hour, 2)],
+        [history_item(1 * hour, 1)],
+    ])
+
+    items = list(loc.iter_event_history(attribute="temperature"))
+
+    assert [i.value for i in items] == [3, 2, 1]
+    assert loc.session.urls[1] == "v1/history/devices?locationId=loc1&page=1"  # type: ignore
+    assert len(loc.event_history(attribute="temperature", all_pages=True)) == 3
+
+
+def test_iter_event_history_budget_stops_paging():
+    loc = _make_location()
+    loc.session = PagedSession([[history_item(2, 2), history_item(1, 1)], [history_item(0, 0)]])  # type: ignore
+
+    assert [i.value for i in loc.iter_event_history(max_events=2)] == [2, 1]
+    assert len(loc.session.urls) == 1  # type: ignore
+    assert list(loc.iter_event_history(max_events=0)) == []
+
+
+def test_history_aggregates_all_pages():
+    import pytz
+    loc = _make_location()
+    loc.timezone = pytz.UTC
+    hour = 3_600_000
+    pages = [[history_item(10 * hour + i * 60_000, i) for i in range(3)],
+             [history_item(11 * hour, 10), history_item(11 * hour + 1, "n/a")]]
+    loc.session = PagedSession(pages)  # type: ignore
+
+    res = loc.history(device_id=None, attribute="temperature", delta_start="P1D", aggregate="avg")
+
+    assert [r["value"] for r in res] == [1.0, 10.0]
+    assert [r["time"].hour for r in res] == [10, 11]
+    assert res == _aggregate_history(
+        [loc._event_dict(i) for i in loc.iter_event_history()], "hourly", "avg")
+
+
+def test_batch_commands_explicit_devices():
+    import time
+    from src.api import DeviceCommands
+
+    loc = _make_location()
+    valid = [uuid.UUID(int=i + 1) for i in range(4)]
+    loc.device_ids = frozenset(valid)
+
+    def fake_post(device_id, commands):
+        time.sleep(0.05)
+        return {"results": [{"id": str(device_id), "status": "ACCEPTED"}]}
+
+    loc._device_commands = fake_post  # type: ignore
+
+    cmds = [Command(component="main", capability="switch", command="off")]
+    unknown = uuid.UUID("22222222-2222-2222-2222-222222222222")
+    requests = [DeviceCommands(deviceId=d, commands=cmds) for d in valid + [unknown]]
+
+    start = time.perf_counter()
+    res = loc.batch_commands(devices=requests, concurrency=4)
+    elapsed = time.perf_counter() - start
+
+    assert [r["deviceId"] for r in res] == valid + [unknown]
+    assert all(r["results"][0]["status"] == "ACCEPTED" for r in res[:4])
+    assert "unknown" in res[4]["error"]
+    assert elapsed < 0.15
+
+
+def test_batch_commands_selector():
+    loc = _make_location()
+    dev = uuid.UUID("11111111-1111-1111-1111-111111111111")
+    loc.device_ids = frozenset({dev})
+    captured = {}
+
+    def fake_get_devices(url):
+        captured["url"] = url
+        return [type("D", (), {"device_id": dev})()]
+
+    loc._get_devices = fake_get_devices  # type: ignore
+    loc._device_commands = lambda device_id, commands: {"results": [{"status": "ACCEPTED"}]}  # type: ignore
+
+    cmds = [Command(component="main", capability="switch", command="off")]
+    res = loc.batch_commands(commands=cmds, room_id=room1Id, capability="switch")
+
+    assert res == [{"deviceId": dev, "results": [{"status": "ACCEPTED"}]}]
+    assert f"&roomId={room1Id}" in captured["url"] and "&capability=switch" in captured["url"]
+    with pytest.raises(ValueError):
+        loc.batch_commands(commands=cmds)
+
+
+def test_location_is_fetched_on_first_use():
+    loc = Location("token")
+    calls = []
+
+    def fake_get_json(url, **kwargs):
+        calls.append(url)
+        if url == "v1/locations":
+            return {"items": [{"locationId": "loc1"}]}
+        return {"locationId": "loc1", "timeZoneId": "Europe/Berlin"}
+
+    loc.session.get_json = fake_get_json  # type: ignore
+    assert calls == []
+
+    assert str(loc.timezone) == "Europe/Berlin"
+    assert loc.location_id == "loc1"
+    assert loc.location["timeZoneId"] == "Europe/Berlin"
+    assert calls == ["v1/locations", "v1/locations/loc1"]
+
+
+def test_status_snapshot_is_one_request():
+    import json
+
+    with open(os.path.join(os.path.dirname(__file__), "fixtures", "devices.json"), encoding="utf-8") as f:
+        data = json.load(f)
+    loc = _make_location()
+    loc.fast_decode = True
+    loc.rooms = {uuid.UUID(d["roomId"]): "Room" for d in data["items"] if "roomId" in d}
+    loc.device_ids = frozenset(uuid.UUID(d["deviceId"]) for d in data["items"])
+    air_quality = uuid.UUID(data["items"][0]["deviceId"])
+    urls = []
+
+    class Session:
+        base_url = "https://api.smartthings.com/"
+
+        def get_json(self, url, **kwargs):
+            urls.append(url)
+            return data
+
+    loc.session = Session()  # type: ignore
+
+    snapshot = loc.status_snapshot(capability={"temperatureMeasurement"})
+    assert urls == ["devices?locationId=loc1&capability=temperatureMeasurement&capabilitiesMode=or&includeStatus=true"]
+    assert snapshot[0] == {"deviceId": air_quality, "label": "Air Quality", "roomId": uuid.UUID(data["items"][0]["roomId"]),
+                           "status": {"temperatureMeasurement.temperature": [23.5, "C"],
+                                      "temperatureMeasurement.temperatureRange": None}}
+
+    snapshot = loc.status_snapshot(device_ids=[air_quality], attributes={"dustLevel", "fineDustLevel"})
+    assert [d["status"] for d in snapshot] == [{"dustSensor.dustLevel": [108, "\u03bcg/m^3"],
+                                                 "dustSensor.fineDustLevel": [41, "\u03bcg/m^3"]}]
+    with pytest.raises(ValueError):
+        loc.status_snapshot(device_ids=[noRoomId])
+
+
+def test_device_items_follow_pages_and_prefetch():
+    import time
+
+    loc = _make_location()
+
+    class Session:
+        base_url = "https://api.smartthings.com/"
+
+        def get_json(self, url, **kwargs):
+            time.sleep(0.1)
+            page = int(url.rsplit("page=", 1)[-1]) if "page=" in url else 0
+            links = {"next": {"href": f"{self.base_url}devices?locationId=loc1&page={page + 1}"}} if page < 2 else {}
+            return {"items": [page * 2, page * 2 + 1], "_links": links}
+
+    loc.session = Session()  # type: ignore
+
+    def slow_decode(page):
+        time.sleep(0.1)
+        return page["items"]
+
+    start = time.perf_counter()
+    assert loc._device_items("devices?locationId=loc1", slow_decode) == [0, 1, 2, 3, 4, 5]
+    assert time.perf_counter() - start < 0.5  # sequential fetch and decode would take 0.6s
@@ -0,0 +1,302 @@
+import asyncio
+import datetime
+import os
+import sys
+import time
+import uuid
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.api import Command
+from src.async_api import AsyncLocation
+from src.warm_start import WarmStartCache
+from test.helpers import LOCATION_ID, ROOM_ID, device, history_item, room_location
+
+room1Id = uuid.UUID("00000000-0000-0000-0000-000000000001")
+dev1Id = uuid.UUID("11111111-1111-1111-1111-111111111111")
+
+
+def _routes(request: httpx.Request) -> dict:
+    path = request.url.path
+    if path == "/v1/locations":
+        return {"items": [{"locationId": LOCATION_ID}]}
+    if path == f"/v1/locations/{LOCATION_ID}":
+        return {"locationId": LOCATION_ID, "timeZoneId": "UTC"}
+    if path == f"/v1/locations/{LOCATION_ID}/rooms":
+        return {"items": [{"roomId": str(room1Id), "name": "Room 1"}]}
+    if path == "/devices":
+        return {"items": [device(dev1Id, room1Id)]}
+    if path == f"/v1/devices/{dev1Id}/status":
+        return {"components": {"main": {"switch": {"switch": {"value": "on"}}}}}
+    if path == f"/v1/devices/{dev1Id}/commands":
+        return {"results": [{"id": "x", "status": "ACCEPTED"}]}
+    raise AssertionError(f"unexpected request {request.url}")
+
+
+def _make_location(delay: float = 0.0, calls: list | None = None,
+                   warm_start: WarmStartCache | None = None) -> AsyncLocation:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if calls is not None:
+            calls.append(str(request.url))
+        if delay:
+            await asyncio.sleep(delay)
+        return httpx.Response(200, json=_routes(request))
+
+    return AsyncLocation("token", transport=httpx.MockTransport(handler), warm_start=warm_start)
+
+
+def test_ready_is_lazy_and_shared():
+    calls: list = []
+    loc = _make_location(calls=calls)
+    assert calls == []
+    with pytest.raises(AttributeError, match="ready"):
+        loc.location_id
+
+    async def run():
+        await asyncio.gather(loc.ready(), loc.ready(), loc.ready())
+        await loc.aclose()
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert loc.location_id == LOCATION_ID
+    assert str(loc.timezone) == "UTC"
+
+
+def test_without_a_catalog_every_lookup_fetches():
+    calls: list = []
+    loc = _make_location(calls=calls)
+    loc.catalog = None
+
+    async def run():
+        rooms = await loc.get_rooms()
+        await loc.validate_device_id(dev1Id)
+        await loc.aclose()
+        return rooms
+
+    assert asyncio.run(run()) == {room1Id: "Room 1"}
+    assert sum(c.endswith("/rooms") for c in calls) == 3  # get_rooms, and twice in validate_device_id
+
+
+def test_warm_up_loads_location_and_catalog_in_background():
+    calls: list = []
+    loc = _make_location(delay=0.02, calls=calls)
+
+    async def run():
+        loc.warm_up()
+        loc.warm_up()
+        assert calls == []  # nothing is awaited by the caller
+        assert loc._warm_up_task is not None
+        await loc._warm_up_task
+        fetched = list(calls)
+        rooms = await loc.get_rooms()
+        await loc.aclose()
+        return fetched, rooms
+
+    fetched, rooms = asyncio.run(run())
+    assert len(fetched) == 4  # locations, location, rooms and devices, each once
+    assert len(calls) == 4  # later calls are served from the warm catalog
+    assert rooms == {room1Id: "Room 1"}
+
+
+def test_warm_up_failure_is_retried_on_first_use():
+    attempts = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request.url.path)
+        if len(attempts) == 1:
+            return httpx.Response(400)
+        return httpx.Response(200, json=_routes(request))
+
+    loc = AsyncLocation("token", transport=httpx.MockTransport(handler))
+
+    async def run():
+        loc.warm_up()
+        assert loc._warm_up_task is not None
+        await loc._warm_up_task
+        assert not loc._ready
+        rooms = await loc.get_rooms()
+        await loc.aclose()
+        return rooms
+
+    assert asyncio.run(run()) == {room1Id: "Room 1"}
+
+
+def test_warm_start_answers_from_disk_and_verifies_in_background(tmp_path):
+    cache = WarmStartCache(str(tmp_path / "warm_start.json"), key="k")
+    cold = _make_location(warm_start=cache)
+
+    async def first_run():
+        await cold.get_rooms()
+        await cold.aclose()
+
+    asyncio.run(first_run())
+    saved = cache.load()
+    assert saved is not None
+
+    calls: list = []
+    loc = _make_location(delay=0.2, calls=calls, warm_start=cache)
+
+    async def restart():
+        started = time.perf_counter()
+        rooms = await loc.get_rooms()
+        devices = await loc.get_devices(include_status=False)
+        elapsed = time.perf_counter() - started
+        assert loc._verify_task is not None
+        await loc._verify_task
+        await loc.aclose()
+        return rooms, devices, elapsed
+
+    rooms, devices, elapsed = asyncio.run(restart())
+    assert elapsed < 0.1  # well below one upstream round trip
+    assert rooms == {room1Id: "Room 1"}
+    assert [d.device_id for d in devices] == [dev1Id]
+    assert loc.location_id == LOCATION_ID and str(loc.timezone) == "UTC"
+    # the location, rooms and devices are refetched once; the location list is not
+    assert sorted(httpx.URL(c).path for c in calls) == \
+        sorted(["/devices", f"/v1/locations/{LOCATION_ID}", f"/v1/locations/{LOCATION_ID}/rooms"])
+    reloaded = cache.load()
+    assert reloaded is not None and reloaded.saved_at > saved.saved_at
+
+
+def test_device_status_and_commands():
+    loc = _make_location()
+
+    async def run():
+        status = await loc.device_status(dev1Id)
+        cmds = [Command(component="main", capability="switch", command="off")]
+        res = await loc.device_commands(dev1Id, cmds)
+        with pytest.raises(ValueError):
+            await loc.device_status(uuid.UUID("44444444-4444-4444-4444-444444444444"))
+        await loc.aclose()
+        return status, res
+
+    status, res = asyncio.run(run())
+    assert status["main"]["switch"]["switch"].value == "on"
+    assert res["results"][0]["status"] == "ACCEPTED"
+
+
+@pytest.mark.parametrize("fast_decode", [False, True])
+def test_get_devices_short_room_filter(fast_decode):
+    loc = _make_location()
+    loc.fast_decode = fast_decode
+
+    async def run():
+        devices = await loc.get_devices_short(room_id=room1Id)
+        with pytest.raises(ValueError):
+            await loc.get_devices_short(room_id=uuid.UUID(int=0))
+        await loc.aclose()
+        return devices
+
+    devices = asyncio.run(run())
+    assert [d["deviceId"] for d in devices] == [dev1Id]
+    assert devices[0]["roomId"] == room1Id
+
+
+@pytest.mark.parametrize("fast_decode", [False, True])
+def test_device_list_follows_pages_and_prefetches(fast_decode):
+    device_ids = [uuid.UUID(int=0x100 + i) for i in range(5)]
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path != "/devices":
+            return httpx.Response(200, json=_routes(request))
+        calls.append(str(request.url))
+        await asyncio.sleep(0.1)
+        page = int(request.url.params.get("page", "0"))
+        links = {"next": {"href": f"https://api.smartthings.com/devices?locationId={LOCATION_ID}&page={page + 1}"}} \
+            if page < 2 else {}
+        return httpx.Response(200, json={"items": [device(d, room1Id) for d in device_ids[page * 2:page * 2 + 2]],
+                                         "_links": links})
+
+    loc = AsyncLocation("token", location_id=LOCATION_ID, fast_decode=fast_decode,
+                        transport=httpx.MockTransport(handler))
+
+    def slow_decode(page):
+        time.sleep(0.1)
+        return page["items"]
+
+    async def run():
+        await loc.ready()
+        devices = await loc.get_devices_short()
+        calls.clear()
+        start = time.perf_counter()
+        items = await loc._device_items(f"devices?locationId={LOCATION_ID}", slow_decode)
+        elapsed = time.perf_counter() - start
+        await loc.aclose()
+        return devices, items, elapsed
+
+    devices, items, elapsed = asyncio.run(run())
+    assert [d["deviceId"] for d in devices] == device_ids
+    assert len(items) == 5
+    assert [c.rsplit("page=", 1)[-1] for c in calls[1:]] == ["1", "2"]
+    assert elapsed < 0.5  # 3 fetches and 3 decodes of 0.1s each; sequential would take 0.6s
+
+
+def test_concurrent_calls_overlap():
+    loc = _make_location(delay=0.1)
+
+    async def run():
+        await loc.ready()
+        await loc.get_device_ids()
+        start = time.perf_counter()
+        await asyncio.gather(*(loc.device_status(dev1Id) for _ in range(5)))
+        elapsed = time.perf_counter() - start
+        await loc.aclose()
+        return elapsed
+
+    assert asyncio.run(run()) < 0.3
+
+
+def test_async_room_history_reports_progress_and_partial_results():
+    now = int(datetime.datetime.now(datetime.timezone.utc).timestamp()) * 1000
+    devices = [uuid.UUID(int=10 + i) for i in range(3)]
+    # the devices' histories reach back 29, 19 and 9 minutes
+    history = {d: [history_item(now - m * 60_000, 20 + i, device_id=d, hash=m) for m in range(1, 30 - 10 * i)]
+               for i, d in enumerate(devices)}
+    loc = room_location(history, page_size=10)
+    progress, partials = [], []
+
+    async def report(value, total, message):
+        progress.append((value, total, message))
+
+    async def partial(points):
+        partials.append(points)
+
+    async def run():
+        result = await loc.history(delta_start="PT1H", room_id=ROOM_ID, attribute="temperature",
+                                   granularity="hourly", aggregate="count", progress=report, partial=partial)
+        await loc.aclose()
+        return result
+
+    result = asyncio.run(run())
+    assert [value for value, _, _ in progress] == list(range(1, 10))  # 3 + 2 + 1 pages and 3 devices
+    assert progress[-1][2] == "3/3 devices, 6 pages, 57 events"
+    # a partial result each time the merge is past another device's oldest event;
+    # the last one would equal the result
+    assert [sum(p["value"] for p in points) for points in partials] == [27, 47]
+    assert sum(p["value"] for p in result) == 57
+
+
+def test_async_room_history_sends_partials_only_for_devices_with_events():
+    now = int(datetime.datetime.now(datetime.timezone.utc).timestamp()) * 1000
+    devices = [uuid.UUID(int=10 + i) for i in range(3)]
+    # no events for the first device; the others reach back 10 and 20 minutes
+    history = {d: [history_item(now - m * 60_000, 20, device_id=d, hash=m) for m in range(1, 1 + 10 * i)]
+               for i, d in enumerate(devices)}
+    loc = room_location(history)
+    partials = []
+
+    async def partial(points):
+        partials.append(points)
+
+    async def run():
+        await loc.history(delta_start="PT1H", room_id=ROOM_ID, attribute="temperature",
+                          granularity="hourly", aggregate="count", partial=partial)
+        await loc.aclose()
+
+    asyncio.run(run())
+    # one partial, once the second device is finished: its 10 events and 9 of the third device
+    assert [sum(p["value"] for p in points) for points in partials] == [19]
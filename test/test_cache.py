@@ -0,0 +1,79 @@
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.api import Command, Location
+from src.cache import TTLCache
+from src.st.device import DeviceStatusResponse
+
+dev1Id = uuid.UUID("11111111-1111-1111-1111-111111111111")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expiry_and_stats():
+    clock = Clock()
+    cache: TTLCache[str, int] = TTLCache(ttl=5, clock=clock)
+
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    clock.now = 5.0
+    assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 2, 0)
+
+
+def test_maxsize_drops_oldest():
+    cache: TTLCache[str, int] = TTLCache(ttl=60, maxsize=2)
+    for i, key in enumerate("abc"):
+        cache.put(key, i)
+    assert cache.get("a") is None
+    assert cache.get("c") == 2
+
+
+def _make_location(result_status):
+    loc = object.__new__(Location)
+    loc.location_id = "loc1"
+    loc.device_ids = frozenset({dev1Id})
+    loc.status_cache = TTLCache(ttl=60)
+    calls = []
+
+    def fake_status(device_id):
+        calls.append(device_id)
+        return DeviceStatusResponse.model_validate(
+            {"components": {"main": {"switch": {"switch": {"value": f"v{len(calls)}"}}}}})
+
+    loc._device_status = fake_status  # type: ignore
+    loc._device_commands = lambda device_id, commands: {"results": [{"id": "x", "status": result_status}]}  # type: ignore
+    return loc, calls
+
+
+def test_device_status_is_cached_until_command_accepted():
+    loc, calls = _make_location("ACCEPTED")
+    cmds = [Command(component="main", capability="switch", command="off")]
+
+    assert loc.device_status(dev1Id)["main"]["switch"]["switch"].value == "v1"
+    assert loc.device_status(dev1Id)["main"]["switch"]["switch"].value == "v1"
+    assert len(calls) == 1
+
+    loc.device_commands(dev1Id, cmds)
+    assert loc.device_status(dev1Id)["main"]["switch"]["switch"].value == "v2"
+    assert loc.status_cache.stats()["hits"] == 1  # type: ignore
+
+
+def test_rejected_command_keeps_cache():
+    loc, calls = _make_location("FAILED")
+    loc.device_status(dev1Id)
+    loc.device_commands(dev1Id, [Command(component="main", capability="switch", command="off")])
+    loc.device_status(dev1Id)
+    assert len(calls) == 1
@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.api import DeviceResponse, Location
+from src.catalog import AsyncDeviceCatalog, DeviceCatalog, DeviceIndex
+from test.helpers import device
+
+room1Id = uuid.UUID("00000000-0000-0000-0000-000000000001")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _devices(ids):
+    return DeviceResponse.model_validate({"items": [device(i, room1Id) for i in ids]}).items
+
+
+def _fetcher(versions: list, delay: float = 0.0):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if delay:
+            time.sleep(delay)
+        ids = versions[min(len(calls), len(versions)) - 1]
+        return {room1Id: "Room 1"}, _devices(ids)
+
+    return fetch, calls
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_stale_snapshot_is_served_while_refreshing():
+    a, b = uuid.uuid4(), uuid.uuid4()
+    fetch, calls = _fetcher([[a], [a, b]], delay=0.05)
+    clock = Clock()
+    catalog = DeviceCatalog(fetch, max_age=60, clock=clock)
+
+    first = catalog.snapshot()
+    assert first.device_ids == {a}
+
+    clock.now += 61
+    start = time.perf_counter()
+    assert catalog.snapshot() is first
+    assert time.perf_counter() - start < 0.04
+
+    _wait_for(lambda: catalog.peek() is not first)
+    assert catalog.snapshot().device_ids == {a, b}
+    assert len(calls) == 2
+
+
+def test_concurrent_first_load_fetches_once():
+    fetch, calls = _fetcher([[uuid.uuid4()]], delay=0.05)
+    catalog = DeviceCatalog(fetch)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(catalog.snapshot())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_unknown_device_triggers_rate_limited_refresh():
+    old, new = uuid.uuid4(), uuid.uuid4()
+    fetch, calls = _fetcher([[old], [old, new]])
+    clock = Clock()
+    loc = object.__new__(Location)
+    loc.catalog = DeviceCatalog(fetch, clock=clock)
+
+    assert loc.validate_device_id(old) == old
+    clock.now += 31
+    assert loc.validate_device_id(new) == new
+    assert len(calls) == 2
+
+    with pytest.raises(ValueError):
+        loc.validate_device_id(uuid.uuid4())
+    assert len(calls) == 2
+
+
+def test_async_catalog_background_refresh():
+    a, b = uuid.uuid4(), uuid.uuid4()
+    versions = [[a], [a, b]]
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {room1Id: "Room 1"}, _devices(versions[len(calls) - 1])
+
+    clock = Clock()
+    catalog = AsyncDeviceCatalog(fetch, max_age=60, clock=clock)
+
+    async def run():
+        first = await asyncio.gather(*(catalog.snapshot() for _ in range(5)))
+        assert len(calls) == 1
+        clock.now += 61
+        stale = await catalog.snapshot()
+        assert stale is first[0]
+        await asyncio.sleep(0.05)
+        return await catalog.snapshot()
+
+    assert asyncio.run(run()).device_ids == {a, b}
+    assert len(calls) == 2
+
+
+def _fixture_devices():
+    with open(os.path.join(os.path.dirname(__file__), "fixtures", "devices.json"), encoding="utf-8") as f:
+        return DeviceResponse.model_validate(json.load(f)).items
+
+
+def _scan(devices, capabilities, any_capability, room_id, category, connection_type):
+    matching = []
+    for d in devices:
+        present = {c.id for component in d.components for c in component.capabilities}
+        categories = {c.name for component in d.components for c in component.categories}
+        if capabilities and not (set(capabilities) & present if any_capability else set(capabilities) <= present):
+            continue
+        if room_id is not None and d.room_id != room_id:
+            continue
+        if category is not None and category not in categories:
+            continue
+        if connection_type is not None and d.connection_type != connection_type:
+            continue
+        matching.append(d)
+    return matching
+
+
+def test_device_index_matches_a_scan():
+    devices = _fixture_devices()
+    index = DeviceIndex(devices)
+    capabilities = sorted({c.id for d in devices for component in d.components for c in component.capabilities})
+    rooms = [None] + sorted({d.room_id for d in devices if d.room_id is not None})
+    categories = [None] + sorted({c.name for d in devices for component in d.components for c in component.categories})
+    types = [None] + sorted({d.connection_type for d in devices})
+    wanted = [(), (capabilities[0],), tuple(capabilities[:2]), ("switch", "powerMeter"), ("unknown",)]
+    for caps, any_capability, room_id, category, connection_type in itertools.product(
+            wanted, [False, True], rooms, categories, types):
+        assert index.select(caps, any_capability, room_id, category, connection_type) == \
+            _scan(devices, caps, any_capability, room_id, category, connection_type)
+
+
+def test_fresh_catalog_answers_device_queries():
+    devices = _fixture_devices()
+    clock = Clock()
+    loc = object.__new__(Location)
+    loc.location_id = "loc1"
+    loc.catalog = DeviceCatalog(lambda: ({d.room_id: "Room" for d in devices if d.room_id}, devices),
+                                max_age=60, clock=clock)
+    loc.catalog.snapshot()
+    urls = []
+    loc._get_devices = lambda url: urls.append(url) or []  # type: ignore
+
+    switches = loc.get_devices(capability="switch", include_status=False)
+    assert switches == [d for d in devices if any(c.id == "switch" for component in d.components
+                                                  for c in component.capabilities)]
+    assert loc.get_devices_short(capability={"switch"}, include_status=False) == Location._short_devices(switches)
+    assert urls == []
+
+    # statuses, restricted devices and a stale catalog go upstream
+    loc.get_devices(capability="switch")
+    loc.get_devices(include_status=False, include_restricted=True)
+    clock.now += 61
+    loc.get_devices(include_status=False)
+    assert len(urls) == 3
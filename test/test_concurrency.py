@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "bench")))
+
+from mock_smartthings import LOCATION_ID, MockSmartThings
+from src.api import Command, Location
+from src.scheduler import DEFAULT_LIMITS, RequestScheduler
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+CALLS = 400
+
+
+def _unpaced() -> RequestScheduler:
+    return RequestScheduler(limits={family: (1e6, 1_000_000) for family in DEFAULT_LIMITS})
+
+
+def test_sync_location_shares_a_bounded_pool_across_threads():
+    with MockSmartThings(devices=60, rooms=4, history_events=0, latency_ms=2) as mock:
+        loc = Location("token", base_url=mock.url, max_connections=8, scheduler=_unpaced())
+        device_ids = [uuid.UUID(d["deviceId"]) for d in mock.devices]
+        room_ids = list(mock.rooms)
+        switch = [Command(component="main", capability="switch", command="on")]
+        calls = [
+            lambda i: loc.timezone.zone,
+            lambda i: len(loc.rooms),
+            lambda i: len(loc.device_ids),
+            lambda i: loc.device_status(device_ids[i % len(device_ids)])["main"] is not None,
+            lambda i: len(loc.get_devices_short(room_id=room_ids[i % len(room_ids)], include_status=False)),
+            lambda i: len(loc.get_devices_short(room_id=room_ids[i % len(room_ids)])),
+            lambda i: loc.device_commands(device_ids[i % len(device_ids)], switch)["results"][0]["status"],
+        ]
+        # a fresh Location: the lazy location and catalog fields are first read by many threads at once
+        with ThreadPoolExecutor(max_workers=64) as pool:
+            results = list(pool.map(lambda i: calls[i % len(calls)](i), range(CALLS)))
+        loc.session.close()
+
+    assert results[:len(calls)] == ["UTC", 4, 60, True, 15, 15, "ACCEPTED"]
+    assert len(results) == CALLS
+    assert mock.endpoints["GET /v1/locations"] == 1
+    assert mock.endpoints[f"GET /v1/locations/{LOCATION_ID}"] == 1
+    assert mock.endpoints[f"GET /v1/locations/{LOCATION_ID}/rooms"] == 1
+    # every request went over the 8 pooled keep-alive connections
+    assert mock.peak_connections <= 8
+    assert mock.connections <= 8
+    assert mock.requests > mock.connections * 10
+
+
+TOOL_CALLS = """
+import asyncio, json, sys
+import server
+from scheduler import DEFAULT_LIMITS, RequestScheduler
+
+server.location.session.scheduler = RequestScheduler(limits={f: (1e6, 1_000_000) for f in DEFAULT_LIMITS})
+device_ids, room_ids, calls = json.loads(sys.argv[1]), json.loads(sys.argv[2]), int(sys.argv[3])
+switch = [{"component": "main", "capability": "switch", "command": "on"}]
+tools = [
+    lambda i: ("get_rooms", {}),
+    lambda i: ("get_devices", {"room_id": room_ids[i % len(room_ids)], "layout": "table"}),
+    lambda i: ("get_device_status", {"device_id": device_ids[i % len(device_ids)]}),
+    lambda i: ("get_status_snapshot", {"room_id": room_ids[i % len(room_ids)], "capability": ["switch"]}),
+    lambda i: ("execute_commands", {"device_id": device_ids[i % len(device_ids)], "commands": switch}),
+]
+
+async def main():
+    results = await asyncio.gather(*(server.mcp.call_tool(*tools[i % len(tools)](i)) for i in range(calls)),
+                                   return_exceptions=True)
+    await server.location.aclose()
+    print(json.dumps([str(r)[:200] for r in results if isinstance(r, BaseException)]))
+
+asyncio.run(main())
+"""
+
+
+def test_hundreds_of_concurrent_tool_calls():
+    with MockSmartThings(devices=60, rooms=4, history_events=0, latency_ms=2) as mock:
+        env = {**os.environ, "TOKEN": "token", "SMARTTHINGS_API_URL": mock.url, "HISTORY_DB": "",
+               "WARM_START": ""}
+        result = subprocess.run(
+            [sys.executable, "-c", TOOL_CALLS, json.dumps([d["deviceId"] for d in mock.devices]),
+             json.dumps([str(r) for r in mock.rooms]), str(CALLS)],
+            cwd=SRC, env=env, capture_output=True, text=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.splitlines()[-1]) == []
+    assert mock.endpoints["GET /v1/locations"] == 1
+    assert mock.endpoints[f"GET /v1/locations/{LOCATION_ID}/rooms"] == 1
+    # at most MAX_CONNECTIONS open at once, each kept alive between calls
+    assert mock.peak_connections <= 20
+    assert mock.connections <= 20
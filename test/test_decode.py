@@ -0,0 +1,79 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.api import DeviceResponse, HistoryPage, Location, history_page, table_json
+from src.decode import loads
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return loads(f.read())
+
+
+def _location(fast_decode):
+    loc = object.__new__(Location)
+    loc.fast_decode = fast_decode
+    return loc
+
+
+def test_loads_matches_json():
+    with open(os.path.join(FIXTURES, "history_page.json"), "rb") as f:
+        raw = f.read()
+    assert loads(raw) == json.loads(raw)
+
+
+def test_history_page_matches_model():
+    data = _fixture("history_page.json")
+    fast = _location(True)._parse_event_history(data)
+    model = _location(False)._parse_event_history(data)
+
+    assert isinstance(fast, HistoryPage)
+    assert [Location._event_dict(i) for i in fast.items] == [Location._event_dict(i) for i in model.items]
+    assert [(i.epoch, i.hash) for i in fast.items] == [(i.epoch, i.hash) for i in model.items]
+    assert (Location._next_page_url(fast, "https://api.smartthings.com/")
+            == Location._next_page_url(model, "https://api.smartthings.com/"))
+
+
+def test_history_page_filters_like_model():
+    data = _fixture("history_page.json")
+    fast = history_page(data)
+    matches = [i for i in fast.items if Location._event_matches(i, {"switch", "powerMeter"}, None)]
+    assert [i.attribute for i in matches] == ["power", "switch"]
+
+
+def test_last_history_page():
+    data = _fixture("history_page.json")
+    data["_links"] = None
+    assert Location._next_page_url(history_page(data), "https://api.smartthings.com/") is None
+
+
+def test_short_devices_raw_matches_model():
+    data = _fixture("devices.json")
+    model = Location._short_devices(DeviceResponse.model_validate(data).items)
+    assert Location._short_devices_raw(data["items"]) == model
+
+
+def test_devices_table_keeps_every_field():
+    devices = Location._short_devices_raw(_fixture("devices.json")["items"])
+    devices[0]["components"].append({"id": "outlet2", "label": "Outlet 2", "categories": [{"name": "Switch"}],
+                                     "capabilities": [{"id": "switch", "status": {"switch": {"value": "on"}}},
+                                                      {"id": "powerMeter"}]})
+    table = Location.devices_table(devices)
+    assert len(table["rows"]) == len(devices)
+    row = dict(zip(table["columns"], table["rows"][0]))
+    assert row["deviceId"] == devices[0]["deviceId"]
+    assert row["status"]["dustSensor.dustLevel"] == [108, "\u03bcg/m^3"]
+    assert row["status"]["temperatureMeasurement.temperatureRange"] is None
+    assert row["status"]["outlet2/switch.switch"] == "on"
+    assert row["categories"] == ["AirQualityDetector", "outlet2/Switch"]
+    assert "outlet2/powerMeter" in row["capabilities"]
+    assert row["components"] == {"outlet2": "Outlet 2"}
+
+    text = table_json(table)
+    assert json.loads(text)["rows"][0][0] == str(devices[0]["deviceId"])
+    assert len(text) < len(json.dumps(devices, default=str))
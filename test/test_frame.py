@@ -0,0 +1,74 @@
+import asyncio
+import datetime
+import json
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.api import EventHistoryResponse, HistoryFrame, Location, _HistoryAggregator, _aggregate_history, history_page
+from test.helpers import ROOM_ID, history_item, room_location
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _page():
+    with open(os.path.join(FIXTURES, "history_page.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("decode", [EventHistoryResponse.model_validate, history_page])
+def test_frame_round_trips_event_dicts(decode):
+    items = decode(_page()).items
+    frame = HistoryFrame.from_items(items)
+
+    assert len(frame) == len(items)
+    assert frame.to_dicts() == [Location._event_dict(i) for i in items]
+    assert list(frame.epoch) == [i.epoch for i in items]
+    assert list(frame.hash) == [i.hash for i in items]
+
+
+def test_frame_keeps_value_types():
+    frame = HistoryFrame()
+    now = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    values = [1, True, 1.0, "1", "on", {"mode": "auto"}]
+    for i, value in enumerate(values):
+        frame.append(uuid.UUID(int=1), now, "main", "c", "a", value, None, i, i)
+
+    out = [row["value"] for row in frame.to_dicts()]
+    assert out == values
+    assert [type(v) for v in out] == [type(v) for v in values]
+    assert frame.nbytes < 100 * len(values)
+
+
+@pytest.mark.parametrize("aggregate", ["raw", "avg", "max", "median", "first", "count"])
+@pytest.mark.parametrize("granularity", ["realtime", "hourly"])
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_add_item_matches_event_dicts(granularity, aggregate, vectorized):
+    items = history_page(_page()).items
+    agg = _HistoryAggregator(granularity, aggregate)
+    agg.vectorized = agg.vectorized and vectorized
+    for item in items:
+        agg.add_item(item)
+
+    assert agg.result() == _aggregate_history([Location._event_dict(i) for i in items], granularity, aggregate)
+
+
+def test_async_room_history_aggregates_merged_events():
+    now = int(datetime.datetime.now(datetime.timezone.utc).timestamp()) * 1000
+    devices = [uuid.UUID(int=10 + i) for i in range(3)]
+    history = {d: [history_item(now - m * 60_000, 20 + i + m % 3, device_id=d, hash=m) for m in range(1, 30)] for i, d in enumerate(devices)}
+    loc = room_location(history)
+
+    async def run():
+        result = await loc.history(delta_start="PT1H", room_id=ROOM_ID, attribute="temperature",
+                                   granularity="realtime", aggregate="max")
+        await loc.aclose()
+        return result
+
+    expected = _aggregate_history([{"time": datetime.datetime.fromisoformat(e["time"]), "value": e["value"]}
+                                   for events in history.values() for e in events], "realtime", "max")
+    assert asyncio.run(run()) == expected
@@ -0,0 +1,110 @@
+import asyncio
+import datetime
+import os
+import random
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.decode import HistoryEvent
+from src.merge import amerge_events, aread_ahead, merge_events, read_ahead
+
+NOW = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _streams(devices: int = 5, events: int = 50):
+    """Newest-first events of `devices` devices with repeated (epoch, hash) pairs, and every event as a tuple."""
+    rng = random.Random(7)
+    streams, rows = [], []
+    for device in range(devices):
+        device_id = uuid.UUID(int=device)
+        epochs = sorted((rng.randrange(1000) for _ in range(events)), reverse=True)
+        streams.append([HistoryEvent(device_id, NOW + datetime.timedelta(milliseconds=epoch), "main", "c", "a",
+                                     i, None, epoch, epoch % 7) for i, epoch in enumerate(epochs)])
+        rows.extend((epoch, epoch % 7, device_id) for epoch in epochs)
+    # newest first, each (epoch, hash) of a device once, ties in stream order
+    expected = [(epoch, device_id) for epoch, _, device_id in sorted(set(rows), key=lambda r: (-r[0], r[2]))]
+    return streams, expected
+
+
+def test_merge_events_matches_a_sort():
+    streams, expected = _streams()
+
+    assert [(e.epoch, e.device_id) for e in merge_events(streams)] == expected
+    assert list(merge_events([])) == []
+
+
+def test_merge_events_reads_each_stream_lazily():
+    pulled = []
+
+    def stream(device):
+        for epoch in (30, 20, 10):
+            pulled.append((device, epoch))
+            yield HistoryEvent(uuid.UUID(int=device), NOW, "main", "c", "a", epoch, None, epoch + device, 0)
+
+    merged = merge_events([stream(0), stream(1)])
+    assert next(merged).epoch == 31
+    # one pending event per stream; the yielded one is replaced only when the next is asked for
+    assert pulled == [(0, 30), (1, 30)]
+    assert next(merged).epoch == 30
+    assert pulled == [(0, 30), (1, 30), (1, 20)]
+
+
+def test_amerge_events_matches_merge_events():
+    streams, expected = _streams()
+    done = []
+
+    async def events(items):
+        for item in items:
+            await asyncio.sleep(0)
+            yield item
+
+    async def on_done(i):
+        done.append((i, len(merged)))
+
+    async def run():
+        async for item in amerge_events([events(s) for s in streams], on_done):
+            merged.append((item.epoch, item.device_id))
+
+    merged = []
+    asyncio.run(run())
+    assert merged == expected
+    # streams finish in the order of their oldest event
+    assert sorted(i for i, _ in done) == list(range(len(streams))) and done[-1][1] == len(expected)
+
+
+def test_read_ahead_keeps_order_and_reads_on_the_executor():
+    threads = set()
+
+    def items():
+        for i in range(1200):
+            threads.add(threading.current_thread().name)
+            yield i
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="ahead") as pool:
+        assert list(read_ahead(items(), pool, size=500)) == list(range(1200))
+    assert all(name.startswith("ahead") for name in threads)
+
+
+def test_aread_ahead_bounds_concurrent_readers():
+    active, peak = 0, 0
+
+    async def items(n):
+        nonlocal active, peak
+        for i in range(n):
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.001)
+            active -= 1
+            yield i
+
+    async def run():
+        limit = asyncio.Semaphore(2)
+        streams = [aread_ahead(items(30), limit, size=10) for _ in range(5)]
+        return [[i async for i in stream] for stream in streams]
+
+    assert asyncio.run(run()) == [list(range(30))] * 5
+    assert peak == 2
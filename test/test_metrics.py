@@ -0,0 +1,89 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.async_session import AsyncCustomSession
+from src.metrics import Histogram, Metrics, endpoint_template
+from src.scheduler import RequestScheduler
+
+DEVICE_ID = "11111111-1111-1111-1111-111111111111"
+
+
+def test_endpoint_template():
+    assert endpoint_template(f"v1/devices/{DEVICE_ID}/status") == "v1/devices/{id}/status"
+    assert endpoint_template(f"v1/devices/{DEVICE_ID.upper()}/commands") == "v1/devices/{id}/commands"
+    assert endpoint_template("v1/history/devices?locationId=x&deviceId=y") == "v1/history/devices"
+    assert endpoint_template("https://api.smartthings.com/v1/locations/") == "v1/locations"
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(0.1, 0.2, 0.4))
+    assert histogram.quantile(0.5) is None
+    for value in [0.05, 0.15, 0.15, 0.3, 1.0]:
+        histogram.observe(value)
+    assert histogram.cumulative() == [1, 3, 4, 5]
+    assert histogram.quantile(0.5) == pytest.approx(0.175)  # rank 2.5 falls 3/4 into the 0.1-0.2 bucket
+    assert histogram.quantile(0.99) == 0.4  # in +Inf: clamped to the largest finite bound
+    assert histogram.summary()["count"] == 5
+    assert histogram.sum == pytest.approx(1.65)
+
+
+def test_snapshot_and_prometheus():
+    metrics = Metrics()
+    metrics.observe_upstream("GET", f"v1/devices/{DEVICE_ID}/status", 200, 0.02, 120)
+    metrics.observe_upstream("GET", f"v1/devices/{DEVICE_ID}/status", 429, 0.01, 0)
+    metrics.observe_retry("GET", f"v1/devices/{DEVICE_ID}/status")
+    metrics.observe_tool("get_device_status", 0.05, 300)
+    metrics.observe_tool("get_device_status", 0.5, 0, error=True)
+    metrics.register("status_cache", lambda: {"hits": 3, "misses": 1, "hit_rate": 0.75, "name": "ignored"})
+    metrics.register("nested", lambda: {"singleflight": {"calls": 2}, "live": True})
+
+    snapshot = metrics.snapshot()
+    status = snapshot["upstream"]["GET v1/devices/{id}/status"]
+    assert (status["count"], status["bytes"], status["retries"]) == (2, 120, 1)
+    assert status["status"] == {"200": 1, "429": 1}
+    assert snapshot["tools"]["get_device_status"]["errors"] == 1
+    assert snapshot["tools"]["get_device_status"]["bytes"] == 300
+    assert snapshot["status_cache"]["hit_rate"] == 0.75
+
+    text = metrics.prometheus()
+    labels = 'method="GET",endpoint="v1/devices/{id}/status"'
+    assert "# TYPE smartthings_upstream_request_duration_seconds histogram" in text
+    assert f'smartthings_upstream_request_duration_seconds_bucket{{{labels},le="0.025"}} 2' in text
+    assert f'smartthings_upstream_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f'smartthings_upstream_request_duration_seconds_count{{{labels}}} 2' in text
+    assert f'smartthings_upstream_requests_total{{{labels},status="429"}} 1' in text
+    assert f'smartthings_upstream_retries_total{{{labels}}} 1' in text
+    assert 'smartthings_tool_errors_total{tool="get_device_status"} 1' in text
+    assert "smartthings_status_cache_hit_rate 0.75" in text
+    assert "smartthings_nested_singleflight_calls 2.0" in text
+    assert "smartthings_nested_live 1.0" in text
+    assert "ignored" not in text
+
+
+def test_async_session_records_every_attempt():
+    statuses = [503, 200]
+
+    def handler(request):
+        return httpx.Response(statuses.pop(0), json={"ok": True})
+
+    metrics = Metrics()
+    session = AsyncCustomSession("token", transport=httpx.MockTransport(handler), metrics=metrics,
+                                 scheduler=RequestScheduler(backoff_base=0.001))
+
+    async def run():
+        try:
+            return await session.get_json(f"v1/devices/{DEVICE_ID}/status")
+        finally:
+            await session.aclose()
+
+    assert asyncio.run(run()) == {"ok": True}
+    status = metrics.snapshot()["upstream"]["GET v1/devices/{id}/status"]
+    assert status["status"] == {"503": 1, "200": 1}
+    assert status["retries"] == 1
+    assert status["bytes"] == 2 * len(b'{"ok":true}')
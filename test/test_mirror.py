@@ -0,0 +1,313 @@
+import asyncio
+import json
+import os
+import sys
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.async_api import AsyncLocation
+from src.mirror import StateMirror, iter_sse
+from test.helpers import LOCATION_ID, device
+
+room1Id = uuid.UUID("00000000-0000-0000-0000-000000000001")
+room2Id = uuid.UUID("00000000-0000-0000-0000-000000000002")
+lampId = uuid.UUID("11111111-1111-1111-1111-111111111111")
+sensorId = uuid.UUID("11111111-1111-1111-1111-111111111112")
+
+
+def _event(device_id, capability, attribute, value, time, unit=None) -> dict:
+    event = {"deviceId": str(device_id), "componentId": "main", "capability": capability,
+             "attribute": attribute, "value": value}
+    if unit is not None:
+        event["unit"] = unit
+    return {"eventType": "DEVICE_EVENT", "eventTime": time, "deviceEvent": event}
+
+
+class StandInServer:
+    """Minimal SmartThings stand-in: location, rooms, devices and an SSE subscription stream.
+
+    Events put on `events` are written to the open stream; None closes it,
+    as a dropped connection would. The first `throttle` subscription requests
+    are answered with 429.
+    """
+
+    def __init__(self, throttle: int = 0):
+        self.switch = "off"
+        self.temperature = 21.5
+        self.requests: list[str] = []
+        self.events: asyncio.Queue = asyncio.Queue()
+        self.streams = 0
+        self.throttle = throttle
+
+    async def __aenter__(self) -> "StandInServer":
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.events.put(None)
+
+    def _devices(self, include_status: bool) -> list[dict]:
+        def status(attribute, value, unit=None):
+            if not include_status:
+                return None
+            state = {"value": value, "timestamp": "2025-01-01T00:00:00.000Z"}
+            if unit is not None:
+                state["unit"] = unit
+            return {attribute: state}
+
+        return [
+            device(lampId, room1Id, {"switch": status("switch", self.switch)}, "Light"),
+            device(sensorId, room2Id, {"temperatureMeasurement": status("temperature", self.temperature, "C"),
+                                        "battery": status("battery", 90, "%")}, "Thermostat"),
+        ]
+
+    def _route(self, method: str, target: str):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        if method == "POST" and url.path == "/subscriptions":
+            return {"registrationUrl": f"{self.url}sse"}
+        if url.path == f"/v1/locations/{LOCATION_ID}":
+            return {"locationId": LOCATION_ID, "timeZoneId": "UTC"}
+        if url.path == f"/v1/locations/{LOCATION_ID}/rooms":
+            return {"items": [{"roomId": str(room1Id), "name": "Room 1"}, {"roomId": str(room2Id), "name": "Room 2"}]}
+        if url.path == "/devices":
+            devices = self._devices(query.get("includeStatus") == ["true"])
+            wanted = set(query.get("capability", []))
+            match = any if query.get("capabilitiesMode") == ["or"] else all
+            return {"items": [d for d in devices
+                              if (not wanted or match(c in {c["id"] for c in d["components"][0]["capabilities"]} for c in wanted))
+                              and query.get("roomId", [d["roomId"]]) == [d["roomId"]]]}
+        if url.path == f"/v1/devices/{lampId}/status":
+            return {"components": {"main": {"switch": {"switch": {"value": self.switch}}}}}
+        raise AssertionError(f"unexpected request {method} {target}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        method, target, _ = (await reader.readline()).decode().split(" ", 2)
+        length = 0
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode().partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        await reader.readexactly(length)
+
+        if target == "/sse":
+            self.streams += 1
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n: hello\n\n")
+            await writer.drain()
+            while (event := await self.events.get()) is not None:
+                writer.write(f"event: DEVICE_EVENT\ndata: {json.dumps(event)}\n\n".encode())
+                await writer.drain()
+        elif method == "POST" and self.throttle > 0:
+            self.throttle -= 1
+            self.requests.append(f"{method} {target}")
+            writer.write(b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 0\r\n"
+                         b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+        else:
+            self.requests.append(f"{method} {target}")
+            body = json.dumps(self._route(method, target)).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+            await writer.drain()
+        writer.close()
+
+
+async def _until(condition, timeout: float = 5.0):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+def test_iter_sse():
+    async def lines():
+        for line in [": comment", "event: DEVICE_EVENT", "id: 1", "data: {\"a\":", "data: 1}", "",
+                     "", "data: plain", ""]:
+            yield line
+
+    async def run():
+        return [pair async for pair in iter_sse(lines())]
+
+    assert asyncio.run(run()) == [("DEVICE_EVENT", "{\"a\":\n1}"), ("message", "plain")]
+
+
+def test_mirror_applies_events_in_time_order():
+    mirror = StateMirror()
+    mirror.replace([{"deviceId": str(lampId), "components": [{"id": "main", "capabilities": [
+        {"id": "switch", "status": {"switch": {"value": "off", "timestamp": "2025-01-01T00:00:10.000Z"}}}]}]}])
+    assert mirror.status(lampId) is None  # not live yet
+
+    mirror.live = True
+
+    def switch():
+        status = mirror.status(lampId)
+        assert status is not None
+        return status["main"]["switch"]
+
+    assert mirror.apply(_event(lampId, "switch", "switch", "on", "2025-01-01T00:00:05.000Z"))
+    assert switch()["switch"].value == "off"
+    mirror.apply(_event(lampId, "switch", "switch", "on", "2025-01-01T00:00:20.000Z"))
+    assert switch()["switch"].value == "on"
+    assert not mirror.apply(_event(sensorId, "battery", "battery", 50, "2025-01-01T00:00:20.000Z"))
+
+    # callers get a copy, not the mirrored state
+    switch().clear()
+    assert switch()["switch"].value == "on"
+    assert mirror.stats() == {"live": True, "devices": 1, "events": 2, "resyncs": 1, "hits": 4, "misses": 1}
+
+
+def test_live_state_serves_status_without_upstream_calls():
+    async def run():
+        async with StandInServer() as server:
+            loc = AsyncLocation("token", location_id=LOCATION_ID, live_state=True, base_url=server.url)
+            mirror = loc.mirror
+            assert mirror is not None
+            await loc.get_rooms()
+            await _until(lambda: mirror.live)
+
+            await server.events.put(_event(lampId, "switch", "switch", "on", "2025-01-01T00:01:00.000Z"))
+            await server.events.put(_event(sensorId, "temperatureMeasurement", "temperature", 23.0,
+                                           "2025-01-01T00:01:00.000Z"))
+            await _until(lambda: mirror.events == 2)
+
+            server.requests.clear()
+            status = await loc.device_status(lampId)
+            devices = await loc.get_devices_short()
+            sensors = await loc.get_devices_short(capability={"temperatureMeasurement", "battery"},
+                                                  capabilities_mode="and")
+            in_room = await loc.get_devices_short(room_id=room1Id, include_status=False)
+            lights = await loc.get_devices_short(category="Light")
+            assert server.requests == []
+
+            await loc.aclose()
+            return status, devices, sensors, in_room, lights
+
+    status, devices, sensors, in_room, lights = asyncio.run(run())
+    assert status["main"]["switch"]["switch"].value == "on"
+    assert [d["deviceId"] for d in devices] == [lampId, sensorId]
+    assert devices[0]["components"][0]["capabilities"] == [{"id": "switch", "status": {"switch": {"value": "on"}}}]
+    assert devices[1]["components"][0]["capabilities"][0] == {
+        "id": "temperatureMeasurement", "status": {"temperature": {"value": 23.0, "unit": "C"}}}
+    assert [d["deviceId"] for d in sensors] == [sensorId]
+    assert [d["deviceId"] for d in in_room] == [lampId]
+    assert in_room[0]["components"][0]["capabilities"] == [{"id": "switch"}]
+    assert [d["deviceId"] for d in lights] == [lampId]
+
+
+def test_live_state_matches_polled_devices():
+    async def run():
+        async with StandInServer() as server:
+            polled = AsyncLocation("token", location_id=LOCATION_ID, base_url=server.url)
+            live = AsyncLocation("token", location_id=LOCATION_ID, live_state=True, base_url=server.url)
+            await live.ready()
+            mirror = live.mirror
+            assert mirror is not None
+            await _until(lambda: mirror.live)
+            results = []
+            for kwargs in [{}, {"capability": {"switch", "battery"}, "capabilities_mode": "or"},
+                           {"room_id": room2Id}, {"include_status": False}]:
+                results.append((await polled.get_devices_short(**kwargs), await live.get_devices_short(**kwargs)))
+            await polled.aclose()
+            await live.aclose()
+            return results
+
+    for expected, mirrored in asyncio.run(run()):
+        assert mirrored == expected
+
+
+@pytest.mark.parametrize("fast_decode", [False, True])
+def test_live_state_resyncs_after_disconnect(fast_decode):
+    async def run():
+        async with StandInServer() as server:
+            loc = AsyncLocation("token", location_id=LOCATION_ID, live_state=True, fast_decode=fast_decode,
+                                base_url=server.url)
+            await loc.ready()
+            mirror, subscription = loc.mirror, loc._subscription
+            assert mirror is not None and subscription is not None
+            subscription.backoff_base = 0.01
+            await _until(lambda: mirror.live)
+            assert (await loc.device_status(lampId))["main"]["switch"]["switch"].value == "off"
+
+            # the lamp changes while the stream is down: the event is lost, the resync picks it up
+            server.switch = "on"
+            await server.events.put(None)
+            await _until(lambda: server.streams == 2 and mirror.live)
+
+            server.requests.clear()
+            status = await loc.device_status(lampId)
+            assert server.requests == []
+            stats = mirror.stats()
+            await loc.aclose()
+            assert not mirror.live
+            return status, stats
+
+    status, stats = asyncio.run(run())
+    assert status["main"]["switch"]["switch"].value == "on"
+    assert stats["resyncs"] == 2
+
+
+def test_subscription_is_registered_through_the_session():
+    async def run():
+        async with StandInServer(throttle=1) as server:
+            loc = AsyncLocation("token", location_id=LOCATION_ID, live_state=True, base_url=server.url)
+            mirror = loc.mirror
+            assert mirror is not None
+            await loc.ready()
+            await _until(lambda: mirror.live)
+            posts = [r for r in server.requests if r.startswith("POST")]
+            throttled, streams = loc.session.scheduler.throttled, server.streams
+            await loc.aclose()
+            return posts, throttled, streams
+
+    posts, throttled, streams = asyncio.run(run())
+    # the 429 is retried by the session, not by reconnecting the stream
+    assert posts == ["POST /subscriptions"] * 2
+    assert (throttled, streams) == (1, 1)
+
+
+def test_device_status_polls_until_live():
+    async def run():
+        async with StandInServer() as server:
+            loc = AsyncLocation("token", location_id=LOCATION_ID, live_state=True, base_url=server.url)
+            await loc.get_rooms()
+            assert loc._subscription is not None
+            await loc._subscription.stop()
+            server.requests.clear()
+            status = await loc.device_status(lampId)
+            requests = list(server.requests)
+            await loc.aclose()
+            return status, requests
+
+    status, requests = asyncio.run(run())
+    assert status["main"]["switch"]["switch"].value == "off"
+    assert requests == [f"GET /v1/devices/{lampId}/status"]
+
+
+@pytest.mark.parametrize("live_state", [False, True])
+def test_status_snapshot(live_state):
+    async def run():
+        async with StandInServer() as server:
+            loc = AsyncLocation("token", location_id=LOCATION_ID, live_state=live_state, base_url=server.url)
+            await loc.ready()
+            mirror = loc.mirror
+            if mirror is not None:
+                await _until(lambda: mirror.live)
+            await loc.get_rooms()
+            server.requests.clear()
+            snapshot = await loc.status_snapshot(room_id=room2Id, attributes={"temperature", "switch"})
+            requests = list(server.requests)
+            await loc.aclose()
+            return snapshot, requests
+
+    snapshot, requests = asyncio.run(run())
+    assert snapshot == [{"deviceId": sensorId, "label": f"Device {sensorId}", "roomId": room2Id,
+                         "status": {"temperatureMeasurement.temperature": [21.5, "C"]}}]
+    if live_state:
+        assert requests == []
+    else:
+        assert requests == [f"GET /devices?locationId={LOCATION_ID}&roomId={room2Id}&includeStatus=true"]
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "bench")))
+
+from mock_smartthings import LOCATION_ID, MockSmartThings
+from src.async_api import AsyncLocation
+from src.scheduler import RequestScheduler
+
+
+def test_mock_pages_history_like_the_api():
+    with MockSmartThings(devices=10, rooms=2, history_events=20_000, history_days=10) as mock:
+        device_id = uuid.UUID(mock.devices[1]["deviceId"])
+        end_ms = mock.now_ms - 3_600_000
+        start_ms = end_ms - 86_400_000
+
+        async def run():
+            loc = AsyncLocation("token", location_id=LOCATION_ID, base_url=mock.url)
+            newest = await loc.event_history(device_id, limit=100, all_pages=True,
+                                             paging_after_epoch=start_ms, paging_before_epoch=end_ms)
+            oldest = await loc.event_history(device_id, limit=100, all_pages=True, oldest_first=True,
+                                             paging_after_epoch=start_ms, paging_before_epoch=end_ms)
+            devices = await loc.get_devices_short(room_id=uuid.UUID(mock.devices[0]["roomId"]))
+            await loc.aclose()
+            return newest, oldest, devices
+
+        newest, oldest, devices = asyncio.run(run())
+
+    # one event every 10 days / 20k for the location, every tenth of them for this device
+    expected = 86_400_000 // (mock.step_ms * 10)
+    assert abs(len(newest) - expected) <= 1
+    assert oldest == newest[::-1]
+    assert {e["deviceId"] for e in newest} == {device_id}
+    epochs = [e["time"].timestamp() * 1000 for e in newest]
+    assert all(a > b for a, b in zip(epochs, epochs[1:]))
+    assert start_ms < min(epochs) and max(epochs) < end_ms
+    assert len(devices) == 5 and all(d["components"][0]["capabilities"][0].get("status") for d in devices)
+
+
+def test_mock_injected_errors_are_retried():
+    with MockSmartThings(devices=3, error_rate=0.5, seed=3) as mock:
+        async def run():
+            loc = AsyncLocation("token", location_id=LOCATION_ID, base_url=mock.url,
+                                scheduler=RequestScheduler(max_retries=10, backoff_base=0.001))
+            status = [await loc.device_status(uuid.UUID(d["deviceId"])) for d in mock.devices]
+            await loc.aclose()
+            return status
+
+        status = asyncio.run(run())
+    assert mock.errors > 0
+    assert [s["main"]["switch"]["switch"].value for s in status if "switch" in s["main"]] == ["off", "on"]
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.async_session import AsyncCustomSession
+from src.custom_session import CustomSession
+from src.scheduler import RequestScheduler, TokenBucket, endpoint_family, parse_retry_after
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_endpoint_family():
+    assert endpoint_family("v1/history/devices?locationId=x") == "history"
+    assert endpoint_family("v1/devices/abc/commands") == "commands"
+    assert endpoint_family("v1/devices/abc/status") == "devices"
+    assert endpoint_family("devices?locationId=x&includeStatus=true") == "devices"
+    assert endpoint_family("v1/locations") == "other"
+
+
+def test_parse_retry_after():
+    now = datetime(2025, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 01 Jan 2025 12:00:05 GMT", now=lambda: now) == 5.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_token_bucket_paces_after_burst():
+    clock = Clock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    clock.now = 10
+    assert bucket.reserve() == 0.0
+    bucket.block(3)
+    assert bucket.reserve() == 3.0
+
+
+def test_retry_decisions():
+    scheduler = RequestScheduler(max_retries=2, rng=random.Random(0))
+    assert scheduler.retry_delay("GET", "v1/devices/x/status", 0, 429, "2") == 2.0
+    assert scheduler.buckets["devices"].reserve() == pytest.approx(2.0, abs=0.01)
+    assert scheduler.retry_delay("POST", "v1/devices/x/commands", 0, 429, "1") == 1.0
+    assert scheduler.retry_delay("POST", "v1/devices/x/commands", 0, 503) is None
+    assert scheduler.retry_delay("GET", "v1/history/devices", 0, 404) is None
+    assert 0 <= scheduler.retry_delay("GET", "v1/history/devices", 1, 502) <= 1.0  # type: ignore
+    assert scheduler.retry_delay("GET", "v1/history/devices", 2, 502) is None
+    assert (scheduler.retries, scheduler.throttled) == (3, 2)
+
+
+class ScriptedAdapter(BaseAdapter):
+    def __init__(self, statuses):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        self.calls += 1
+        res = requests.Response()
+        res.status_code = self.statuses.pop(0)
+        res.headers["Retry-After"] = "0"
+        res._content = b'{"ok": true}'
+        res.request = request
+        res.url = str(request.url)
+        return res
+
+    def close(self):
+        pass
+
+
+def _sync_session(statuses):
+    session = CustomSession("token", scheduler=RequestScheduler(backoff_base=0.001))
+    adapter = ScriptedAdapter(statuses)
+    session.mount("https://", adapter)
+    return session, adapter
+
+
+def test_sync_session_retries_get():
+    session, adapter = _sync_session([429, 503, 200])
+    assert session.get_json("v1/devices/x/status") == {"ok": True}
+    assert adapter.calls == 3
+
+
+def test_sync_session_does_not_retry_failed_post():
+    session, adapter = _sync_session([500])
+    with pytest.raises(requests.HTTPError):
+        session.post_json("v1/devices/x/commands", json={})
+    assert adapter.calls == 1
+
+
+def test_async_session_retries_then_gives_up():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(502)
+
+    session = AsyncCustomSession("token", transport=httpx.MockTransport(handler),
+                                 scheduler=RequestScheduler(max_retries=2, backoff_base=0.001))
+
+    async def run():
+        try:
+            with pytest.raises(httpx.HTTPStatusError):
+                await session.get_json("v1/history/devices")
+        finally:
+            await session.aclose()
+
+    asyncio.run(run())
+    assert len(calls) == 3
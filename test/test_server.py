@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "bench")))
+
+from mock_smartthings import MockSmartThings
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+def test_import_makes_no_requests_and_defers_heavy_modules():
+    code = ("import sys, server; "
+            "print(sorted(m for m in ('numpy', 'requests', 'pytz') if m in sys.modules)); "
+            "print(server.location._ready)")
+    env = {**os.environ, "TOKEN": "token", "HISTORY_DB": "", "WARM_START": ""}
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["[]", "False"]
+
+
+
+def test_counters_are_published_as_one_metrics_resource():
+    code = ("import asyncio, server; "
+            "print(*sorted(str(r.uri) for r in asyncio.run(server.mcp.list_resources()))); "
+            "print(*sorted(server.metrics.snapshot()))")
+    env = {**os.environ, "TOKEN": "token", "HISTORY_DB": "", "WARM_START": "", "LIVE_STATE": "1"}
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    resources, sections = result.stdout.splitlines()[-2:]
+    assert resources.split() == ["smartthings://metrics"]
+    assert sections.split() == ["mirror", "scheduler", "singleflight", "status_cache", "tools", "upstream"]
+
+def test_unknown_transport_fails_before_running():
+    env = {**os.environ, "TOKEN": "token", "HISTORY_DB": "", "WARM_START": "", "MCP_TRANSPORT": "http"}
+    result = subprocess.run([sys.executable, "server.py"], cwd=SRC, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode != 0
+    assert "MCP_TRANSPORT must be one of stdio, sse, streamable-http, got 'http'" in result.stderr
+
+HISTORY_TOOL = """
+import asyncio, json, sys
+from mcp.shared.memory import create_connected_server_and_client_session
+import server
+
+
+async def main():
+    logs, progress = [], []
+
+    async def on_log(params):
+        logs.append({"level": params.level, "logger": params.logger, "data": params.data})
+
+    async def on_progress(value, total, message):
+        progress.append([value, total, message])
+
+    async with create_connected_server_and_client_session(server.mcp._mcp_server, logging_callback=on_log) as client:
+        result = await client.call_tool("get_device_history", {
+            "room_id": sys.argv[1], "attribute": "temperature", "delta_start": "P2D", "granularity": "daily",
+            "aggregate": "count", "partial_results": True}, progress_callback=on_progress)
+    await server.location.aclose()
+    points = [json.loads(content.text) for content in result.content]
+    print(json.dumps({"error": result.isError, "logs": logs, "progress": progress, "result": points}))
+
+asyncio.run(main())
+"""
+
+
+def test_get_device_history_sends_progress_and_partial_results():
+    with MockSmartThings(devices=24, rooms=2, history_events=3000, history_days=1) as mock:
+        room_id = next(iter(mock.rooms))
+        in_room = [d for d in mock.devices if d["roomId"] == str(room_id)]
+        # only the thermostats report temperature
+        thermostats = sum(d["name"] == "Thermostat" for d in in_room)
+        assert 1 < thermostats < len(in_room)
+        env = {**os.environ, "TOKEN": "token", "SMARTTHINGS_API_URL": mock.url, "HISTORY_DB": "",
+               "WARM_START": ""}
+        result = subprocess.run([sys.executable, "-c", HISTORY_TOOL, str(room_id)], cwd=SRC, env=env,
+                                capture_output=True, text=True, timeout=60)
+
+    assert result.returncode == 0, result.stderr
+    out = json.loads(result.stdout.splitlines()[-1])
+    logs, progress = out["logs"], out["progress"]
+    assert not out["error"]
+    # one partial result per device with events, except the last: that one is the tool result
+    assert len(logs) == thermostats - 1
+    assert all(log["logger"] == "get_device_history" and log["level"] == "info" and log["data"]["partial"]
+               for log in logs)
+    counts = [sum(p["value"] for p in log["data"]["points"]) for log in logs]
+    assert counts == sorted(counts)
+    assert 0 < counts[-1] < sum(p["value"] for p in out["result"])
+    assert [value for value, _, _ in progress] == sorted(value for value, _, _ in progress)
+    assert progress[-1][2].startswith(f"{len(in_room)}/{len(in_room)} devices")
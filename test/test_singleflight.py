@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.async_session import AsyncCustomSession
+from src.singleflight import AsyncSingleFlight, SingleFlight, request_key
+
+
+def test_request_key_includes_params():
+    assert request_key("devices", {"params": {"a": 1}}) == request_key("devices", {"params": {"a": 1}})
+    assert request_key("devices", {}) != request_key("devices", {"params": {"a": 1}})
+
+
+def test_threads_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait()
+        return {"items": []}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", fetch))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    while flight.calls + flight.collapsed < 5:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert flight.stats() == {"calls": 1, "collapsed": 4, "in_flight": 0}
+
+
+def test_errors_are_shared_and_not_cached():
+    flight = AsyncSingleFlight()
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def run():
+        results = await asyncio.gather(*(flight.do("k", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        with pytest.raises(RuntimeError):
+            await flight.do("k", failing)
+
+    asyncio.run(run())
+    assert len(attempts) == 2
+
+
+def test_async_session_coalesces_identical_gets():
+    calls = []
+
+    async def handler(request):
+        calls.append(str(request.url))
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json={"path": request.url.path})
+
+    session = AsyncCustomSession("token", transport=httpx.MockTransport(handler))
+
+    async def run():
+        same = [session.get_json("v1/devices/a/status") for _ in range(4)]
+        other = session.get_json("v1/devices/b/status")
+        results = await asyncio.gather(*same, other)
+        await session.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert len(calls) == 2
+    assert results[0] == {"path": "/v1/devices/a/status"}
+    assert session.singleflight.collapsed == 3
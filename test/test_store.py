@@ -0,0 +1,165 @@
+import asyncio
+import datetime
+import os
+import sys
+import time
+import uuid
+
+import httpx
+import pytz
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.api import Location
+from src.async_api import AsyncLocation
+from src.st.history import EventHistoryItem
+from src.store import EventStore
+from test.helpers import LOCATION_ID, device, history_item
+
+dev1Id = uuid.UUID("11111111-1111-1111-1111-111111111111")
+HOUR = 3_600_000
+
+
+class FakeHistoryApi:
+    """Serves events newer than pagingAfterEpoch and older than pagingBeforeEpoch."""
+    base_url = "https://api.smartthings.com/"
+
+    def __init__(self, events):
+        self.events = events
+        self.urls = []
+
+    def get_json(self, url):
+        self.urls.append(url)
+        params = dict(p.split("=", 1) for p in url.split("?", 1)[1].split("&"))
+        after = int(params.get("pagingAfterEpoch", 0))
+        before = int(params.get("pagingBeforeEpoch", 2 ** 62))
+        items = [e for e in self.events if after < e["epoch"] < before]
+        return {"items": sorted(items, key=lambda e: -e["epoch"])}
+
+
+def _make_location(api):
+    loc = object.__new__(Location)
+    loc.location_id = "loc1"
+    loc.device_ids = frozenset({dev1Id})
+    loc.timezone = pytz.UTC
+    loc.session = api
+    loc.store = EventStore()
+    return loc
+
+
+def test_gaps():
+    store = EventStore()
+    assert store.gaps(dev1Id, 10, 20) == [(10, None, 20)]
+
+    store.add(dev1Id, [EventHistoryItem.model_validate(history_item(15, 1))])
+    store.mark_synced(dev1Id, 10, 20)
+
+    assert store.gaps(dev1Id, 12, 18) == []
+    assert store.gaps(dev1Id, 5, 25) == [(5, None, 10), (15, 15, 25)]
+
+
+def test_add_is_idempotent():
+    store = EventStore()
+    item = EventHistoryItem.model_validate(history_item(HOUR, 21.5))
+    store.add(dev1Id, [item])
+    store.add(dev1Id, [item])
+
+    events = store.events(dev1Id, attribute="temperature")
+    assert len(events) == 1
+    assert events[0]["value"] == 21.5
+    assert events[0]["time"] == item.time
+    assert events[0]["deviceId"] == dev1Id
+
+
+def test_stored_history_fetches_only_the_gap():
+    api = FakeHistoryApi([history_item(10 * HOUR + i, i) for i in range(5)])
+    loc = _make_location(api)
+    store = loc.store
+    assert store is not None
+
+    first = loc._stored_history(store, dev1Id, "temperature", 9 * HOUR, 11 * HOUR)
+    assert [e["value"] for e in first] == [4, 3, 2, 1, 0]
+    assert len(api.urls) == 1
+
+    api.events.append(history_item(11 * HOUR + 5, 5))
+    second = loc._stored_history(store, dev1Id, "temperature", 9 * HOUR, 12 * HOUR)
+
+    assert [e["value"] for e in second] == [5, 4, 3, 2, 1, 0]
+    assert len(api.urls) == 2
+    assert f"pagingAfterEpoch={10 * HOUR + 4}&pagingAfterHash={10 * HOUR + 4}" in api.urls[1]
+
+    assert loc._stored_history(store, dev1Id, "temperature", 9 * HOUR, 12 * HOUR) == second
+    assert len(api.urls) == 2
+
+
+def test_history_from_store_matches_api():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    base = int(now.timestamp() * 1000) - 3 * HOUR
+    api = FakeHistoryApi([history_item(base + i * 600_000, 20 + i % 3) for i in range(12)]
+                         + [history_item(base + 1, 50, attribute="humidity")])
+    loc = _make_location(api)
+
+    from_store = loc.history(delta_start="PT6H", device_id=dev1Id, attribute="temperature", aggregate="avg")
+    loc.store = None
+    from_api = loc.history(delta_start="PT6H", device_id=dev1Id, attribute="temperature", aggregate="avg")
+
+    assert from_store == from_api
+
+
+class SlowStore(EventStore):
+    """EventStore whose every call blocks its thread for `delay` seconds, like a large database."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def gaps(self, *args, **kwargs):
+        time.sleep(self.delay)
+        return super().gaps(*args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        time.sleep(self.delay)
+        return super().add(*args, **kwargs)
+
+    def iter_events(self, *args, **kwargs):
+        time.sleep(self.delay)
+        yield from super().iter_events(*args, **kwargs)
+
+
+def test_async_store_sync_does_not_block_other_calls():
+    room_id = uuid.UUID(int=1)
+    events = [history_item(10 * HOUR + i, i) for i in range(1200)]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == f"/v1/locations/{LOCATION_ID}":
+            return httpx.Response(200, json={"locationId": LOCATION_ID, "timeZoneId": "UTC"})
+        if path == f"/v1/locations/{LOCATION_ID}/rooms":
+            return httpx.Response(200, json={"items": [{"roomId": str(room_id), "name": "Room"}]})
+        if path == "/devices":
+            return httpx.Response(200, json={"items": [device(dev1Id, room_id)]})
+        if path == f"/v1/devices/{dev1Id}/status":
+            await asyncio.sleep(0.02)
+            return httpx.Response(200, json={"components": {"main": {"switch": {"switch": {"value": "on"}}}}})
+        if path == "/v1/history/devices":
+            return httpx.Response(200, json={"items": events})
+        raise AssertionError(f"unexpected request {request.url}")
+
+    loc = AsyncLocation("token", location_id=LOCATION_ID, store=SlowStore(delay=0.2),
+                        transport=httpx.MockTransport(handler))
+
+    async def run():
+        await loc.get_device_ids()
+        sync = asyncio.ensure_future(loc.room_history(room_id, "temperature", 9 * HOUR, 11 * HOUR))
+        statuses = 0
+        while not sync.done():
+            await loc.device_status(dev1Id)
+            statuses += 1
+        merged = await sync
+        await loc.aclose()
+        return merged, statuses
+
+    merged, statuses = asyncio.run(run())
+    assert len(merged) == 1200
+    # gaps, three adds and the stored read block for 1s in total; status reads of 20ms each kept going meanwhile
+    assert statuses >= 20
@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from src.api import DeviceResponse
+from src.warm_start import FORMAT_VERSION, WarmStartCache, account_key
+
+LOCATION = {"locationId": "loc1", "timeZoneId": "Europe/Berlin"}
+ROOMS = {uuid.UUID("00000000-0000-0000-0000-000000000001"): "Room 1"}
+
+
+def _fixture_devices():
+    with open(os.path.join(os.path.dirname(__file__), "fixtures", "devices.json"), encoding="utf-8") as f:
+        return DeviceResponse.model_validate(json.load(f)).items
+
+
+def test_round_trip(tmp_path):
+    devices = _fixture_devices()
+    cache = WarmStartCache(str(tmp_path / "cache" / "warm_start.json"), key="k")
+    assert cache.load() is None
+    cache.save("loc1", LOCATION, ROOMS, devices)
+
+    loaded = cache.load()
+    assert loaded is not None
+    assert (loaded.location_id, loaded.location, loaded.rooms) == ("loc1", LOCATION, ROOMS)
+    assert loaded.devices == devices
+    assert 0 <= loaded.age < 5
+    assert cache.load(location_id="loc1") is not None
+    assert os.listdir(tmp_path / "cache") == ["warm_start.json"]
+
+
+def test_mismatched_or_unreadable_snapshots_are_ignored(tmp_path):
+    path = str(tmp_path / "warm_start.json")
+    WarmStartCache(path, key=account_key("token", "https://api.smartthings.com/")).save(
+        "loc1", LOCATION, ROOMS, _fixture_devices())
+
+    assert WarmStartCache(path, key=account_key("other", "https://api.smartthings.com/")).load() is None
+    assert WarmStartCache(path, key=account_key("token", "http://127.0.0.1:8080/")).load() is None
+    cache = WarmStartCache(path, key=account_key("token", "https://api.smartthings.com/"))
+    assert cache.load(location_id="loc2") is None
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    data["version"] = FORMAT_VERSION + 1
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    assert cache.load() is None
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"version": 1, "key": "tru')
+    assert cache.load() is None